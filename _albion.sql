@@ -18,7 +18,7 @@ $$
 $$
 ;
 
-create type interpolation_method as enum ('balanced_tangential');
+create type interpolation_method as enum ('balanced_tangential', 'minimum_curvature');
 
 create table _albion.graph(
     id varchar primary key default _albion.unique_id()::varchar,
@@ -37,10 +37,11 @@ create table _albion.metadata(
     parent_correlation_angle real default 1.0,
     end_node_relative_distance real default .3,
     end_node_relative_thickness real default .3,
+    volume_cache_size bigint default 268435456,
     version varchar)
 ;
 
-insert into _albion.metadata(srid, version) select $SRID, '2.0'
+insert into _albion.metadata(srid, version) select $SRID, '2.1'
 ;
 
 create table _albion.layer(
@@ -175,6 +176,30 @@ create index volume_graph_id_idx on _albion.volume(graph_id)
 create index volume_cell_id_idx on _albion.volume(cell_id)
 ;
 
+-- cells whose volume must be recomputed after a graph edit
+create table _albion.stale_volume(
+    graph_id varchar not null references _albion.graph(id) on delete cascade on update cascade,
+    cell_id varchar not null references _albion.cell(id) on delete cascade on update cascade,
+    primary key (graph_id, cell_id)
+)
+;
+
+-- elementary volumes memoized by a hash of albion.elementary_volumes inputs,
+-- the least recently used entries are evicted above metadata.volume_cache_size bytes
+create table _albion.volume_cache(
+    hash varchar primary key,
+    geom geometry[] not null,
+    face1 geometry[] not null,
+    face2 geometry[] not null,
+    face3 geometry[] not null,
+    size_ integer not null,
+    last_access timestamp not null default now()
+)
+;
+
+create index volume_cache_last_access_idx on _albion.volume_cache(last_access)
+;
+
 create table _albion.group_cell(
     group_id integer not null references _albion.group(id) on delete cascade on update cascade,
     cell_id varchar not null references _albion.cell(id) on delete cascade on update cascade,
@@ -0,0 +1,32 @@
+-- cells whose volume must be recomputed after a graph edit
+create table _albion.stale_volume(
+    graph_id varchar not null references _albion.graph(id) on delete cascade on update cascade,
+    cell_id varchar not null references _albion.cell(id) on delete cascade on update cascade,
+    primary key (graph_id, cell_id)
+)
+;
+
+alter table _albion.metadata add column volume_cache_size bigint default 268435456
+;
+
+-- elementary volumes memoized by a hash of albion.elementary_volumes inputs,
+-- the least recently used entries are evicted above metadata.volume_cache_size bytes
+create table _albion.volume_cache(
+    hash varchar primary key,
+    geom geometry[] not null,
+    face1 geometry[] not null,
+    face2 geometry[] not null,
+    face3 geometry[] not null,
+    size_ integer not null,
+    last_access timestamp not null default now()
+)
+;
+
+create index volume_cache_last_access_idx on _albion.volume_cache(last_access)
+;
+
+alter type interpolation_method add value if not exists 'minimum_curvature'
+;
+
+update _albion.metadata set version='2.1'
+;
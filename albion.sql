@@ -9,6 +9,46 @@ create schema albion
 -- UTILITY FUNCTIONS
 -------------------------------------------------------------------------------
 
+-- sources of the python modules of the plpython functions (runtime.py and
+-- its dependencies), inserted by Project.create and Project.update
+create table albion.runtime_module(
+    name varchar primary key,
+    rank integer not null,
+    source text not null)
+;
+
+-- version of the python code of the plpython functions
+create or replace function albion.runtime_version()
+returns varchar
+language sql stable
+as
+$$
+    select md5(string_agg(name||' '||md5(source), ' ' order by rank)) from albion.runtime_module
+$$
+;
+
+-- loads the python modules once per session, in rank order, and keeps the
+-- albion_runtime module in GD; the plpython functions keep it in their SD
+create or replace function albion.load_runtime()
+returns void
+language plpython3u volatile
+as
+$$
+    import sys
+    import types
+    rows = plpy.execute("select name, md5(source) as hash, source from albion.runtime_module order by rank")
+    key = ' '.join(r['hash'] for r in rows)
+    if GD.get('albion_key') != key:
+        for r in rows:
+            module = types.ModuleType(r['name'])
+            module.plpy = plpy
+            sys.modules[r['name']] = module
+            exec(compile(r['source'], r['name'], 'exec'), module.__dict__)
+        GD['albion'] = sys.modules['albion_runtime']
+        GD['albion_key'] = key
+$$
+;
+
 create or replace function albion.triangle_aspect_ratio(geom geometry)
 returns float
 language plpgsql
@@ -38,77 +78,221 @@ $$
     declare
         depth_max_ real;
         hole_geom_ geometry;
-        x_ double precision;
-        y_ double precision;
-        z_ double precision;
-        collar_geom_ geometry;
-        path_ varchar;
     begin
+        select depth_ from _albion.hole where id=hole_id_ into depth_max_;
+        select geom from albion.hole_geoms(array[hole_id_]) into hole_geom_;
 
-        select x, y, z, depth_ from _albion.hole where id=hole_id_ into x_, y_, z_, depth_max_;
-        collar_geom_ := st_setsrid(st_makepoint(x_, y_, z_), $SRID);
-        with dz as (
-            select
-                from_ as md2, coalesce(lag(from_) over w, 0) as md1,
-                (dip + 90)*pi()/180 as wd2,  coalesce(lag((dip+90)*pi()/180) over w, 0) as wd1,
-                azimuth*pi()/180 as haz2,  coalesce(lag(azimuth*pi()/180) over w, 0) as haz1
-            from _albion.deviation
-            where azimuth >= 0 and azimuth <=360 and dip < 0 and dip > -180
-            and hole_id=hole_id_
-            window w AS (order by from_)
-        ),
-        pt as (
-            select md2, wd2, haz2,
-            x_ + sum(0.5 * (md2 - md1) * (sin(wd1) * sin(haz1) + sin(wd2) * sin(haz2))) over w as x,
-            y_ + sum(0.5 * (md2 - md1) * (sin(wd1) * cos(haz1) + sin(wd2) * cos(haz2))) over w as y,
-            z_ - sum(0.5 * (md2 - md1) * (cos(wd2) + cos(wd1))) over w as z
-            from dz
-            window w AS (order by md1)
-        ),
-        line as (
-            select st_makeline(('SRID=$SRID; POINTZ('||x||' '||y||' '||z||')')::geometry order by md2 asc) as geom
-            from pt
-        )
-        select ST_RemoveRepeatedPoints(st_addpoint(geom, collar_geom_, 0), 1.e-6)
-            from line as l
-        into hole_geom_;
-
-        if hole_geom_ is not null and st_3dlength(hole_geom_) < depth_max_ and st_3dlength(hole_geom_) > 0 then
-            path_ := 'too short';
-            -- holes is not long enough
-            with last_segment as (
-                select st_pointn(hole_geom_, st_numpoints(hole_geom_)-1) as start_, st_endpoint(hole_geom_) as end_
-            ),
-            direction as (
-                select
-                (st_x(end_) - st_x(start_))/st_3ddistance(end_, start_) as x,
-                (st_y(end_) - st_y(start_))/st_3ddistance(end_, start_) as y,
-                (st_z(end_) - st_z(start_))/st_3ddistance(end_, start_) as z
-                from last_segment
-            )
-            select st_addpoint(hole_geom_,
-                        st_makepoint(
-                            st_x(s.end_) + (depth_max_-st_3dlength(hole_geom_))*d.x,
-                            st_y(s.end_) + (depth_max_-st_3dlength(hole_geom_))*d.y,
-                            st_z(s.end_) + (depth_max_-st_3dlength(hole_geom_))*d.z
-                        ))
-            from direction as d, last_segment as s
-            into hole_geom_;
+        if abs(st_3dlength(hole_geom_) - depth_max_) > 1e-3 then
+            raise 'hole %s %s %s',  hole_id_, depth_max_, st_3dlength(hole_geom_);
+        end if;
+        return hole_geom_;
+    end;
+$$
+;
 
+-- desurvey of all holes (or of hole_ids_ if specified) in one pass over the deviations,
+-- with the balanced tangential method or, if set in metadata, the minimum curvature
+-- method (same increments scaled by the ratio factor of the dogleg angle)
+create or replace function albion.hole_geoms(hole_ids_ varchar[] default null)
+returns table(id varchar, geom geometry)
+language sql stable
+as
+$$
+    with dz as (
+        select
+            hole_id,
+            from_ as md2, coalesce(lag(from_) over w, 0) as md1,
+            (dip + 90)*pi()/180 as wd2,  coalesce(lag((dip+90)*pi()/180) over w, 0) as wd1,
+            azimuth*pi()/180 as haz2,  coalesce(lag(azimuth*pi()/180) over w, 0) as haz1
+        from _albion.deviation
+        where azimuth >= 0 and azimuth <=360 and dip < 0 and dip > -180
+        and (hole_ids_ is null or hole_id = any(hole_ids_))
+        window w AS (partition by hole_id order by from_)
+    ),
+    rf as (
+        select dz.*,
+            case when m.interpolation::text = 'minimum_curvature' and dogleg > 1e-9
+            then 2/dogleg*tan(dogleg/2)
+            else 1
+            end as rf
+        from dz
+        cross join lateral (select acos(greatest(-1, least(1,
+            cos(wd2 - wd1) - sin(wd1)*sin(wd2)*(1 - cos(haz2 - haz1))))) as dogleg) as d
+        cross join _albion.metadata as m
+    ),
+    pt as (
+        select rf.hole_id, md2,
+        h.x + sum(0.5 * (md2 - md1) * rf * (sin(wd1) * sin(haz1) + sin(wd2) * sin(haz2))) over w as x,
+        h.y + sum(0.5 * (md2 - md1) * rf * (sin(wd1) * cos(haz1) + sin(wd2) * cos(haz2))) over w as y,
+        h.z - sum(0.5 * (md2 - md1) * rf * (cos(wd2) + cos(wd1))) over w as z
+        from rf join _albion.hole as h on h.id=rf.hole_id
+        window w AS (partition by rf.hole_id order by md1)
+    ),
+    line as (
+        select hole_id, st_makeline(st_setsrid(st_makepoint(x, y, z), $SRID) order by md2 asc) as geom
+        from pt
+        group by hole_id
+    ),
+    collar_line as (
+        select h.id, h.depth_ as depth_max, c.geom as collar,
+            ST_RemoveRepeatedPoints(st_addpoint(l.geom, c.geom, 0), 1.e-6) as geom
+        from _albion.hole as h
+        cross join lateral (select st_setsrid(st_makepoint(h.x, h.y, h.z), $SRID) as geom) as c
+        left join line as l on l.hole_id=h.id
+        where hole_ids_ is null or h.id = any(hole_ids_)
+    ),
+    measured as (
+        select id, depth_max, collar, geom, st_3dlength(geom) as length_,
+            st_pointn(geom, st_numpoints(geom)-1) as start_, st_endpoint(geom) as end_
+        from collar_line
+    )
+    select id,
+        case
+        when geom is not null and length_ < depth_max and length_ > 0 then
+            -- holes is not long enough, the last segment is extended
+            st_addpoint(geom,
+                st_makepoint(
+                    st_x(end_) + (depth_max-length_)*(st_x(end_) - st_x(start_))/st_3ddistance(end_, start_),
+                    st_y(end_) + (depth_max-length_)*(st_y(end_) - st_y(start_))/st_3ddistance(end_, start_),
+                    st_z(end_) + (depth_max-length_)*(st_z(end_) - st_z(start_))/st_3ddistance(end_, start_)
+                ))
+        when geom is null or length_ = 0 then
             -- hole have no deviation
-        elsif hole_geom_ is null or st_3dlength(hole_geom_) = 0 then
-            path_ := 'no length';
-            select st_makeline( collar_geom_, st_translate(collar_geom_, 0, 0, -depth_max_)) into hole_geom_;
+            st_makeline(collar, st_translate(collar, 0, 0, -depth_max))
+        else geom
+        end
+    from measured
+$$
+;
+
+create or replace function albion.update_hole_geoms(hole_ids_ varchar[] default null)
+returns void
+language plpgsql volatile
+as
+$$
+    declare
+        hole_ record;
+    begin
+        update _albion.hole as h set geom = g.geom
+        from albion.hole_geoms(hole_ids_) as g
+        where g.id = h.id;
+
+        select id, depth_, st_3dlength(geom) as length_ from _albion.hole
+        where (hole_ids_ is null or id = any(hole_ids_))
+        and abs(st_3dlength(geom) - depth_) > 1e-3
+        limit 1
+        into hole_;
+
+        if found then
+            raise 'hole %s %s %s',  hole_.id, hole_.depth_, hole_.length_;
         end if;
+    end;
+$$
+;
 
-        if abs(st_3dlength(hole_geom_) - depth_max_) > 1e-3 then
-            raise 'hole %s %s %s %',  hole_id_, depth_max_, st_3dlength(hole_geom_), path_;
+-- nodes and section caches of holes whose geometry changed
+create or replace function albion.hole_geom_changed(hole_ids_ varchar[])
+returns void
+language plpgsql volatile
+as
+$$
+    declare
+        layer_ varchar;
+    begin
+        update _albion.node as n set geom = st_makeline(
+                st_3dlineinterpolatepoint(h.geom, least(n.from_/h.length_, 1)),
+                st_3dlineinterpolatepoint(h.geom, least(n.to_/h.length_, 1)))
+        from (select id, geom, st_3dlength(geom) as length_ from _albion.hole where id = any(hole_ids_)) as h
+        where n.hole_id = h.id
+        and n.from_ is not null and n.to_ is not null;
+
+        for layer_ in select name from _albion.layer loop
+            execute format('select albion.%I(null, null, $1)', layer_||'_section_geom_cache_refresh')
+            using hole_ids_;
+        end loop;
+    end;
+$$
+;
+
+create or replace function albion.hole_geom_fct()
+returns trigger
+language plpgsql
+as
+$$
+    declare
+        hole_ids_ varchar[];
+    begin
+        if tg_table_name = 'hole' and tg_op = 'INSERT' then
+            hole_ids_ := array(select id from new_table);
+        elsif tg_table_name = 'hole' then
+            -- the geom update below fires this trigger again with nothing changed
+            hole_ids_ := array(
+                select n.id from new_table as n
+                where not exists (
+                    select 1 from old_table as o
+                    where o.id=n.id and o.x=n.x and o.y=n.y and o.z=n.z and o.depth_=n.depth_));
+        elsif tg_op = 'INSERT' then
+            hole_ids_ := array(select distinct hole_id from new_table);
+        elsif tg_op = 'UPDATE' then
+            hole_ids_ := array(select hole_id from new_table union select hole_id from old_table);
+        else
+            hole_ids_ := array(select distinct hole_id from old_table);
         end if;
-        return hole_geom_;
+
+        if cardinality(hole_ids_) > 0 then
+            perform albion.update_hole_geoms(hole_ids_);
+            perform albion.hole_geom_changed(hole_ids_);
+        end if;
+        return null;
     end;
 $$
 ;
 
+drop trigger if exists hole_geom_insert_trig on _albion.hole
+;
+
+create trigger hole_geom_insert_trig
+    after insert on _albion.hole
+    referencing new table as new_table
+       for each statement execute procedure albion.hole_geom_fct()
+;
+
+drop trigger if exists hole_geom_update_trig on _albion.hole
+;
+
+create trigger hole_geom_update_trig
+    after update on _albion.hole
+    referencing old table as old_table new table as new_table
+       for each statement execute procedure albion.hole_geom_fct()
+;
+
+drop trigger if exists deviation_hole_geom_insert_trig on _albion.deviation
+;
+
+create trigger deviation_hole_geom_insert_trig
+    after insert on _albion.deviation
+    referencing new table as new_table
+       for each statement execute procedure albion.hole_geom_fct()
+;
+
+drop trigger if exists deviation_hole_geom_update_trig on _albion.deviation
+;
+
+create trigger deviation_hole_geom_update_trig
+    after update on _albion.deviation
+    referencing old table as old_table new table as new_table
+       for each statement execute procedure albion.hole_geom_fct()
+;
+
+drop trigger if exists deviation_hole_geom_delete_trig on _albion.deviation
+;
+
+create trigger deviation_hole_geom_delete_trig
+    after delete on _albion.deviation
+    referencing old table as old_table
+       for each statement execute procedure albion.hole_geom_fct()
+;
+
 create or replace function albion.hole_piece(from_ real, to_ real, hole_id_ varchar)
 returns geometry
 language plpgsql stable
@@ -145,12 +329,10 @@ $$
             insert into _albion.hole(id, date_, depth_, x, y, z, comments)
             values(new.id, new.date_, new.depth_, st_x(new.geom), st_y(new.geom), st_z(new.geom), new.comments)
             returning id into new.id;
-            update _albion.hole set geom = albion.hole_geom(new.id) where id=new.id;
             return new;
         elsif tg_op = 'UPDATE' then
             update _albion.hole set id=new.id, date_=new.date_, depth_=new.depth_, x=st_x(new.geom), y=st_y(new.geom), z=st_z(new.geom), comments=new.comments
             where id=old.id;
-            update _albion.hole set geom = albion.hole_geom(new.id) where id=new.id;
             return new;
         elsif tg_op = 'DELETE' then
             delete from _albion.collar where id=old.id;
@@ -165,7 +347,7 @@ create trigger collar_instead_trig
        for each row execute procedure albion.collar_instead_fct()
 ;
 
-create view albion.metadata as select id, srid, close_collar_distance, snap_distance, precision, interpolation, end_node_relative_distance, end_node_relative_thickness, correlation_distance, correlation_angle, parent_correlation_angle from _albion.metadata
+create view albion.metadata as select id, srid, close_collar_distance, snap_distance, precision, interpolation, end_node_relative_distance, end_node_relative_thickness, correlation_distance, correlation_angle, parent_correlation_angle, volume_cache_size from _albion.metadata
 ;
 
 create view albion.layer as select name, fields_definition from _albion.layer
@@ -229,6 +411,30 @@ create trigger node_instead_trig
        for each row execute procedure albion.node_instead_fct()
 ;
 
+-- nodes of graph_id_ for the intervals (hole_ids_, froms_, tos_), with the
+-- geometry and parent the albion.node trigger would give them, in one insert
+-- so that the statement triggers of _albion.node fire once
+create or replace function albion.add_nodes(graph_id_ varchar, hole_ids_ varchar[], froms_ real[], tos_ real[])
+returns void
+language sql volatile
+as
+$$
+    insert into _albion.node(graph_id, hole_id, from_, to_, geom, parent)
+    select graph_id_, i.hole_id, i.from_, i.to_,
+        st_makeline(
+            st_3dlineinterpolatepoint(h.geom, least(i.from_/h.l, 1)),
+            st_3dlineinterpolatepoint(h.geom, least(i.to_/h.l, 1))),
+        (select n.id from _albion.node as n
+        where .5*(i.from_+i.to_) between n.from_ and n.to_
+        and n.hole_id=i.hole_id
+        and n.graph_id=(select g.parent from _albion.graph as g where g.id=graph_id_))
+    from unnest(hole_ids_, froms_, tos_) as i(hole_id, from_, to_)
+    left join lateral (
+        select geom, st_3dlength(geom) as l from _albion.hole where id=i.hole_id
+    ) as h on true
+$$
+;
+
 
 
 
@@ -261,23 +467,24 @@ create trigger cell_after_trig
        for each statement execute procedure albion.cell_after_fct()
 ;
 
-create or replace function albion.tesselate(polygon_ geometry, lines_ geometry, points_ geometry)
-returns geometry
+create or replace function albion.tesselate_wkb(polygon_ bytea, lines_ bytea, points_ bytea)
+returns bytea
 language plpython3u volatile
 as
 $$
-    from shapely import wkb
-    from shapely import geos
-    geos.WKBWriter.defaults['include_srid'] = True
-    from fourmy import tessellate
-
-    polygon = wkb.loads(bytes.fromhex(polygon_))
-    lines = wkb.loads(bytes.fromhex(lines_)) if lines_ else None
-    points = wkb.loads(bytes.fromhex(points_)) if points_ else None
-    result = tessellate(polygon, lines, points)
+    if 'albion' not in SD:
+        plpy.execute("select albion.load_runtime()")
+        SD['albion'] = GD['albion']
+    return SD['albion'].tesselate_wkb(polygon_, lines_, points_)
+$$
+;
 
-    geos.lgeos.GEOSSetSRID(result._geom, geos.lgeos.GEOSGetSRID(polygon._geom))
-    return result.wkb_hex
+create or replace function albion.tesselate(polygon_ geometry, lines_ geometry, points_ geometry)
+returns geometry
+language sql volatile
+as
+$$
+    select st_geomfromewkb(albion.tesselate_wkb(st_asewkb(polygon_), st_asewkb(lines_), st_asewkb(points_)))
 $$
 ;
 
@@ -318,18 +525,10 @@ returns real
 language plpython3u immutable
 as
 $$
-    import numpy
-    from numpy.linalg import norm
-    from shapely import wkb
-    anchor = wkb.loads(bytes.fromhex(anchor_))
-    start = wkb.loads(bytes.fromhex(start_))
-    end = wkb.loads(bytes.fromhex(end_))
-    dir = numpy.array(anchor.coords[-1]) - numpy.array(anchor.coords[0])
-    dir /= norm(dir)
-    seg = numpy.array(end.coords[0]) - numpy.array(start.coords[0])
-    seg /= norm(seg)
-
-    return dir.dot(seg)
+    if 'albion' not in SD:
+        plpy.execute("select albion.load_runtime()")
+        SD['albion'] = GD['albion']
+    return SD['albion'].cos_angle(anchor_, start_, end_)
 $$
 ;
 
@@ -546,90 +745,47 @@ create trigger group_cell_instead_trig
        for each row execute procedure albion.group_cell_instead_fct()
 ;
 
+-- projection on the vertical plane of the anchor, seen from the side of its
+-- normal, with a vertical magnification of z_scale: a point at distance t along
+-- the anchor and at altitude z goes to anchor_start + t*direction + z_scale*z*normal,
+-- as a single affine transform that the planner can inline
 create or replace function albion.to_section(geom geometry, anchor geometry, z_scale real)
 returns geometry
+language sql immutable parallel safe
+as
+$$
+    select st_force2d(st_translate(st_affine(
+        st_translate(geom, -st_x(st_startpoint(anchor)), -st_y(st_startpoint(anchor))),
+        sin(st_azimuth(st_startpoint(anchor), st_endpoint(anchor)))^2,
+        sin(st_azimuth(st_startpoint(anchor), st_endpoint(anchor)))*cos(st_azimuth(st_startpoint(anchor), st_endpoint(anchor))),
+        -z_scale*cos(st_azimuth(st_startpoint(anchor), st_endpoint(anchor))),
+        sin(st_azimuth(st_startpoint(anchor), st_endpoint(anchor)))*cos(st_azimuth(st_startpoint(anchor), st_endpoint(anchor))),
+        cos(st_azimuth(st_startpoint(anchor), st_endpoint(anchor)))^2,
+        z_scale*sin(st_azimuth(st_startpoint(anchor), st_endpoint(anchor))),
+        0, 0, 0,
+        0, 0, 0),
+        st_x(st_startpoint(anchor)), st_y(st_startpoint(anchor))))
+$$
+;
+
+create or replace function albion.from_section_wkb(geom_ bytea, anchor_ bytea, section_ bytea, z_scale_ real)
+returns bytea
 language plpython3u immutable
 as
 $$
-    import plpy
-    from shapely.ops import transform
-    from shapely.geometry import LineString
-    from shapely import wkb
-    from shapely import geos
-    import numpy
-    from numpy.linalg import norm
-    geos.WKBWriter.defaults['include_srid'] = True
-
-    if geom is None:
-        return None
-    g = wkb.loads(bytes.fromhex(geom))
-    a = wkb.loads(bytes.fromhex(anchor))
-    orig = numpy.array(a.coords[0])
-    dir_ = numpy.array(a.coords[-1]) - orig
-    dir_ /= norm(dir_)
-    nrml_ = numpy.array([-dir_[1] , dir_[0]])
-
-    if g.type == 'LineString':
-        xyz = numpy.array(g.coords)
-        xyz[:,:2] -= orig
-        xy = xyz[:,:2].dot(dir_).reshape(-1,1)*dir_
-        xy += z_scale*xyz[:,2].reshape(-1,1)*nrml_
-        xy += orig
-        result = LineString(xy)
-    else:
-        def tr(x, y, z=None):
-            z = z or (0,)*len(x)
-            xy = (numpy.array((x,y)).T - orig).dot(dir_).reshape(-1,1)*dir_
-            xy += z_scale*numpy.array(z).reshape(-1,1)*nrml_
-            xy += orig
-            return zip(*((x_, y_) for x_, y_ in xy ))
-
-        result = transform(tr, g)
-    geos.lgeos.GEOSSetSRID(result._geom, geos.lgeos.GEOSGetSRID(g._geom))
-    return result.wkb_hex
+    if 'albion' not in SD:
+        plpy.execute("select albion.load_runtime()")
+        SD['albion'] = GD['albion']
+    return SD['albion'].from_section_wkb(geom_, anchor_, section_, z_scale_)
 $$
 ;
 
 create or replace function albion.from_section(geom_ geometry, anchor_ geometry, section_ geometry, z_scale_ real)
 returns geometry
-language plpython3u immutable
+language sql immutable
 as
 $$
-    import plpy
-    from shapely.ops import transform
-    from shapely.geometry import LineString
-    from shapely import wkb
-    from shapely import geos
-    from numpy import array, dot
-    from numpy.linalg import norm
-    geos.WKBWriter.defaults['include_srid'] = True
-
-    if geom_ is None:
-        return None
-    g = wkb.loads(bytes.fromhex(geom_))
-    a = wkb.loads(bytes.fromhex(anchor_))
-    s = wkb.loads(bytes.fromhex(section_))
-
-    orig = array(a.coords[0])
-    dir_ = array(a.coords[-1]) - orig
-    dir_ /= norm(dir_)
-    nrml_ = array([-dir_[1] , dir_[0]])
-
-    if g.type == 'LineString':
-        xy = array(g.coords)
-        points = []
-        for p in xy:
-            z = dot(nrml_, p-orig)/z_scale_
-            big_distance = 100*z_scale_*z
-            # intersection between section geom and line extending from point in the normal direction
-            plpy.warning(big_distance, nrml_, z, p, s.intersection(LineString([p-nrml_*big_distance, p+nrml_*big_distance])).wkt)
-            x, y = s.intersection(LineString([p-nrml_*big_distance, p+nrml_*big_distance])).coords[0]
-            points.append((x,y,z))
-        result = LineString(points)
-    else:
-        assert(False)
-    geos.lgeos.GEOSSetSRID(result._geom, geos.lgeos.GEOSGetSRID(g._geom))
-    return result.wkb_hex
+    select st_geomfromewkb(albion.from_section_wkb(st_asewkb(geom_), st_asewkb(anchor_), st_asewkb(section_), z_scale_))
 $$
 ;
 
@@ -700,112 +856,24 @@ returns TABLE (level_ real, from_ real, to_ real, oc real, accu real, grade real
 language plpython3u immutable
 as
 $$
-    import plpy
-    import numpy
-    import math
-
-    IC = int(round(ic_/measure_thickness)) # nb echantillon, intercalaire stérile minimale
-    OC = int(round(oc_/measure_thickness)) # nb echantillon, ouverture chantier (épaisseur mini)
-    cut = cut_ # cutoff
-
-    first_from_ = from_[0]
-
-    AVP = []
-    for gamma, f, t in zip(radiometry_, from_, to_):
-        AVP += [gamma]*int(round((t-f)/measure_thickness))
-    AVP = numpy.array(AVP, dtype=numpy.float32)
-
-    N = len(AVP)+2*IC+OC-1
-
-    # Vecteurs de travail
-    # note: le code est un portage de R
-    # pour garder l indexation démarrant à 1
-    # on alloue N + 1 éléments, le premier élément est inutilisé
-    t = numpy.zeros((N+1,))
-    t [(IC+OC):(IC+OC+len(AVP))] = AVP
-    v = t - cut
-    v[0] = 0
-
-    SV  = numpy.zeros((N+1,))
-    SV1 = numpy.zeros((N+1,))
-    SV2 = numpy.zeros((N+1,))
-    SO  = numpy.zeros((N+1,))
-    SO1 = numpy.zeros((N+1,))
-    SO2 = numpy.zeros((N+1,))
-
-    SVP = numpy.zeros((N+1,), dtype=numpy.int32)
-    SOP = numpy.zeros((N+1,), dtype=numpy.int32)
-
-    # Initialisation
-    for i in range(OC, (IC+OC-1)+1):
-        SV[i] = numpy.sum(v[(i-OC+1):(i+1)])
-    SVP[IC+OC-1]=IC
-    SOP[IC+OC-1]=1
-
-    # Calcul des valeurs
-    for i in range(IC+OC, N+1):
-        # Calcul de SV
-        SV1[i] = SV[i-1]+v[i]
-        SV2[i] = SO[i-OC]+numpy.sum(v[(i-OC+1):(i+1)])
-        SV[i]  = max(SV1[i], SV2[i])
-
-        # Calcul de SO
-        SO1[i] = SO[i-1]
-        SO2[i] = SV[i-IC]
-        SO[i]  = max(SO1[i], SO2[i])
-        # Limites de chantiers
-        if SV1[i] >= SV2[i]:
-            SVP[i] = SVP[i-1]
-        else:
-            SVP[i] = i - OC + 1
-
-        if SO1[i] >  SO2[i]:
-            SOP[i] = SOP[i-1]
-        else:
-            SOP[i] = i - IC + 1
-
-    # Calcul des chantiers
-    class Rec(object):
-        def __init__(self, N, OC, IC):
-            self.nbr_max = 2*int(math.ceil(N/(OC+IC)))
-            self.from_ = numpy.zeros(self.nbr_max+1, dtype=numpy.int32)
-            self.to = numpy.zeros(self.nbr_max+1, dtype=numpy.int32)
-            self.code = numpy.zeros(self.nbr_max+1, dtype=numpy.int32)
-            self.accu = numpy.zeros(self.nbr_max+1, dtype=numpy.int32)
-            self.nbr = 0
-            self.idx = N
-
-    int_ = Rec(N, OC, IC)
-
-    while SOP[int_.idx] > 1:
-        # L intercalaire
-        int_.nbr += 1
-        int_.to[int_.nbr] = int_.idx
-        int_.from_[int_.nbr] = SOP[int_.to[int_.nbr]]
-        int_.code[int_.nbr] = 0
-        int_.accu[int_.nbr] = 0.0
-
-        # Le chantier
-        int_.nbr += 1
-        int_.to[int_.nbr] = int_.from_[int_.nbr-1]-1
-        int_.from_[int_.nbr] = SVP[int_.to[int_.nbr]]
-        int_.code[int_.nbr] = 1
-        int_.accu[int_.nbr] = numpy.sum(cut+v[int_.from_[int_.nbr]:int_.to[int_.nbr]+1])
-
-        # mise à jour l index
-        int_.idx = int_.from_[int_.nbr]-1
-
-    result = []
-    for ifrom_, ito_, c in zip(int_.from_, int_.to, int_.code):
-        ifrom_ -= OC+IC
-        ito_ -= OC+IC-1
-        if ifrom_ >= 0 and ito_ > 0 and c:
-            accu = numpy.sum(AVP[ifrom_:ito_])
-            oc = (ito_ - ifrom_)*measure_thickness
-            grade = accu/oc
-            result.append((cut, ifrom_*measure_thickness + first_from_, ito_*measure_thickness + first_from_, oc, accu, grade))
-
-    return result
+    if 'albion' not in SD:
+        plpy.execute("select albion.load_runtime()")
+        SD['albion'] = GD['albion']
+    return SD['albion'].segmentation(radiometry_, from_, to_, ic_, oc_, cut_, measure_thickness)
+$$
+;
+
+-- segmentation for several cutoffs, for grade-tonnage studies
+create or replace function albion.segmentation_sweep(
+    radiometry_ real[], from_ real[], to_ real[], ic_ real, oc_ real, cuts_ real[], measure_thickness real default .1)
+returns TABLE (level_ real, from_ real, to_ real, oc real, accu real, grade real)
+language plpython3u immutable
+as
+$$
+    if 'albion' not in SD:
+        plpy.execute("select albion.load_runtime()")
+        SD['albion'] = GD['albion']
+    return SD['albion'].segmentation_sweep(radiometry_, from_, to_, ic_, oc_, cuts_, measure_thickness)
 $$
 ;
 
@@ -820,66 +888,288 @@ select case when c < a then c else a end as start_, case when c < a then a else
 from _albion.cell
 ;
 
-create or replace view albion.possible_edge as
-with tan_ang as (
-    select tan(correlation_angle*pi()/180) as value, tan(parent_correlation_angle*pi()/180) as parent_value
+-- possible edges between the nodes of graph_ids_ (only those of node_ids_
+-- if specified): for graphs without parent, nodes on the holes of a cell edge
+-- whose z ranges match within the correlation angle and the correlation
+-- distance, for graphs with a parent, children of the nodes of parent edges
+-- whose z ranges match within the parent correlation angle
+--
+-- node values are computed once per node instead of once per pair of nodes
+create or replace function albion.possible_edges(graph_ids_ varchar[], node_ids_ varchar[] default null)
+returns table(start_ varchar, end_ varchar, graph_id varchar, geom geometry)
+language sql stable
+as
+$$
+with m as (
+    select correlation_distance, tan(correlation_angle*pi()/180) as tan_angle, tan(parent_correlation_angle*pi()/180) as parent_tan_angle
     from _albion.metadata
 ),
-result as (
-select ns.id as start_, ne.id as end_, ns.graph_id as graph_id, (st_makeline(st_3dlineinterpolatepoint(ns.geom, .5), st_3dlineinterpolatepoint(ne.geom, .5)))::geometry('LINESTRINGZ', $SRID) as geom --, null as parent
-
+node as (
+    select n.id, n.graph_id, n.hole_id, n.parent, n.geom, abs(n.from_-n.to_) as thickness,
+        st_startpoint(n.geom) as top, st_z(st_startpoint(n.geom)) as z_top, st_z(st_endpoint(n.geom)) as z_bottom,
+        st_3dlineinterpolatepoint(n.geom, .5) as center,
+        node_ids_ is null or c.id is not null as changed
+    from _albion.node as n
+    -- joined rather than searched in the array for each node
+    left join (select distinct unnest(node_ids_) as id) as c on c.id=n.id
+    where n.graph_id = any(graph_ids_)
+)
+select ns.id, ne.id, ns.graph_id, st_makeline(ns.center, ne.center)
 from albion.all_edge as e
-join _albion.hole as hs on hs.id=e.start_
-join _albion.hole as he on he.id=e.end_
-join _albion.node as ns on ns.hole_id=hs.id
-join _albion.node as ne on ne.hole_id=he.id, tan_ang
-where ns.graph_id = ne.graph_id
+join node as ns on ns.hole_id=e.start_ and ns.parent is null
+join node as ne on ne.hole_id=e.end_ and ne.parent is null and ne.graph_id=ns.graph_id
+cross join m
+cross join lateral (select st_distance(ns.top, ne.top)*m.tan_angle as dz) as d
+where (ns.changed or ne.changed)
 and (
     (
-        abs(ns.from_-ns.to_) >= abs(ne.from_-ne.to_)
-        and st_z(st_startpoint(ns.geom)) + st_distance(st_startpoint(ns.geom), st_startpoint(ne.geom))*tan_ang.value >= st_z(st_startpoint(ne.geom))
-        and st_z(st_endpoint(ns.geom)) - st_distance(st_startpoint(ns.geom), st_startpoint(ne.geom))*tan_ang.value <= st_z(st_endpoint(ne.geom))
+        ns.thickness >= ne.thickness
+        and ns.z_top + d.dz >= ne.z_top
+        and ns.z_bottom - d.dz <= ne.z_bottom
     )
     or
     (
-        abs(ns.from_-ns.to_) < abs(ne.from_-ne.to_)
-        and st_z(st_startpoint(ne.geom)) + st_distance(st_startpoint(ns.geom), st_startpoint(ne.geom))*tan_ang.value >= st_z(st_startpoint(ns.geom))
-        and st_z(st_endpoint(ne.geom)) - st_distance(st_startpoint(ns.geom), st_startpoint(ne.geom))*tan_ang.value <= st_z(st_endpoint(ns.geom))
-    )
+        ns.thickness < ne.thickness
+        and ne.z_top + d.dz >= ns.z_top
+        and ne.z_bottom - d.dz <= ns.z_bottom
     )
-
-and st_distance( ne.geom, ns.geom ) < ( select correlation_distance from albion.metadata )
-and ns.parent is null
-and ne.parent is null
+)
+and st_distance(ne.geom, ns.geom) < m.correlation_distance
 
 union all -- for graphs with parents
 
-select ns.id as start_, ne.id as end_, ns.graph_id as graph_id, (st_makeline(st_3dlineinterpolatepoint(ns.geom, .5), st_3dlineinterpolatepoint(ne.geom, .5)))::geometry('LINESTRINGZ', $SRID) as geom --, ns.parent as parent
+select ns.id, ne.id, ns.graph_id, st_makeline(ns.center, ne.center)
 from _albion.edge as pe
 join _albion.node as pns on pns.id=pe.start_
 join _albion.node as pne on pne.id=pe.end_
-join _albion.node as ns on ns.parent=pns.id
-join _albion.node as ne on ne.parent=pne.id, tan_ang
-where ns.graph_id = ne.graph_id
-and
-    (
+join node as ns on ns.parent=pns.id
+join node as ne on ne.parent=pne.id and ne.graph_id=ns.graph_id
+cross join m
+cross join lateral (
+    select st_distance(ns.top, ne.top)*m.parent_tan_angle as dz,
+        st_z(st_3dlineinterpolatepoint(pne.geom, .5)) - st_z(st_3dlineinterpolatepoint(pns.geom, .5)) as shift
+) as d
+where (ns.changed or ne.changed)
+and (
     (
-        abs(ns.from_-ns.to_) >= abs(ne.from_-ne.to_)
-        and st_z(st_startpoint(ns.geom)) + st_distance(st_startpoint(ns.geom), st_startpoint(ne.geom))*tan_ang.parent_value + (st_z(st_3dlineinterpolatepoint(pne.geom, .5)) - st_z(st_3dlineinterpolatepoint(pns.geom, .5))) >= st_z(st_startpoint(ne.geom))
-        and st_z(st_endpoint(ns.geom)) - st_distance(st_startpoint(ns.geom), st_startpoint(ne.geom))*tan_ang.parent_value + (st_z(st_3dlineinterpolatepoint(pne.geom, .5)) - st_z(st_3dlineinterpolatepoint(pns.geom, .5))) <= st_z(st_endpoint(ne.geom))
-
+        ns.thickness >= ne.thickness
+        and ns.z_top + d.dz + d.shift >= ne.z_top
+        and ns.z_bottom - d.dz + d.shift <= ne.z_bottom
     )
     or
     (
-        abs(ns.from_-ns.to_) < abs(ne.from_-ne.to_)
-        and st_z(st_startpoint(ne.geom)) + st_distance(st_startpoint(ns.geom), st_startpoint(ne.geom))*tan_ang.parent_value  + (st_z(st_3dlineinterpolatepoint(pns.geom, .5)) - st_z(st_3dlineinterpolatepoint(pne.geom, .5))) >= st_z(st_startpoint(ns.geom)) 
-
-        and st_z(st_endpoint(ne.geom)) - st_distance(st_startpoint(ns.geom), st_startpoint(ne.geom))*tan_ang.parent_value + (st_z(st_3dlineinterpolatepoint(pns.geom, .5)) - st_z(st_3dlineinterpolatepoint(pne.geom, .5)) ) <= st_z(st_endpoint(ns.geom)) 
-
-    )
+        ns.thickness < ne.thickness
+        and ne.z_top + d.dz - d.shift >= ns.z_top
+        and ne.z_bottom - d.dz - d.shift <= ns.z_bottom
     )
 )
-select row_number() over() as id, * from result
+$$
+;
+
+-- graphs with up to date possible edges in possible_edge_candidate, the
+-- possible edges of the other (stale) graphs are computed on the fly
+create table albion.possible_edge_graph(
+    graph_id varchar primary key references _albion.graph(id) on delete cascade on update cascade)
+;
+
+create table albion.possible_edge_candidate(
+    start_ varchar not null references _albion.node(id) on delete cascade on update cascade,
+    end_ varchar not null references _albion.node(id) on delete cascade on update cascade,
+    graph_id varchar not null references albion.possible_edge_graph(graph_id) on delete cascade on update cascade,
+    geom geometry('LINESTRINGZ', $SRID) not null,
+    primary key (start_, end_))
+;
+
+create index possible_edge_candidate_end_idx on albion.possible_edge_candidate(end_)
+;
+
+create index possible_edge_candidate_graph_id_idx on albion.possible_edge_candidate(graph_id)
+;
+
+-- computes the possible edges of graph_id_ if it is stale, otherwise
+-- recomputes those of its nodes node_ids_ if specified
+create or replace function albion.refresh_possible_edge(graph_id_ varchar, node_ids_ varchar[] default null)
+returns void
+language plpgsql
+as
+$$
+    begin
+        if not exists (select 1 from albion.possible_edge_graph where graph_id=graph_id_) then
+            insert into albion.possible_edge_graph(graph_id) values (graph_id_);
+            node_ids_ := null;
+        elsif node_ids_ is null then
+            return;
+        else
+            delete from albion.possible_edge_candidate as c
+            where c.start_ in (select unnest(node_ids_));
+            delete from albion.possible_edge_candidate as c
+            where c.end_ in (select unnest(node_ids_));
+        end if;
+
+        insert into albion.possible_edge_candidate(start_, end_, graph_id, geom)
+        select p.start_, p.end_, p.graph_id, p.geom
+        from albion.possible_edges(array[graph_id_], node_ids_) as p;
+    end;
+$$
+;
+
+create or replace view albion.possible_edge as
+select row_number() over() as id, t.start_, t.end_, t.graph_id, t.geom::geometry('LINESTRINGZ', $SRID) as geom
+from (
+    select c.start_, c.end_, c.graph_id, c.geom
+    from albion.possible_edge_candidate as c
+    union all
+    select p.start_, p.end_, p.graph_id, p.geom
+    from albion.possible_edges((
+        select array_agg(g.id)
+        from _albion.graph as g
+        where not exists (select 1 from albion.possible_edge_graph as pg where pg.graph_id=g.id))) as p
+) as t
+;
+
+-- nodes added to an up to date graph get their possible edges, other changes
+-- make graphs stale: node updates for their graph and its children, parent
+-- edges and parent changes for the children, cells and metadata for all graphs
+
+create or replace function albion.node_possible_edge_fct()
+returns trigger
+language plpgsql
+as
+$$
+    begin
+        if tg_op = 'INSERT' then
+            perform albion.refresh_possible_edge(n.graph_id, array_agg(n.id))
+            from new_table as n
+            join albion.possible_edge_graph as pg on pg.graph_id=n.graph_id
+            group by n.graph_id;
+        elsif tg_op = 'UPDATE' then
+            delete from albion.possible_edge_graph
+            where graph_id in (
+                select n.graph_id from new_table as n
+                union
+                select n.graph_id from old_table as n
+                union
+                select g.id
+                from _albion.graph as g
+                join (select graph_id from new_table union select graph_id from old_table) as n on n.graph_id=g.parent);
+        end if;
+        return null;
+    end;
+$$
+;
+
+drop trigger if exists node_possible_edge_insert_trig on _albion.node
+;
+
+create trigger node_possible_edge_insert_trig
+    after insert on _albion.node
+    referencing new table as new_table
+       for each statement execute procedure albion.node_possible_edge_fct()
+;
+
+drop trigger if exists node_possible_edge_update_trig on _albion.node
+;
+
+create trigger node_possible_edge_update_trig
+    after update on _albion.node
+    referencing old table as old_table new table as new_table
+       for each statement execute procedure albion.node_possible_edge_fct()
+;
+
+create or replace function albion.edge_possible_edge_fct()
+returns trigger
+language plpgsql
+as
+$$
+    begin
+        if tg_op in ('INSERT', 'UPDATE') then
+            delete from albion.possible_edge_graph
+            where graph_id in (select g.id from _albion.graph as g join new_table as e on e.graph_id=g.parent);
+        end if;
+        if tg_op in ('DELETE', 'UPDATE') then
+            delete from albion.possible_edge_graph
+            where graph_id in (select g.id from _albion.graph as g join old_table as e on e.graph_id=g.parent);
+        end if;
+        return null;
+    end;
+$$
+;
+
+drop trigger if exists edge_possible_edge_insert_trig on _albion.edge
+;
+
+create trigger edge_possible_edge_insert_trig
+    after insert on _albion.edge
+    referencing new table as new_table
+       for each statement execute procedure albion.edge_possible_edge_fct()
+;
+
+drop trigger if exists edge_possible_edge_update_trig on _albion.edge
+;
+
+create trigger edge_possible_edge_update_trig
+    after update on _albion.edge
+    referencing old table as old_table new table as new_table
+       for each statement execute procedure albion.edge_possible_edge_fct()
+;
+
+drop trigger if exists edge_possible_edge_delete_trig on _albion.edge
+;
+
+create trigger edge_possible_edge_delete_trig
+    after delete on _albion.edge
+    referencing old table as old_table
+       for each statement execute procedure albion.edge_possible_edge_fct()
+;
+
+create or replace function albion.graph_possible_edge_fct()
+returns trigger
+language plpgsql
+as
+$$
+    begin
+        delete from albion.possible_edge_graph
+        where graph_id in (select g.id from new_table as g);
+        return null;
+    end;
+$$
+;
+
+drop trigger if exists graph_possible_edge_update_trig on _albion.graph
+;
+
+create trigger graph_possible_edge_update_trig
+    after update on _albion.graph
+    referencing new table as new_table
+       for each statement execute procedure albion.graph_possible_edge_fct()
+;
+
+create or replace function albion.possible_edge_stale_fct()
+returns trigger
+language plpgsql
+as
+$$
+    begin
+        delete from albion.possible_edge_graph;
+        return null;
+    end;
+$$
+;
+
+drop trigger if exists cell_possible_edge_trig on _albion.cell
+;
+
+create trigger cell_possible_edge_trig
+    after insert or update or delete on _albion.cell
+       for each statement execute procedure albion.possible_edge_stale_fct()
+;
+
+drop trigger if exists metadata_possible_edge_trig on _albion.metadata
+;
+
+create trigger metadata_possible_edge_trig
+    after update on _albion.metadata
+       for each statement execute procedure albion.possible_edge_stale_fct()
 ;
 
 
@@ -1046,72 +1336,137 @@ create type albion.volume_row as (
     face3 geometry('MULTIPOLYGONZ', $SRID))
 ;
 
+create or replace function albion.elementary_volumes_wkb(cell_id_ varchar, graph_id_ varchar, geom_ bytea, holes_ varchar[], starts_ varchar[], ends_ varchar[], hole_ids_ varchar[], node_ids_ varchar[], nodes_ bytea[], end_ids_ varchar[], end_geoms_ bytea[], end_holes_ varchar[], end_node_relative_distance real, end_node_relative_thickness real)
+returns table(geom bytea, face1 bytea, face2 bytea, face3 bytea)
+language plpython3u immutable
+as
+$$
+    if 'albion' not in SD:
+        plpy.execute("select albion.load_runtime()")
+        SD['albion'] = GD['albion']
+    for row in SD['albion'].elementary_volumes_wkb(holes_, starts_, ends_, hole_ids_, node_ids_, nodes_, end_ids_, end_geoms_, end_holes_, $SRID, end_node_relative_distance, end_node_relative_thickness):
+        yield row
+$$
+;
+
 create or replace function albion.elementary_volumes(cell_id_ varchar, graph_id_ varchar, geom_ geometry, holes_ varchar[], starts_ varchar[], ends_ varchar[], hole_ids_ varchar[], node_ids_ varchar[], nodes_ geometry[], end_ids_ varchar[], end_geoms_ geometry[], end_holes_ varchar[], end_node_relative_distance real, end_node_relative_thickness real)
 returns setof albion.volume_row
-language plpython3u immutable
+language sql immutable
 as
 $$
-#open('/tmp/debug_input_%s.txt'%(cell_id_), 'w').write(
-#    cell_id_+'\n'+
-#    graph_id_+'\n'+
-#    geom_+'\n'+
-#    ' '.join(holes_)+'\n'+
-#    ' '.join(starts_)+'\n'+
-#    ' '.join(ends_)+'\n'+
-#    ' '.join(hole_ids_)+'\n'+
-#    ' '.join(node_ids_)+'\n'+
-#    ' '.join(nodes_)+'\n'+
-#    ' '.join(end_ids_)+'\n'+
-#    ' '.join(end_geoms_)+'\n'+
-#    ' '.join(end_holes_)+'\n'
-#)
-$INCLUDE_ELEMENTARY_VOLUME
-for g, f1, f2, f3 in elementary_volumes(holes_, starts_, ends_, hole_ids_, node_ids_, nodes_, end_ids_, end_geoms_, end_holes_, $SRID, end_node_relative_distance, end_node_relative_thickness):
-    yield g, f1, f2, f3
+    select st_geomfromewkb(t.geom)::geometry('MULTIPOLYGONZ', $SRID),
+        st_geomfromewkb(t.face1)::geometry('MULTIPOLYGONZ', $SRID),
+        st_geomfromewkb(t.face2)::geometry('MULTIPOLYGONZ', $SRID),
+        st_geomfromewkb(t.face3)::geometry('MULTIPOLYGONZ', $SRID)
+    from albion.elementary_volumes_wkb(cell_id_, graph_id_, st_asewkb(geom_), holes_, starts_, ends_, hole_ids_, node_ids_,
+        array(select st_asewkb(n.geom) from unnest(nodes_) with ordinality as n(geom, i) order by n.i),
+        end_ids_,
+        array(select st_asewkb(e.geom) from unnest(end_geoms_) with ordinality as e(geom, i) order by e.i),
+        end_holes_, end_node_relative_distance, end_node_relative_thickness) as t
 $$
 ;
 
-create or replace function albion.volume_of_geom(multipoly geometry)
+create or replace function albion.cached_elementary_volumes(cell_id_ varchar, graph_id_ varchar, geom_ geometry, holes_ varchar[], starts_ varchar[], ends_ varchar[], hole_ids_ varchar[], node_ids_ varchar[], nodes_ geometry[], end_ids_ varchar[], end_geoms_ geometry[], end_holes_ varchar[], end_node_relative_distance real, end_node_relative_thickness real)
+returns setof albion.volume_row
+language plpgsql volatile
+as
+$$
+    declare
+        hash_ varchar;
+        cached_ record;
+    begin
+        -- cell and graph ids do not change the result, cells with the same inputs share the entry,
+        -- the runtime version invalidates the entries built by another version of the code
+        hash_ := md5(row(albion.runtime_version(), geom_, holes_, starts_, ends_, hole_ids_, node_ids_, nodes_, end_ids_, end_geoms_, end_holes_,
+            end_node_relative_distance, end_node_relative_thickness)::text);
+
+        update _albion.volume_cache set last_access=now() where hash=hash_
+        returning geom, face1, face2, face3 into cached_;
+
+        if not found then
+            insert into _albion.volume_cache(hash, geom, face1, face2, face3, size_)
+            select hash_,
+                coalesce(array_agg(t.geom order by t.n), '{}'::geometry[]),
+                coalesce(array_agg(t.face1 order by t.n), '{}'::geometry[]),
+                coalesce(array_agg(t.face2 order by t.n), '{}'::geometry[]),
+                coalesce(array_agg(t.face3 order by t.n), '{}'::geometry[]),
+                coalesce(sum(coalesce(pg_column_size(t.geom), 0) + coalesce(pg_column_size(t.face1), 0)
+                    + coalesce(pg_column_size(t.face2), 0) + coalesce(pg_column_size(t.face3), 0)), 0)
+            from albion.elementary_volumes(cell_id_, graph_id_, geom_, holes_, starts_, ends_, hole_ids_, node_ids_, nodes_,
+                end_ids_, end_geoms_, end_holes_, end_node_relative_distance, end_node_relative_thickness) with ordinality as t(geom, face1, face2, face3, n)
+            on conflict (hash) do update set last_access=now()
+            returning geom, face1, face2, face3 into cached_;
+        end if;
+
+        return query
+        select t.geom, t.face1, t.face2, t.face3
+        from unnest(cached_.geom, cached_.face1, cached_.face2, cached_.face3) as t(geom, face1, face2, face3);
+    end;
+$$
+;
+
+create or replace function albion.evict_volume_cache()
+returns integer
+language plpgsql volatile
+as
+$$
+    declare
+        evicted_ integer;
+    begin
+        delete from _albion.volume_cache
+        where hash in (
+            select c.hash
+            from (
+                select hash, sum(size_) over (order by last_access desc, hash) as cumulated_size
+                from _albion.volume_cache
+            ) as c, _albion.metadata as m
+            where c.cumulated_size > m.volume_cache_size
+        );
+        get diagnostics evicted_ = row_count;
+        return evicted_;
+    end;
+$$
+;
+
+create or replace function albion.volume_of_geom_wkb(multipoly bytea)
 returns real
 language plpython3u immutable
 as
 $$
-    from shapely import wkb
-    import plpy
-    from numpy import array, average
+    if 'albion' not in SD:
+        plpy.execute("select albion.load_runtime()")
+        SD['albion'] = GD['albion']
+    return SD['albion'].volume_of_geom_wkb(multipoly)
+$$
+;
 
-    m = wkb.loads(bytes.fromhex(multipoly))
-    volume = 0
-    for p in m:
-        r = p.exterior.coords
-        v210 = r[2][0]*r[1][1]*r[0][2];
-        v120 = r[1][0]*r[2][1]*r[0][2];
-        v201 = r[2][0]*r[0][1]*r[1][2];
-        v021 = r[0][0]*r[2][1]*r[1][2];
-        v102 = r[1][0]*r[0][1]*r[2][2];
-        v012 = r[0][0]*r[1][1]*r[2][2];
-        volume += (1./6.)*(-v210 + v120 + v201 - v021 - v102 + v012)
-    return volume
+create or replace function albion.volume_of_geom(multipoly geometry)
+returns real
+language sql immutable
+as
+$$
+    select albion.volume_of_geom_wkb(st_asewkb(multipoly))
 $$
 ;
 
-create or replace function albion.is_closed_volume(multipoly geometry)
+create or replace function albion.is_closed_volume_wkb(multipoly bytea)
 returns boolean
 language plpython3u immutable
 as
 $$
-    from shapely import wkb
-
-    m = wkb.loads(bytes.fromhex(multipoly))
+    if 'albion' not in SD:
+        plpy.execute("select albion.load_runtime()")
+        SD['albion'] = GD['albion']
+    return SD['albion'].is_closed_volume_wkb(multipoly)
+$$
+;
 
-    edges = set()
-    for p in m:
-        for s, e in zip(p.exterior.coords[:-1], p.exterior.coords[1:]):
-            if (e, s) in edges:
-                edges.remove((e, s))
-            else:
-                edges.add((s, e))
-    return len(edges)==0
+create or replace function albion.is_closed_volume(multipoly geometry)
+returns boolean
+language sql immutable
+as
+$$
+    select albion.is_closed_volume_wkb(st_asewkb(multipoly))
 $$
 ;
 
@@ -1120,173 +1475,88 @@ select id, graph_id, cell_id, triangulation, albion.volume_of_geom(triangulation
 from _albion.volume
 ;
 
+create or replace function albion.mesh_boundarie_wkb(multipoly bytea)
+returns bytea
+language plpython3u immutable
+as
+$$
+    if 'albion' not in SD:
+        plpy.execute("select albion.load_runtime()")
+        SD['albion'] = GD['albion']
+    return SD['albion'].mesh_boundarie_wkb(multipoly)
+$$
+;
+
 create or replace function albion.mesh_boundarie(multipoly geometry)
 returns geometry
-language plpython3u immutable
+language sql immutable
 as
 $$
-    from shapely import wkb
-    from shapely.geometry import MultiLineString
-    from shapely import geos
-    geos.WKBWriter.defaults['include_srid'] = True
+    select st_geomfromewkb(albion.mesh_boundarie_wkb(st_asewkb(multipoly)))
+$$
+;
 
-    m = wkb.loads(bytes.fromhex(multipoly))
 
-    edges = set()
-    for p in m:
-        for s, e in zip(p.exterior.coords[:-1], p.exterior.coords[1:]):
-            if (e, s) in edges:
-                edges.remove((e, s))
-            else:
-                edges.add((s, e))
-    result = MultiLineString(list(edges))
-    geos.lgeos.GEOSSetSRID(result._geom, geos.lgeos.GEOSGetSRID(m._geom))
-    return result
+create or replace function albion.volume_union_wkb(multipoly bytea)
+returns bytea
+language plpython3u immutable
+as
+$$
+    if 'albion' not in SD:
+        plpy.execute("select albion.load_runtime()")
+        SD['albion'] = GD['albion']
+    return SD['albion'].volume_union_wkb(multipoly)
 $$
 ;
 
-
 create or replace function albion.volume_union(multipoly geometry)
 returns geometry
+language sql immutable
+as
+$$
+    select st_geomfromewkb(albion.volume_union_wkb(st_asewkb(multipoly)))
+$$
+;
+
+create or replace function albion.to_obj_wkb(multipoly bytea)
+returns varchar
 language plpython3u immutable
 as
 $$
-    from shapely import wkb
-    from shapely.geometry import Polygon, MultiPolygon, LineString, MultiLineString
-    from shapely import geos
-    geos.WKBWriter.defaults['include_srid'] = True
-
-    if multipoly is None:
-        return None
-
-    m = wkb.loads(bytes.fromhex(multipoly))
-
-    node_map = {}
-    triangles = []
-    vtx = []
-    for p in m:
-        t = []
-        for v in p.exterior.coords[:-1]:
-            v = (round(v[0], 6), round(v[1], 6), round(v[2], 6))
-            if v not in node_map:
-                node_map[v] = len(vtx)
-                vtx.append(v)
-            t.append(node_map[v])
-        triangles.append(t)
-
-    exterior = set()
-    for t in triangles:
-        rt = tuple(reversed(t))
-        if rt in exterior:
-            exterior.remove(rt)
-        elif (rt[1:]+rt[:1]) in exterior:
-            exterior.remove(rt[1:]+rt[:1])
-        elif (rt[2:]+rt[:2]) in exterior:
-            exterior.remove(rt[2:]+rt[:2])
-        else:
-            exterior.add(tuple(t))
-
-    result = MultiPolygon([Polygon([vtx[p] for p in t]) for t in exterior])
-
-    ## check for pairs of triangles with centroid less than 1cm appart
-    #suspects = []
-    #r = list(result)
-    #for i, p in enumerate(r):
-    #    for q in r[i+1:]:
-    #        if p.centroid.distance(q.centroid) < .01:
-    #            suspects.append(p)
-    #            suspects.append(q)
-    #rv = plpy.execute("SELECT albion.to_obj('{}'::geometry) as obj".format(MultiPolygon(suspects).wkb_hex))
-    #open("/tmp/unclosed_suspects.obj", 'w').write(rv[0]['obj'])
-
-
-    ## check generated volume is closed
-    #edges = set()
-    #for p in result:
-    #    for s, e in zip(p.exterior.coords[:-1], p.exterior.coords[1:]):
-    #        if (e, s) in edges:
-    #            edges.remove((e, s))
-    #        else:
-    #            edges.add((s, e))
-    #if (len(edges)):
-    #    rv = plpy.execute("SELECT albion.to_obj('{}'::geometry) as obj".format(result.wkb_hex))
-    #    open("/tmp/unclosed_volume.obj", 'w').write(rv[0]['obj'])
-
-    #    rv = plpy.execute("SELECT albion.to_vtk('{}'::geometry) as vtk".format(MultiLineString([LineString(e) for e in edges]).wkt))
-    #    open("/tmp/unclosed_border.vtk", 'w').write(rv[0]['vtk'])
-    #    plpy.error("elementary volume is not closed", edges)
-    #assert(len(edges)==0)
-
-    geos.lgeos.GEOSSetSRID(result._geom, geos.lgeos.GEOSGetSRID(m._geom))
-    return result.wkb_hex
+    if 'albion' not in SD:
+        plpy.execute("select albion.load_runtime()")
+        SD['albion'] = GD['albion']
+    return SD['albion'].to_obj_wkb(multipoly)
 $$
 ;
 
 create or replace function albion.to_obj(multipoly geometry)
 returns varchar
-language plpython3u immutable
+language sql immutable
 as
 $$
-    from shapely import wkb
-    if multipoly is None:
-        return ''
-    m = wkb.loads(bytes.fromhex(multipoly))
-    res = ""
-    node_map = {}
-    elem = []
-    n = 0
-    for p in m:
-        elem.append([])
-        for c in p.exterior.coords[:-1]:
-            sc = "%f %f %f" % (tuple(c))
-            if sc not in node_map:
-                res += "v {}\n".format(sc)
-                n += 1
-                node_map[sc] = n
-                elem[-1].append(str(n))
-            else:
-                elem[-1].append(str(node_map[sc]))
-    for e in elem:
-        res += "f {}\n".format(" ".join(e))
-    return res
+    select albion.to_obj_wkb(st_asewkb(multipoly))
 $$
 ;
 
-create or replace function albion.to_vtk(multiline geometry)
+create or replace function albion.to_vtk_wkb(multiline bytea)
 returns varchar
 language plpython3u immutable
 as
 $$
-    from shapely import wkb
-    if multiline is None:
-        return ''
-    m = wkb.loads(bytes.fromhex(multiline))
-    res = "# vtk DataFile Version 4.0\nvtk output\nASCII\nDATASET POLYDATA\n"
-    node_map = {}
-    nodes = ""
-    elem = []
-    n = 0
-    for l in m:
-        elem.append([])
-        for c in l.coords:
-            sc = "%f %f %f" % (tuple(c))
-            if sc not in node_map:
-                nodes += sc+"\n"
-                node_map[sc] = n
-                elem[-1].append(str(n))
-                n += 1
-            else:
-                elem[-1].append(str(node_map[sc]))
-
-    res += "POINTS {} float\n".format(len(node_map))
-    res += nodes
-
-    res += "\n"
-    res += "LINES {} {}\n".format(len(elem), sum([len(e)+1 for e in elem]))
+    if 'albion' not in SD:
+        plpy.execute("select albion.load_runtime()")
+        SD['albion'] = GD['albion']
+    return SD['albion'].to_vtk_wkb(multiline)
+$$
+;
 
-    for e in elem:
-        res += "{} {}\n".format(len(e), " ".join(e))
-    return res
+create or replace function albion.to_vtk(multiline geometry)
+returns varchar
+language sql immutable
+as
+$$
+    select albion.to_vtk_wkb(st_asewkb(multiline))
 $$
 ;
 
@@ -1312,35 +1582,24 @@ join _albion.hole as hs on hs.id=ns.hole_id
 join _albion.hole as he on he.id=ne.hole_id
 ;
 
-create or replace function albion.end_node_geom(node_geom_ geometry, collar_geom_ geometry, rel_distance real default .3, rel_thickness real default .3, nx real default null, ny real default null, nz real default null)
-returns geometry
+create or replace function albion.end_node_geom_wkb(node_geom_ bytea, collar_geom_ bytea, rel_distance real default .3, rel_thickness real default .3, nx real default null, ny real default null, nz real default null)
+returns bytea
 language plpython3u
 as
 $$
-    from numpy import array
-    from numpy import cross
-    from shapely import wkb
-    from shapely.geometry import LineString
-    from shapely import geos
-    from math import sqrt
-    geos.WKBWriter.defaults['include_srid'] = True
-
-    node_geom = wkb.loads(bytes.fromhex(node_geom_))
-    collar_geom = wkb.loads(bytes.fromhex(collar_geom_))
-
-    node_coords = array(node_geom.coords)
-    thickness = rel_thickness*abs(node_coords[0][2] - node_coords[1][2])
-    center = .5*(node_coords[0] + node_coords[1])
-    dir = array(collar_geom.coords[0]) - center
-    dir[2] = 0
-    dir *= rel_distance
-    dir = cross(array([nx, ny, nz]), cross(dir, array([0,0,1])))
-    top = center + dir + array([0,0,.5*thickness])
-    bottom = center + dir - array([0,0,.5*thickness])
-    result = LineString([tuple(top), tuple(bottom)])
+    if 'albion' not in SD:
+        plpy.execute("select albion.load_runtime()")
+        SD['albion'] = GD['albion']
+    return SD['albion'].end_node_geom_wkb(node_geom_, collar_geom_, rel_distance, rel_thickness, nx, ny, nz)
+$$
+;
 
-    geos.lgeos.GEOSSetSRID(result._geom, geos.lgeos.GEOSGetSRID(node_geom._geom))
-    return result.wkb_hex
+create or replace function albion.end_node_geom(node_geom_ geometry, collar_geom_ geometry, rel_distance real default .3, rel_thickness real default .3, nx real default null, ny real default null, nz real default null)
+returns geometry
+language sql
+as
+$$
+    select st_geomfromewkb(albion.end_node_geom_wkb(st_asewkb(node_geom_), st_asewkb(collar_geom_), rel_distance, rel_thickness, nx, ny, nz))
 $$
 ;
 
@@ -1481,8 +1740,9 @@ where not st_isempty(geom)
 
 
 
-create or replace view albion.dynamic_volume as
-with res as (
+-- inputs of the elementary volumes of each graph and cell, aggregated in a
+-- stable order for the volume cache hash
+create or replace view albion.volume_input as
 select
 c.id as cell_id, g.id as graph_id, ed.starts, ed.ends, nd.hole_ids as hole_ids, nd.ids as node_ids, nd.geoms as node_geoms, en.ids as end_ids, en.geoms as end_geoms, c.geom, ARRAY[ha.id, hb.id, hc.id] as holes, en.end_holes
 from  _albion.graph as g
@@ -1491,13 +1751,13 @@ join _albion.hole as ha on ha.id = c.a
 join _albion.hole as hb on hb.id = c.b
 join _albion.hole as hc on hc.id = c.c
 join lateral (
-    select coalesce(array_agg(n.id), '{}'::varchar[]) as ids, coalesce(array_agg(n.hole_id), '{}'::varchar[]) as hole_ids, coalesce(array_agg(n.geom), '{}'::geometry[]) as geoms
+    select coalesce(array_agg(n.id order by n.id), '{}'::varchar[]) as ids, coalesce(array_agg(n.hole_id order by n.id), '{}'::varchar[]) as hole_ids, coalesce(array_agg(n.geom order by n.id), '{}'::geometry[]) as geoms
     from _albion.node as n
     where n.hole_id in (ha.id, hb.id, hc.id)
     and n.graph_id=g.id
 ) as nd on true
 join lateral (
-    select coalesce(array_agg(e.start_), '{}'::varchar[]) as starts, coalesce(array_agg(e.end_), '{}'::varchar[]) as ends
+    select coalesce(array_agg(e.start_ order by e.id), '{}'::varchar[]) as starts, coalesce(array_agg(e.end_ order by e.id), '{}'::varchar[]) as ends
     from _albion.edge as e
     join _albion.node as ns on ns.id=e.start_
     join _albion.node as ne on ne.id=e.end_
@@ -1505,24 +1765,228 @@ join lateral (
     and e.graph_id=g.id
 ) as ed on true
 join lateral (
-    select coalesce(array_agg(en.node_id), '{}'::varchar[]) as ids, coalesce(array_agg(en.geom), '{}'::geometry[]) as geoms, coalesce(array_agg(en.hole_id), '{}'::varchar[]) as end_holes
+    select coalesce(array_agg(en.node_id order by en.id), '{}'::varchar[]) as ids, coalesce(array_agg(en.geom order by en.id), '{}'::geometry[]) as geoms, coalesce(array_agg(en.hole_id order by en.id), '{}'::varchar[]) as end_holes
     from _albion.end_node as en
     join _albion.node as n on n.id=en.node_id
     where en.hole_id in (c.a, c.b, c.c)
     and n.hole_id in (ha.id, hb.id, hc.id)
     and en.graph_id=g.id
 ) as en on true
-)
+;
+
+-- volumes computed on read, without the cache: Project.create_volumes and
+-- update_volumes use albion.cached_elementary_volumes on albion.volume_input
+create or replace view albion.dynamic_volume as
 select cell_id, graph_id, 
     t.geom::geometry('MULTIPOLYGONZ', $SRID), 
     t.face1::geometry('MULTIPOLYGONZ', $SRID), 
     t.face2::geometry('MULTIPOLYGONZ', $SRID),
     t.face3::geometry('MULTIPOLYGONZ', $SRID), 
     starts, ends, holes, hole_ids, node_ids, end_ids, end_geoms
-from res, albion.metadata m
+from albion.volume_input, albion.metadata m
 join  lateral albion.elementary_volumes(cell_id, graph_id, st_force3d(geom), holes, starts, ends, hole_ids, node_ids, node_geoms, end_ids, end_geoms, end_holes, m.end_node_relative_distance, m.end_node_relative_thickness) as t on true
 ;
 
+-- cells touched by node, edge or end node edits are marked as stale,
+-- so that Project.update_volumes only rebuilds those
+
+create or replace function albion.node_stale_volume_fct()
+returns trigger
+language plpgsql
+as
+$$
+    begin
+        if tg_op in ('INSERT', 'UPDATE') then
+            insert into _albion.stale_volume(graph_id, cell_id)
+            select distinct n.graph_id, c.id
+            from new_table as n
+            join _albion.graph as g on g.id=n.graph_id
+            join _albion.cell as c on n.hole_id in (c.a, c.b, c.c)
+            on conflict do nothing;
+        end if;
+        if tg_op in ('DELETE', 'UPDATE') then
+            insert into _albion.stale_volume(graph_id, cell_id)
+            select distinct n.graph_id, c.id
+            from old_table as n
+            join _albion.graph as g on g.id=n.graph_id
+            join _albion.cell as c on n.hole_id in (c.a, c.b, c.c)
+            on conflict do nothing;
+        end if;
+        return null;
+    end;
+$$
+;
+
+drop trigger if exists node_stale_volume_insert_trig on _albion.node
+;
+
+create trigger node_stale_volume_insert_trig
+    after insert on _albion.node
+    referencing new table as new_table
+       for each statement execute procedure albion.node_stale_volume_fct()
+;
+
+drop trigger if exists node_stale_volume_update_trig on _albion.node
+;
+
+create trigger node_stale_volume_update_trig
+    after update on _albion.node
+    referencing old table as old_table new table as new_table
+       for each statement execute procedure albion.node_stale_volume_fct()
+;
+
+drop trigger if exists node_stale_volume_delete_trig on _albion.node
+;
+
+create trigger node_stale_volume_delete_trig
+    after delete on _albion.node
+    referencing old table as old_table
+       for each statement execute procedure albion.node_stale_volume_fct()
+;
+
+create or replace function albion.edge_stale_volume_fct()
+returns trigger
+language plpgsql
+as
+$$
+    begin
+        if tg_op in ('INSERT', 'UPDATE') then
+            insert into _albion.stale_volume(graph_id, cell_id)
+            select distinct e.graph_id, c.id
+            from new_table as e
+            join _albion.graph as g on g.id=e.graph_id
+            join _albion.node as ns on ns.id=e.start_
+            join _albion.node as ne on ne.id=e.end_
+            join _albion.cell as c on ns.hole_id in (c.a, c.b, c.c) and ne.hole_id in (c.a, c.b, c.c)
+            on conflict do nothing;
+        end if;
+        if tg_op in ('DELETE', 'UPDATE') then
+            -- when the nodes are gone, their own trigger marked the cells
+            insert into _albion.stale_volume(graph_id, cell_id)
+            select distinct e.graph_id, c.id
+            from old_table as e
+            join _albion.graph as g on g.id=e.graph_id
+            join _albion.node as ns on ns.id=e.start_
+            join _albion.node as ne on ne.id=e.end_
+            join _albion.cell as c on ns.hole_id in (c.a, c.b, c.c) and ne.hole_id in (c.a, c.b, c.c)
+            on conflict do nothing;
+        end if;
+        return null;
+    end;
+$$
+;
+
+drop trigger if exists edge_stale_volume_insert_trig on _albion.edge
+;
+
+create trigger edge_stale_volume_insert_trig
+    after insert on _albion.edge
+    referencing new table as new_table
+       for each statement execute procedure albion.edge_stale_volume_fct()
+;
+
+drop trigger if exists edge_stale_volume_update_trig on _albion.edge
+;
+
+create trigger edge_stale_volume_update_trig
+    after update on _albion.edge
+    referencing old table as old_table new table as new_table
+       for each statement execute procedure albion.edge_stale_volume_fct()
+;
+
+drop trigger if exists edge_stale_volume_delete_trig on _albion.edge
+;
+
+create trigger edge_stale_volume_delete_trig
+    after delete on _albion.edge
+    referencing old table as old_table
+       for each statement execute procedure albion.edge_stale_volume_fct()
+;
+
+create or replace function albion.end_node_stale_volume_fct()
+returns trigger
+language plpgsql
+as
+$$
+    begin
+        if tg_op in ('INSERT', 'UPDATE') then
+            insert into _albion.stale_volume(graph_id, cell_id)
+            select distinct en.graph_id, c.id
+            from new_table as en
+            join _albion.graph as g on g.id=en.graph_id
+            join _albion.cell as c on en.hole_id in (c.a, c.b, c.c)
+            on conflict do nothing;
+        end if;
+        if tg_op in ('DELETE', 'UPDATE') then
+            insert into _albion.stale_volume(graph_id, cell_id)
+            select distinct en.graph_id, c.id
+            from old_table as en
+            join _albion.graph as g on g.id=en.graph_id
+            join _albion.cell as c on en.hole_id in (c.a, c.b, c.c)
+            on conflict do nothing;
+        end if;
+        return null;
+    end;
+$$
+;
+
+drop trigger if exists end_node_stale_volume_insert_trig on _albion.end_node
+;
+
+create trigger end_node_stale_volume_insert_trig
+    after insert on _albion.end_node
+    referencing new table as new_table
+       for each statement execute procedure albion.end_node_stale_volume_fct()
+;
+
+drop trigger if exists end_node_stale_volume_update_trig on _albion.end_node
+;
+
+create trigger end_node_stale_volume_update_trig
+    after update on _albion.end_node
+    referencing old table as old_table new table as new_table
+       for each statement execute procedure albion.end_node_stale_volume_fct()
+;
+
+drop trigger if exists end_node_stale_volume_delete_trig on _albion.end_node
+;
+
+create trigger end_node_stale_volume_delete_trig
+    after delete on _albion.end_node
+    referencing old table as old_table
+       for each statement execute procedure albion.end_node_stale_volume_fct()
+;
+
+-- clients caching metadata and layers listen on the albion_metadata channel
+create or replace function albion.metadata_notify_fct()
+returns trigger
+language plpgsql
+as
+$$
+    begin
+        perform pg_notify('albion_metadata', tg_table_name);
+        return null;
+    end;
+$$
+;
+
+drop trigger if exists metadata_notify_trig on _albion.metadata
+;
+
+create trigger metadata_notify_trig
+    after insert or update or delete or truncate on _albion.metadata
+       for each statement execute procedure albion.metadata_notify_fct()
+;
+
+drop trigger if exists layer_notify_trig on _albion.layer
+;
+
+create trigger layer_notify_trig
+    after insert or update or delete or truncate on _albion.layer
+       for each statement execute procedure albion.metadata_notify_fct()
+;
+
+
 
 --select albion.to_obj(albion.elementary_volumes(
 --        '{a, b, a}'::varchar[],
@@ -1566,28 +2030,24 @@ join  lateral albion.elementary_volumes(cell_id, graph_id, st_force3d(geom), hol
 --;
 
 -- collect triangles of neighbor elementary volumes
-create or replace function albion.triangle_intersection(t1_ geometry, t2_ geometry)
-returns geometry
+create or replace function albion.triangle_intersection_wkb(t1_ bytea, t2_ bytea)
+returns bytea
 language plpython3u immutable
 as
 $$
-    from shapely import geos
-    from shapely.geometry import MultiPolygon, Polygon
-    from shapely import wkb
-    import numpy
-    import plpy
-    geos.WKBWriter.defaults['include_srid'] = True
-    t1 = wkb.loads(bytes.fromhex(t1_))
-    t2 = wkb.loads(bytes.fromhex(t2_))
-
-    t1s = set((tuple(t.exterior.coords[0:3]) for t in t1))
-    t2s = set((tuple(reversed(t.exterior.coords[0:3])) for t in t2))
+    if 'albion' not in SD:
+        plpy.execute("select albion.load_runtime()")
+        SD['albion'] = GD['albion']
+    return SD['albion'].triangle_intersection_wkb(t1_, t2_)
+$$
+;
 
-    result = MultiPolygon([ Polygon(t) for t in t1s.intersection(t2s)])
-    if not len(result):
-        return None
-    geos.lgeos.GEOSSetSRID(result._geom, geos.lgeos.GEOSGetSRID(t1._geom))
-    return result.wkb_hex
+create or replace function albion.triangle_intersection(t1_ geometry, t2_ geometry)
+returns geometry
+language sql immutable
+as
+$$
+    select st_geomfromewkb(albion.triangle_intersection_wkb(st_asewkb(t1_), st_asewkb(t2_)))
 $$
 ;
 
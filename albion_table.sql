@@ -35,23 +35,143 @@ create trigger ${NAME}_instead_trig
        for each row execute procedure albion.${NAME}_instead_fct()
 ;
 
-create materialized view albion.${NAME}_section_geom_cache as
-select s.id as section_id, h.id as hole_id, t.id as ${NAME}_id,
-    (albion.to_section(
-            st_makeline(st_3dlineinterpolatepoint(h.geom, least(t.from_/h.depth_, 1)), 
-                        st_3dlineinterpolatepoint(h.geom, least(t.to_/h.depth_, 1)))
-                , s.anchor, s.scale)) as geom,
-        st_startpoint(h.geom) as collar
-from _albion.section as s, _albion.${NAME} as t
-join _albion.hole as h on h.id=t.hole_id
+-- projection on the sections of the intervals of holes whose collar is on the
+-- section, maintained by the triggers on _albion.${NAME} and _albion.section
+-- and by albion.hole_geom_changed
+create table albion.${NAME}_section_geom_cache(
+    section_id varchar not null references _albion.section(id) on delete cascade on update cascade,
+    hole_id varchar not null references _albion.hole(id) on delete cascade on update cascade,
+    ${NAME}_id varchar not null references _albion.${NAME}(id) on delete cascade on update cascade,
+    geom geometry,
+    collar geometry,
+    primary key (section_id, ${NAME}_id)
+)
 ;
 
 create index ${NAME}_section_geom_cache_${NAME}_id_idx on albion.${NAME}_section_geom_cache(${NAME}_id)
 ;
 
+create index ${NAME}_section_geom_cache_hole_id_idx on albion.${NAME}_section_geom_cache(hole_id)
+;
+
 create index ${NAME}_section_geom_cache_colar_idx on albion.${NAME}_section_geom_cache using gist(collar)
 ;
 
+-- the data table is kept between schema updates
+create index if not exists ${NAME}_hole_id_idx on _albion.${NAME}(hole_id)
+;
+
+-- recompute the cache rows of the given sections, intervals and holes
+create or replace function albion.${NAME}_section_geom_cache_refresh(section_ids_ varchar[], ids_ varchar[], hole_ids_ varchar[])
+returns void
+language plpgsql volatile
+as
+$$$$
+    begin
+        delete from albion.${NAME}_section_geom_cache
+        where section_id = any(section_ids_) or ${NAME}_id = any(ids_) or hole_id = any(hole_ids_);
+
+        insert into albion.${NAME}_section_geom_cache(section_id, hole_id, ${NAME}_id, geom, collar)
+        with on_section as (
+            select s.id as section_id, h.id as hole_id
+            from _albion.section as s
+            join _albion.hole as h on s.geom && h.geom and st_intersects(st_startpoint(h.geom), s.geom)
+            where s.id = any(section_ids_)
+            union
+            select s.id, h.id
+            from _albion.hole as h
+            join _albion.section as s on s.geom && h.geom and st_intersects(st_startpoint(h.geom), s.geom)
+            where h.id = any(hole_ids_) or h.id in (select hole_id from _albion.${NAME} where id = any(ids_))
+        ),
+        pair as (
+            select o.section_id, t.id as ${NAME}_id
+            from on_section as o
+            join _albion.${NAME} as t on t.hole_id = o.hole_id
+            where o.section_id = any(section_ids_) or o.hole_id = any(hole_ids_) or t.id = any(ids_)
+        )
+        select s.id, h.id, t.id,
+            albion.to_section(
+                st_makeline(st_3dlineinterpolatepoint(h.geom, least(t.from_/h.depth_, 1)),
+                            st_3dlineinterpolatepoint(h.geom, least(t.to_/h.depth_, 1)))
+                    , s.anchor, s.scale),
+            st_startpoint(h.geom)
+        from pair as p
+        join _albion.section as s on s.id = p.section_id
+        join _albion.${NAME} as t on t.id = p.${NAME}_id
+        join _albion.hole as h on h.id = t.hole_id;
+    end;
+$$$$
+;
+
+select albion.${NAME}_section_geom_cache_refresh(array(select id from _albion.section), null, null)
+;
+
+-- deletions are cascaded by the foreign keys
+create or replace function albion.${NAME}_section_geom_cache_fct()
+returns trigger
+language plpgsql
+as
+$$$$
+    begin
+        if tg_table_name = 'section' and tg_op = 'INSERT' then
+            perform albion.${NAME}_section_geom_cache_refresh(array(select id from new_table), null, null);
+        elsif tg_table_name = 'section' then
+            -- only a change of projection or of the holes on the section requires an update
+            perform albion.${NAME}_section_geom_cache_refresh(array(
+                select n.id from new_table as n
+                where not exists (
+                    select 1 from old_table as o
+                    where o.id=n.id and o.anchor=n.anchor and o.scale=n.scale
+                    and o.geom is not distinct from n.geom)), null, null);
+        elsif tg_op = 'INSERT' then
+            perform albion.${NAME}_section_geom_cache_refresh(null, array(select id from new_table), null);
+        else
+            perform albion.${NAME}_section_geom_cache_refresh(null, array(
+                select n.id from new_table as n
+                where not exists (
+                    select 1 from old_table as o
+                    where o.id=n.id and o.hole_id=n.hole_id and o.from_=n.from_ and o.to_=n.to_)), null);
+        end if;
+        return null;
+    end;
+$$$$
+;
+
+drop trigger if exists ${NAME}_section_geom_cache_insert_trig on _albion.${NAME}
+;
+
+create trigger ${NAME}_section_geom_cache_insert_trig
+    after insert on _albion.${NAME}
+    referencing new table as new_table
+       for each statement execute procedure albion.${NAME}_section_geom_cache_fct()
+;
+
+drop trigger if exists ${NAME}_section_geom_cache_update_trig on _albion.${NAME}
+;
+
+create trigger ${NAME}_section_geom_cache_update_trig
+    after update on _albion.${NAME}
+    referencing old table as old_table new table as new_table
+       for each statement execute procedure albion.${NAME}_section_geom_cache_fct()
+;
+
+drop trigger if exists ${NAME}_section_geom_cache_section_insert_trig on _albion.section
+;
+
+create trigger ${NAME}_section_geom_cache_section_insert_trig
+    after insert on _albion.section
+    referencing new table as new_table
+       for each statement execute procedure albion.${NAME}_section_geom_cache_fct()
+;
+
+drop trigger if exists ${NAME}_section_geom_cache_section_update_trig on _albion.section
+;
+
+create trigger ${NAME}_section_geom_cache_section_update_trig
+    after update on _albion.section
+    referencing old table as old_table new table as new_table
+       for each statement execute procedure albion.${NAME}_section_geom_cache_fct()
+;
 
 create view albion.${NAME}_section as
 select row_number() over() as id, t.id as ${NAME}_id, sc.section_id, t.hole_id, sc.geom::geometry('LINESTRING', ${SRID}), ${T_FIELDS}
@@ -0,0 +1,126 @@
+# coding = utf-8
+"""
+benchmarks of the volume reconstruction pipeline
+
+The plpython functions of albion.sql are run outside of the database: they
+dispatch to the functions of the runtime module, which are called directly.
+"""
+
+import os
+import glob
+import time
+import math
+import struct
+import random
+import tracemalloc
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), '..', 'elementary_volume', 'test_data')
+
+def read_test_data():
+    "cell inputs of elementary_volume/test_data"
+    cells = []
+    for filename in sorted(glob.glob(os.path.join(TEST_DATA, '*.txt'))):
+        with open(filename) as f:
+            lines = [f.readline().rstrip() for i in range(12)]
+        cells.append([l.split() for l in lines[3:]])
+    return cells
+
+def linestringz_ewkb_hex(a, b, srid):
+    return (struct.pack('<BIII', 1, 0xA0000002, srid, 2) + struct.pack('<6d', *(a+b))).hex().upper()
+
+def synthetic_grid(nb_holes, nb_layers=4, spacing=50., srid=32632, seed=0):
+    """elementary_volumes inputs of the cells of a regular grid of holes, each hole
+    crosses nb_layers layers with smoothly varying thicknesses, all nodes of the
+    same layer are connected by edges"""
+    rnd = random.Random(seed)
+    side = int(math.ceil(math.sqrt(nb_holes)))
+    holes = {}
+    for i in range(side):
+        for j in range(side):
+            if len(holes) < nb_holes:
+                holes[(i, j)] = 'h{}_{}'.format(i, j)
+
+    nodes = {}
+    for (i, j), h in holes.items():
+        x, y = 1000 + i*spacing, 2000 + j*spacing
+        z = 100 + 5*math.sin(.1*i) + 5*math.cos(.1*j)
+        for l in range(nb_layers):
+            thickness = 5 + 2*math.sin(.3*i+l) + 2*math.cos(.2*j+l) + rnd.random()
+            nodes[(h, l)] = ('{}_{}'.format(h, l), linestringz_ewkb_hex((x, y, z), (x, y, z-thickness), srid))
+            z -= thickness + 1 + rnd.random()
+
+    cells = []
+    for (i, j) in holes:
+        for tri in (((i, j), (i+1, j), (i, j+1)), ((i+1, j), (i+1, j+1), (i, j+1))):
+            if all(t in holes for t in tri):
+                cell_holes = [holes[t] for t in tri]
+                hole_ids, node_ids, node_geoms, starts, ends = [], [], [], [], []
+                for l in range(nb_layers):
+                    for h in cell_holes:
+                        hole_ids.append(h)
+                        node_ids.append(nodes[(h, l)][0])
+                        node_geoms.append(nodes[(h, l)][1])
+                    for a, b in ((0, 1), (1, 2), (0, 2)):
+                        starts.append(nodes[(cell_holes[a], l)][0])
+                        ends.append(nodes[(cell_holes[b], l)][0])
+                cells.append([cell_holes, starts, ends, hole_ids, node_ids, node_geoms, [], [], []])
+    return cells
+
+def synthetic_radiometry(nb_holes, depth=100., measure_thickness=.1, seed=0):
+    "gamma logs with a few mineralized intervals, as segmentation arguments"
+    rnd = random.Random(seed)
+    logs = []
+    n = int(round(depth/measure_thickness))
+    for h in range(nb_holes):
+        radiometry = [rnd.expovariate(1./50) for i in range(n)]
+        for k in range(3):
+            start = rnd.randrange(n)
+            for i in range(start, min(n, start+rnd.randrange(10, 100))):
+                radiometry[i] += rnd.uniform(200, 2000)
+        from_ = [i*measure_thickness for i in range(n)]
+        to_ = [(i+1)*measure_thickness for i in range(n)]
+        logs.append((radiometry, from_, to_))
+    return logs
+
+def measure(function, items, memory=False):
+    """run function on all items, returns the number of items, the elapsed time
+    and, with memory, the peak of python allocations (in a second pass
+    since tracing allocations slows everything down)"""
+    start = time.perf_counter()
+    for item in items:
+        function(item)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if memory:
+        tracemalloc.start()
+        for item in items:
+            function(item)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {'items': len(items), 'time': elapsed, 'throughput': len(items)/elapsed if elapsed else float('inf'), 'peak_memory': peak}
+
+def run(sizes=(100, 1000, 10000), nb_layers=4, memory=False):
+    """benchmarks of the volume pipeline on test_data and on synthetic grids
+    of increasing number of holes, yields a result dict per benchmark and size"""
+    from ..elementary_volume import elementary_volumes
+    from ..runtime import volume_of_geom_wkb, is_closed_volume_wkb, volume_union_wkb, to_obj_wkb
+    from ..segmentation import segmentation
+
+    for name, size in [('test_data', None)] + [('grid', size) for size in sizes]:
+        cells = read_test_data() if size is None else synthetic_grid(size, nb_layers)
+        volumes = []
+        def elementary(cell):
+            volumes.extend(v[0] for v in elementary_volumes(*cell, binary=True) if v[0][9:13] != b'\0\0\0\0')
+        result = measure(elementary, cells, memory)
+        # the second pass for memory adds the same volumes again
+        volumes = volumes[:len(volumes)//(2 if memory else 1)]
+        yield dict(result, benchmark='elementary_volumes', dataset=name, holes=size)
+
+        for function in (volume_union_wkb, is_closed_volume_wkb, volume_of_geom_wkb, to_obj_wkb):
+            yield dict(measure(function, volumes, memory),
+                    benchmark=function.__name__, dataset=name, holes=size)
+
+        if size is not None:
+            logs = synthetic_radiometry(size)
+            yield dict(measure(lambda log: segmentation(log[0], log[1], log[2], 1., 1., 500.), logs, memory),
+                    benchmark='segmentation', dataset=name, holes=size)
@@ -0,0 +1,74 @@
+"""
+benchmark of the volume reconstruction pipeline
+
+USAGE
+    python -m albion.benchmark [-h] [-m] [-s sizes] [-l layers] [-o report.json]
+
+    runs elementary_volumes and the plpython helpers volume_union_wkb,
+    is_closed_volume_wkb, volume_of_geom_wkb, to_obj_wkb and segmentation on
+    the elementary_volume/test_data cells and on synthetic grids of holes.
+
+    For each benchmark and dataset, prints the throughput (items per second)
+    and the time per item relative to the smallest grid (scaling).
+
+OPTIONS
+    -h, --help
+        print this help
+
+    -s, --sizes 100,1000,10000
+        comma separated numbers of holes of the synthetic grids
+
+    -l, --layers N
+        number of layers crossed by each hole of the grids, defaults to 4
+
+    -m, --memory
+        also measure the peak of python allocations (runs everything twice)
+
+    -o, --output report.json
+        write the results in a json file
+"""
+
+import sys
+import json
+import getopt
+from . import run
+
+try:
+    optlist, args = getopt.getopt(sys.argv[1:],
+            "hms:l:o:",
+            ["help", "memory", "sizes=", "layers=", "output="])
+except Exception as e:
+    sys.stderr.write(str(e)+"\n")
+    exit(1)
+
+optlist = dict(optlist)
+
+if "-h" in optlist or "--help" in optlist:
+    help(sys.modules[__name__])
+    exit(0)
+
+sizes = [int(s) for s in optlist.get('-s', optlist.get('--sizes', '100,1000,10000')).split(',')]
+layers = int(optlist.get('-l', optlist.get('--layers', 4)))
+memory = '-m' in optlist or '--memory' in optlist
+output = optlist.get('-o', optlist.get('--output'))
+
+print("{:<20} {:<10} {:>6} {:>8} {:>10} {:>12} {:>10} {:>8}".format(
+    'benchmark', 'dataset', 'holes', 'items', 'time (s)', 'items/s', 'peak (MB)', 'scaling'))
+results = []
+reference = {}
+for r in run(sizes, layers, memory):
+    per_item = r['time']/r['items'] if r['items'] else 0
+    if r['holes'] is not None and r['benchmark'] not in reference:
+        reference[r['benchmark']] = per_item
+    r['scaling'] = per_item/reference[r['benchmark']] \
+        if r['holes'] is not None and reference[r['benchmark']] else None
+    results.append(r)
+    print("{:<20} {:<10} {:>6} {:>8} {:>10.3f} {:>12.1f} {:>10} {:>8}".format(
+        r['benchmark'], r['dataset'], r['holes'] or '', r['items'], r['time'], r['throughput'],
+        '{:.2f}'.format(r['peak_memory']/1e6) if r['peak_memory'] is not None else '',
+        '{:.2f}'.format(r['scaling']) if r['scaling'] is not None else ''))
+    sys.stdout.flush()
+
+if output:
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
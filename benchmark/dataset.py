@@ -0,0 +1,156 @@
+# coding = utf-8
+"""
+synthetic drillhole dataset in the format of Project.import_data
+
+USAGE
+    python -m albion.benchmark.dataset [-h] [-n holes] [-s spacing] [-d deviation]
+        [-l layers] [-i interval] [-D depth] [-r seed] directory
+
+    writes collar, deviation, avp, formation, lithology and resistivity files
+    (semicolon separated, with header) in directory.
+
+    Holes are on a square grid with some jitter, formations are layers with
+    smoothly varying thicknesses over the grid, the gamma log (avp) has a
+    mineralized level in the middle layer.
+
+OPTIONS
+    -h, --help
+        print this help
+
+    -n, --holes N
+        number of holes, defaults to 100
+
+    -s, --spacing S
+        distance between holes in meters, defaults to 50
+
+    -d, --deviation D
+        maximum deviation of holes from the vertical in degrees, defaults to 2
+
+    -l, --layers N
+        number of formation layers, defaults to 5
+
+    -i, --interval I
+        sample interval of avp and resistivity logs in meters, defaults to .1
+
+    -D, --depth D
+        mean depth of holes in meters, defaults to 100
+
+    -r, --seed S
+        random seed, defaults to 0
+"""
+
+import os
+import math
+import random
+
+
+def generate(directory, nb_holes=100, spacing=50., deviation=2., nb_layers=5,
+        interval=.1, depth=100., seed=0, origin=(500000., 5000000., 100.)):
+    "write the dataset files in directory, returns the list of written files"
+    rnd = random.Random(seed)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    side = int(math.ceil(math.sqrt(nb_holes)))
+    holes = []
+    for k in range(nb_holes):
+        i, j = k // side, k % side
+        x = origin[0] + i*spacing + rnd.uniform(-.2, .2)*spacing
+        y = origin[1] + j*spacing + rnd.uniform(-.2, .2)*spacing
+        z = origin[2] + 5*math.sin(i*spacing/500.) + 5*math.cos(j*spacing/700.)
+        holes.append(('SYNT_{:05d}_1'.format(k), i, j, x, y, z, depth*rnd.uniform(.9, 1.1)))
+
+    def layer_bounds(i, j, hole_depth):
+        "depths of the layer interfaces, the last layer goes to the end of hole"
+        bounds = [0.]
+        for l in range(nb_layers - 1):
+            thickness = hole_depth/nb_layers*(1 + .3*math.sin(.07*i*spacing/50. + l) + .3*math.cos(.05*j*spacing/50. + 2*l))
+            bounds.append(min(bounds[-1] + thickness, hole_depth))
+        bounds.append(hole_depth)
+        return bounds
+
+    filenames = [os.path.join(directory, 'synthetic_{}.txt'.format(name))
+            for name in ('collar', 'deviation', 'avp', 'formation', 'lithology', 'resi')]
+    collar, deviation_, avp, formation, lithology, resistivity = [open(f, 'w') for f in filenames]
+
+    collar.write("id;x;y;z;depth_;date_;comments\n")
+    deviation_.write("hole_id;depth;dip;azimuth\n")
+    avp.write("holeid;from;to;AVP\n")
+    formation.write("hole_id;from;to;code;comments\n")
+    lithology.write("holeid;from;to;code;comment\n")
+    resistivity.write("holeid;from;to;rho\n")
+
+    for id_, i, j, x, y, z, hole_depth in holes:
+        collar.write("{};{:.2f};{:.2f};{:.2f};{:.2f};{:02d}/{:02d}/{};RAS\n".format(
+            id_, x, y, z, hole_depth, rnd.randint(1, 28), rnd.randint(1, 12), rnd.randint(2010, 2020)))
+
+        # one station every 10m above the end of hole (at the written precision)
+        # and one at the end of hole, the dip drifts from the vertical up to the max deviation
+        azimuth = rnd.uniform(0, 360)
+        dip = -90.
+        stations = [station*10. for station in range(1, int(hole_depth//10) + 1)
+            if round(station*10., 2) < round(hole_depth, 2)] + [hole_depth]
+        for station in stations:
+            dip = max(-90., min(-90. + deviation, dip + rnd.uniform(-.3, .5)*deviation))
+            azimuth = (azimuth + rnd.uniform(-5, 5)) % 360
+            deviation_.write("{};{:.2f};{:.2f};{:.2f}\n".format(id_, station, dip, azimuth))
+
+        bounds = layer_bounds(i, j, hole_depth)
+        for l, (from_, to_) in enumerate(zip(bounds[:-1], bounds[1:])):
+            if to_ > from_:
+                code = 100*(l+1)
+                formation.write("{};{:.2f};{:.2f};{};Formation_{}\n".format(id_, from_, to_, code, l))
+                # lithology subdivides formations
+                cuts = sorted(rnd.uniform(from_, to_) for c in range(rnd.randint(0, 3)))
+                for f, t in zip([from_]+cuts, cuts+[to_]):
+                    lithology.write("{};{:.2f};{:.2f};{};Lithology_{}\n".format(id_, f, t, code + rnd.randint(0, 3)*10, l))
+
+        # mineralized level in the middle layer
+        mineral_layer = nb_layers // 2
+        ore_from = bounds[mineral_layer] + .3*(bounds[mineral_layer+1] - bounds[mineral_layer])
+        ore_to = ore_from + rnd.uniform(.5, 3.)
+        ore_grade = rnd.expovariate(1./1000)
+        nb_samples = int(hole_depth/interval)
+        for s in range(nb_samples):
+            from_, to_ = s*interval, (s+1)*interval
+            gamma = rnd.expovariate(1./50) + (ore_grade if ore_from <= from_ < ore_to else 0)
+            layer = next(l for l in range(nb_layers) if from_ < bounds[l+1] or l == nb_layers-1)
+            rho = 20*(layer+1)*rnd.uniform(.8, 1.2)
+            avp.write("{};{:.2f};{:.2f};{:.2f}\n".format(id_, from_, to_, gamma))
+            resistivity.write("{};{:.2f};{:.2f};{:.2f}\n".format(id_, from_, to_, rho))
+
+    for f in (collar, deviation_, avp, formation, lithology, resistivity):
+        f.close()
+    return filenames
+
+
+if __name__ == "__main__":
+    import sys
+    import getopt
+
+    try:
+        optlist, args = getopt.getopt(sys.argv[1:],
+                "hn:s:d:l:i:D:r:",
+                ["help", "holes=", "spacing=", "deviation=", "layers=", "interval=", "depth=", "seed="])
+    except Exception as e:
+        sys.stderr.write(str(e)+"\n")
+        exit(1)
+
+    optlist = dict(optlist)
+
+    if "-h" in optlist or "--help" in optlist or len(args) != 1:
+        help(sys.modules[__name__])
+        exit(0)
+
+    def option(short, long_, default):
+        return optlist.get(short, optlist.get(long_, default))
+
+    for f in generate(args[0],
+            nb_holes=int(option('-n', '--holes', 100)),
+            spacing=float(option('-s', '--spacing', 50)),
+            deviation=float(option('-d', '--deviation', 2)),
+            nb_layers=int(option('-l', '--layers', 5)),
+            interval=float(option('-i', '--interval', .1)),
+            depth=float(option('-D', '--depth', 100)),
+            seed=int(option('-r', '--seed', 0))):
+        print(f)
@@ -0,0 +1,101 @@
+# coding = utf-8
+"""
+desurvey of drillholes, i.e. computation of hole trajectories from collars
+and deviation surveys, vectorized over all holes
+
+this is the same computation as albion.hole_geoms: stations are sorted by
+(hole_id, from_), the hole is assumed vertical above the first station, holes
+shorter than their depth are extended along their last segment and holes
+without deviation are vertical
+"""
+
+from numpy import (asarray, lexsort, searchsorted, argsort, flatnonzero, cumsum, concatenate,
+    sin, cos, tan, arccos, clip, where, radians, ones, zeros, float64)
+from numpy.linalg import norm
+
+BALANCED_TANGENTIAL = 'balanced_tangential'
+MINIMUM_CURVATURE = 'minimum_curvature'
+
+def ratio_factor(wd1, haz1, wd2, haz2):
+    "minimum curvature ratio factor of the dogleg angles between stations"
+    dogleg = arccos(clip(cos(wd2 - wd1) - sin(wd1)*sin(wd2)*(1 - cos(haz2 - haz1)), -1, 1))
+    safe = where(dogleg > 1e-9, dogleg, 1)
+    return where(dogleg > 1e-9, 2/safe*tan(safe/2), 1)
+
+def desurvey(collar_id, x, y, z, depth, hole_id, from_, dip, azimuth, method=BALANCED_TANGENTIAL):
+    """trajectories of holes
+
+    collar_id, x, y, z, depth: collars (one entry per hole)
+    hole_id, from_, dip, azimuth: deviation stations, in any order, dip in
+        degrees from the horizontal (-90 is vertical downward), azimuth in degrees
+    method: BALANCED_TANGENTIAL or MINIMUM_CURVATURE
+
+    returns the list of (collar_id, array of points) in collar order
+    """
+    collar_id = asarray(collar_id)
+    if not len(collar_id):
+        return []
+    collar = concatenate([asarray(c, dtype=float64)[:, None] for c in (x, y, z)], axis=1)
+    depth = asarray(depth, dtype=float64)
+    hole_id = asarray(hole_id)
+    from_, dip, azimuth = [asarray(c, dtype=float64) for c in (from_, dip, azimuth)]
+
+    valid = (azimuth >= 0) & (azimuth <= 360) & (dip < 0) & (dip > -180)
+    hole_id, from_, dip, azimuth = hole_id[valid], from_[valid], dip[valid], azimuth[valid]
+
+    # hole index of the stations, stations of unknown holes are ignored
+    sorted_collars = argsort(collar_id, kind='stable')
+    idx = searchsorted(collar_id[sorted_collars], hole_id)
+    idx[idx == len(collar_id)] = 0
+    known = collar_id[sorted_collars][idx] == hole_id
+    hole = sorted_collars[idx[known]]
+    from_, dip, azimuth = from_[known], dip[known], azimuth[known]
+
+    order = lexsort((from_, hole))
+    hole, md2, wd2, haz2 = hole[order], from_[order], radians(dip[order] + 90), radians(azimuth[order])
+    first = ones(len(hole), dtype=bool)
+    first[1:] = hole[1:] != hole[:-1]
+
+    # previous station, the collar with a vertical direction for the first one
+    md1, wd1, haz1 = zeros(len(hole)), zeros(len(hole)), zeros(len(hole))
+    md1[1:], wd1[1:], haz1[1:] = md2[:-1], wd2[:-1], haz2[:-1]
+    md1[first], wd1[first], haz1[first] = 0, 0, 0
+
+    rf = ratio_factor(wd1, haz1, wd2, haz2) if method == MINIMUM_CURVATURE else ones(len(hole))
+    half = 0.5*(md2 - md1)*rf
+    step = concatenate([
+        (half*(sin(wd1)*sin(haz1) + sin(wd2)*sin(haz2)))[:, None],
+        (half*(sin(wd1)*cos(haz1) + sin(wd2)*cos(haz2)))[:, None],
+        (-half*(cos(wd2) + cos(wd1)))[:, None]], axis=1)
+
+    # cumulative sums restarted at the first station of each hole
+    total = cumsum(step, axis=0)
+    starts = flatnonzero(first)
+    before = zeros((len(starts), 3))
+    before[1:] = total[starts[1:] - 1]
+    counts = concatenate([starts[1:], [len(hole)]]) - starts
+    points = collar[hole] + total - before.repeat(counts, axis=0)
+
+    stations = {hole[s]: points[s:s+c] for s, c in zip(starts, counts)}
+    result = []
+    for h in range(len(collar_id)):
+        result.append((collar_id[h], trajectory(collar[h], stations.get(h), depth[h])))
+    return result
+
+def trajectory(collar, stations, depth):
+    "line from the collar through the stations, extended or vertical to reach depth"
+    if stations is not None:
+        line = concatenate([collar[None, :], stations])
+        # remove repeated points
+        keep = ones(len(line), dtype=bool)
+        keep[1:] = norm(line[1:] - line[:-1], axis=1) > 1e-6
+        line = line[keep]
+        length = norm(line[1:] - line[:-1], axis=1).sum()
+        if 0 < length < depth:
+            direction = (line[-1] - line[-2])/norm(line[-1] - line[-2])
+            return concatenate([line, [line[-1] + (depth - length)*direction]])
+        if length > 0:
+            return line
+    end = collar.copy()
+    end[2] -= depth
+    return concatenate([collar[None, :], end[None, :]])
@@ -8,9 +8,10 @@ import os
 import random
 from itertools import combinations
 from math import pi as PI, inf as INF, sin
-from numpy import array, cross, argmin, argmax, dot, average
+from numpy import array, cross, argmin, argmax, dot, average, sqrt, einsum, triu_indices, stack, around, zeros, float64, int32
 from numpy.linalg import norm
 from collections import defaultdict
+import struct
 from itertools import product
 from shapely.geometry import MultiPolygon, Polygon, LineString, MultiLineString, Point, MultiPoint
 from shapely import wkb
@@ -22,10 +23,14 @@ geos.WKBWriter.defaults['include_srid'] = True
 
 from fourmy import tessellate
 
+def loads(geom):
+    "shapely geometry from EWKB, either binary or hex encoded"
+    return wkb.loads(geom if isinstance(geom, bytes) else bytes.fromhex(geom))
+
 def to_vtk(multiline):
     if multiline is None:
         return ''
-    m = wkb.loads(bytes.fromhex(multiline))
+    m = loads(multiline)
     res = "# vtk DataFile Version 4.0\nvtk output\nASCII\nDATASET POLYDATA\n"
     node_map = {}
     nodes = ""
@@ -56,7 +61,7 @@ def to_vtk(multiline):
 def to_obj(multipoly):
     if multipoly is None:
         return ''
-    m = wkb.loads(bytes.fromhex(multipoly))
+    m = loads(multipoly)
     res = ""
     node_map = {}
     elem = []
@@ -100,14 +105,113 @@ def sym_split(l1, l2):
 
 
 def share_an_edge(t, f):
-    return 2 == len(set([tuple(x) for x in t.exterior.coords[:3]]
-        ).intersection(set([tuple(x) for x in f.exterior.coords[:3]])))
+    "triangles t and f are vertex index triples"
+    return 2 == len(set(t).intersection(f))
 
 def face_edge_intersects(segment, crossing_segment):
     A, B, C, D = array(segment[0]), array(segment[1]), array(crossing_segment[0]), array(crossing_segment[1])
     return dot(cross(D-C, A-C), cross(D-C, B-C)) < 0
 
 
+class TriangleMesh(object):
+    """indexed triangle mesh, points with the same coordinates share
+    the same vertex, triangles are triples of vertex indices
+
+    the vertices and faces properties give the mesh as float64 and int32 arrays
+    """
+    __slots__ = ('_points', '_index', '_triangles')
+
+    def __init__(self):
+        self._points = []
+        self._index = {}
+        self._triangles = []
+
+    def vertex(self, point):
+        "index of point, the vertex is added if needed"
+        point = tuple(point)
+        i = self._index.get(point)
+        if i is None:
+            i = len(self._points)
+            self._index[point] = i
+            self._points.append(point)
+        return i
+
+    def find(self, point):
+        "index of point, None if point is not a vertex"
+        return self._index.get(tuple(point))
+
+    def point(self, i):
+        return self._points[i]
+
+    def points(self, indices):
+        return [self._points[i] for i in indices]
+
+    def add_triangle(self, a, b, c):
+        "add triangle from its points coordinates and return its index"
+        self._triangles.append((self.vertex(a), self.vertex(b), self.vertex(c)))
+        return len(self._triangles) - 1
+
+    def triangle(self, t):
+        return self._triangles[t]
+
+    def coords(self, t):
+        return tuple(self._points[i] for i in self._triangles[t])
+
+    def edges(self, t):
+        "oriented edges of triangle t as pairs of vertex indices"
+        a, b, c = self._triangles[t]
+        return ((a, b), (b, c), (c, a))
+
+    def segments(self, lines):
+        "edges (both orientations) of lines whose points are all vertices"
+        segments = set()
+        for l in lines:
+            for s, e in zip(l[:-1], l[1:]):
+                s, e = self.find(s), self.find(e)
+                if s is not None and e is not None:
+                    segments.add((s, e))
+                    segments.add((e, s))
+        return segments
+
+    def multipolygon(self, triangles):
+        return MultiPolygon([Polygon(self.coords(t)) for t in triangles])
+
+    @property
+    def vertices(self):
+        return array(self._points, dtype=float64).reshape((-1, 3))
+
+    @property
+    def faces(self):
+        return array(self._triangles, dtype=int32).reshape((-1, 3))
+
+def open_edges(mesh, triangles):
+    "edges of triangles that have no opposite edge"
+    edges = set()
+    for t in triangles:
+        for s, e in mesh.edges(t):
+            if (e, s) in edges:
+                edges.remove((e, s))
+            else:
+                edges.add((s, e))
+    return edges
+
+WKB_POLYGON = array([], dtype=[('order', 'u1'), ('type', '<u4'), ('rings', '<u4'), ('points', '<u4'), ('coords', '<f8', (4, 3))]).dtype
+
+def to_ewkb(vertices, faces, srid):
+    "EWKB of the MULTIPOLYGONZ made of faces, as written by shapely"
+    polygons = zeros(len(faces), dtype=WKB_POLYGON)
+    polygons['order'] = 1
+    polygons['type'] = 0x80000003
+    polygons['rings'] = 1
+    polygons['points'] = 4
+    polygons['coords'] = vertices[faces[:, [0, 1, 2, 0]]]
+    return struct.pack('<BIII', 1, 0xA0000006, srid, len(faces)) + polygons.tobytes()
+
+def to_ewkb_hex(vertices, faces, srid):
+    "hex EWKB of the MULTIPOLYGONZ made of faces, as written by shapely"
+    return to_ewkb(vertices, faces, srid).hex().upper()
+
+
 class Line(object):
     VERTICAL='vertical'
     TOP='top'
@@ -195,17 +299,83 @@ def offset_coords(offsets, coords):
     return [offsets[c] if c in offsets else c for c in coords]
 
 
-def elementary_volumes(holes_, starts_, ends_, hole_ids_, node_ids_, nodes_, end_ids_, end_geoms_, end_holes_, srid_=32632, end_node_relative_distance=0.3, end_node_relative_thickness=.3):
+def pairwise_split(face_lines, offsets):
+    "split crossing top/bottom lines of a face, one pair of lines at a time"
+    for i, j in combinations(list(range(len(face_lines))), 2):
+        assert(face_lines[i].side != Line.VERTICAL and face_lines[j].side != Line.VERTICAL)
+        p = sym_split(face_lines[i].points, face_lines[j].points)
+        if p and p not in offsets:
+            if face_lines[i].points[0] in offsets and face_lines[i].points[-1] in offsets\
+                    and face_lines[j].points[0] in offsets and face_lines[j].points[-1] in offsets:
+                splt = sym_split(
+                        offset_coords(offsets, [face_lines[i].points[0], face_lines[i].points[-1]]),
+                        offset_coords(offsets, [face_lines[j].points[0], face_lines[j].points[-1]]))
+                offsets[p] = splt if splt else p
+            else:
+                offsets[p] = p
+
+def batch_split(face_lines, offsets):
+    """same as pairwise_split, but crossings and interpolated points of all
+    pairs of lines are computed at once from the line end points"""
+    for l in face_lines:
+        assert(l.side != Line.VERTICAL)
+    if len(face_lines) < 2:
+        return
+    firsts = [l.points[0] for l in face_lines]
+    lasts = [l.points[-1] for l in face_lines]
+    first, last = array(firsts), array(lasts)
+
+    # pairs in the same order as combinations()
+    i, j = triu_indices(len(face_lines), 1)
+    crossing = ((first[i, 2] < first[j, 2]) & (last[i, 2] > last[j, 2])) \
+            | ((first[i, 2] > first[j, 2]) & (last[i, 2] < last[j, 2]))
+    i, j = i[crossing], j[crossing]
+    if not len(i):
+        return
+
+    # see interpolate_point
+    A, B, C, D = first[i], first[j], last[i], last[j]
+    l = sqrt(einsum('ij,ij->i', A-B, A-B))[:, None]
+    r = sqrt(einsum('ij,ij->i', C-D, C-D))[:, None]
+    interpolated = (r*A+r*B+l*C+l*D)/(2*(r+l))
+    dist_i = sqrt(einsum('ij,ij->i', interpolated-A, interpolated-A))
+    dist_j = sqrt(einsum('ij,ij->i', interpolated-B, interpolated-B))
+
+    # interior points are ordered by distance to the line start, the last
+    # inserted first on equal distances, as sym_split does
+    inserted = defaultdict(list)
+    for k, (a, b) in enumerate(zip(i.tolist(), j.tolist())):
+        p = tuple(interpolated[k])
+        inserted[a].append((dist_i[k], -k, p))
+        inserted[b].append((dist_j[k], -k, p))
+        if p not in offsets:
+            if firsts[a] in offsets and lasts[a] in offsets \
+                    and firsts[b] in offsets and lasts[b] in offsets:
+                splt = sym_split(
+                        offset_coords(offsets, [firsts[a], lasts[a]]),
+                        offset_coords(offsets, [firsts[b], lasts[b]]))
+                offsets[p] = splt if splt else p
+            else:
+                offsets[p] = p
+
+    for a, points in inserted.items():
+        face_lines[a].points = [firsts[a]] + [p for _, _, p in sorted(points, key=lambda x: x[:2])] + [lasts[a]]
+
+
+def elementary_volumes(holes_, starts_, ends_, hole_ids_, node_ids_, nodes_, end_ids_, end_geoms_, end_holes_, srid_=32632, end_node_relative_distance=0.3, end_node_relative_thickness=.3, vectorized=True, binary=False):
+    """volume, face1, face2 and face3 multipolygons of each connected volume of
+    the cell, as hex EWKB strings or, with binary, as EWKB bytes, node and
+    end geometries can be given in either form"""
 
     DEBUG = False
     PRECI = 6
     debug_files = []
 
-    nodes = {id_: wkb.loads(bytes.fromhex(geom)) for id_, geom in zip(node_ids_, nodes_)}
+    nodes = {id_: loads(geom) for id_, geom in zip(node_ids_, nodes_)}
     ends = defaultdict(list)
     end_holes = defaultdict(list)
     for id_, geom, hole_id in zip(end_ids_, end_geoms_, end_holes_):
-        ends[id_].append(wkb.loads(bytes.fromhex(geom)))
+        ends[id_].append(loads(geom))
         end_holes[id_].append(hole_id)
     holes = {n: h for n, h in zip(node_ids_, hole_ids_)}
     edges = [(s, e) for s, e in zip(starts_, ends_)]
@@ -280,6 +450,7 @@ def elementary_volumes(holes_, starts_, ends_, hole_ids_, node_ids_, nodes_, end
     # face origin is the lowest bottom of the node in the first hole
     # face normal is 
 
+    mesh = TriangleMesh()
     face_idx = -1
     lines = []
     faces = defaultdict(list)
@@ -304,18 +475,10 @@ def elementary_volumes(holes_, starts_, ends_, hole_ids_, node_ids_, nodes_, end
             face_lines.append(Line([nodes[e[0]].coords[1], nodes[e[1]].coords[1]], Line.BOTTOM))
 
         # split lines 
-        for i, j in combinations(list(range(len(face_lines))), 2):
-            assert(face_lines[i].side != Line.VERTICAL and face_lines[j].side != Line.VERTICAL)
-            p = sym_split(face_lines[i].points, face_lines[j].points)
-            if p and p not in offsets:
-                if face_lines[i].points[0] in offsets and face_lines[i].points[-1] in offsets\
-                        and face_lines[j].points[0] in offsets and face_lines[j].points[-1] in offsets:
-                    splt = sym_split(
-                            offset_coords(offsets, [face_lines[i].points[0], face_lines[i].points[-1]]),
-                            offset_coords(offsets, [face_lines[j].points[0], face_lines[j].points[-1]]))
-                    offsets[p] = splt if splt else p
-                else:
-                    offsets[p] = p
+        if vectorized:
+            batch_split(face_lines, offsets)
+        else:
+            pairwise_split(face_lines, offsets)
 
         # split in middle
         for i in range(len(face_lines)):
@@ -356,10 +519,16 @@ def elementary_volumes(holes_, starts_, ends_, hole_ids_, node_ids_, nodes_, end
             open("/tmp/face_{}.vtk".format(face_idx), 'w').write(to_vtk(MultiLineString([LineString(l) for l in linework]).wkb_hex))
             debug_files.append("/tmp/face_{}.vtk".format(face_idx))
 
-        node_map = {(round(dot(p-origin, v), PRECI), round(dot(p-origin, z), PRECI)): p for e in linework for p in e}
-        linework = [LineString([(round(dot(e[0]-origin, v), PRECI), round(dot(e[0]-origin, z), PRECI)),
-                                (round(dot(e[1]-origin, v), PRECI), round(dot(e[1]-origin, z), PRECI))])
-                   for e in linework]
+        if vectorized:
+            segments = array(linework)
+            projected = around(stack((dot(segments-origin, v), dot(segments-origin, z)), axis=-1), PRECI)
+            node_map = {tuple(q): p for e, f in zip(projected.tolist(), segments) for q, p in zip(e, f)}
+            linework = [LineString(e) for e in projected.tolist()]
+        else:
+            node_map = {(round(dot(p-origin, v), PRECI), round(dot(p-origin, z), PRECI)): p for e in linework for p in e}
+            linework = [LineString([(round(dot(e[0]-origin, v), PRECI), round(dot(e[0]-origin, z), PRECI)),
+                                    (round(dot(e[1]-origin, v), PRECI), round(dot(e[1]-origin, z), PRECI))])
+                       for e in linework]
 
         if DEBUG:
             bug = 0
@@ -402,9 +571,9 @@ def elementary_volumes(holes_, starts_, ends_, hole_ids_, node_ids_, nodes_, end
             assert(p.exterior.is_ccw)
             for t in tessellate(p):
                 tri = t.exterior.coords
-                q = Polygon([node_map[tri[0]], node_map[tri[1]], node_map[tri[2]]]) \
+                q = mesh.add_triangle(node_map[tri[0]], node_map[tri[1]], node_map[tri[2]]) \
                     if direct_orientation else \
-                    Polygon([node_map[tri[2]], node_map[tri[1]], node_map[tri[0]]])
+                    mesh.add_triangle(node_map[tri[2]], node_map[tri[1]], node_map[tri[0]])
                 if Point(average(tri, (0,))).intersects(domain):
                     domain_tri.append(q)
                 else:
@@ -415,7 +584,8 @@ def elementary_volumes(holes_, starts_, ends_, hole_ids_, node_ids_, nodes_, end
 
         top_lines = [l for l in face_lines if l.side==Line.TOP]
         bottom_lines = [l for l in face_lines if l.side==Line.BOTTOM]
-        end_lines = {tuple(nodes[n].coords): holes[n] for n in list(ends.keys())}
+        end_lines = {(mesh.find(nodes[n].coords[0]), mesh.find(nodes[n].coords[1])): holes[n] for n in list(ends.keys())}
+        line_segments = mesh.segments([l.points for l in top_lines + bottom_lines])
         if DEBUG:
             open('/tmp/top_lines_face_{}.vtk'.format(face_idx), 'w').write(to_vtk(MultiLineString([l.points for l in top_lines]).wkb_hex))
             open('/tmp/bottom_lines_face_{}.vtk'.format(face_idx), 'w').write(to_vtk(MultiLineString([l.points for l in bottom_lines]).wkb_hex))
@@ -424,68 +594,65 @@ def elementary_volumes(holes_, starts_, ends_, hole_ids_, node_ids_, nodes_, end
 
         # create terminations
         terms = []
-        edges = set()
-        for t in term_tri:
-            for s, e in zip(t.exterior.coords[:-1], t.exterior.coords[1:]):
-                if (e, s) in edges:
-                    edges.remove((e, s))
-                else:
-                    edges.add((s, e))
+        edges = open_edges(mesh, term_tri)
+        domain_edges = defaultdict(list)
+        for d in domain_tri:
+            for s, e in mesh.edges(d):
+                domain_edges[(min(s, e), max(s, e))].append(d)
         for t in term_tri:
             share = False
-            for d in domain_tri:
-                if share_an_edge(t, d):
-                    share = True
-                    break
+            for s, e in mesh.edges(t):
+                for d in domain_edges.get((min(s, e), max(s, e)), []):
+                    if share_an_edge(mesh.triangle(t), mesh.triangle(d)):
+                        share = True
+                        break
             if share:
                 continue
             terms.append(t)
             faces[(hl, hr)] += [t]
-            terms.append(Polygon(offset_coords(offsets, t.exterior.coords[::-1])))
-            for s in zip(t.exterior.coords[:-1], t.exterior.coords[1:]):
+            a, b, c = mesh.coords(t)
+            terms.append(mesh.add_triangle(*offset_coords(offsets, (a, c, b))))
+            for s in mesh.edges(t):
                 if s in edges:
-                    if (is_segment(s, top_lines) or is_segment(s, bottom_lines) or s in end_lines)\
-                            and s[0] in offsets and s[1] in offsets:
-                        terms.append(Polygon([offsets[s[0]], s[1], s[0]]))
-                        terms.append(Polygon([offsets[s[0]], offsets[s[1]], s[1]]))
+                    s0, s1 = mesh.point(s[0]), mesh.point(s[1])
+                    if (s in line_segments or s in end_lines)\
+                            and s0 in offsets and s1 in offsets:
+                        terms.append(mesh.add_triangle(offsets[s0], s1, s0))
+                        terms.append(mesh.add_triangle(offsets[s0], offsets[s1], s1))
                     if (s[1], s[0]) in end_lines:
-                        terms.append(Polygon([s[1], s[0], offsets[s[1]]]))
-                        terms.append(Polygon([s[0], offsets[s[0]], offsets[s[1]]]))
+                        terms.append(mesh.add_triangle(s1, s0, offsets[s1]))
+                        terms.append(mesh.add_triangle(s0, offsets[s0], offsets[s1]))
                         faces[tuple(sorted((end_lines[(s[1], s[0])], other_hole)))] += terms[-2:]
         termination += terms
 
     if DEBUG:
-        open("/tmp/faces.obj", 'w').write(to_obj(MultiPolygon(result).wkb_hex))
-        open("/tmp/termination.obj", 'w').write(to_obj(MultiPolygon(termination).wkb_hex))
+        open("/tmp/faces.obj", 'w').write(to_obj(mesh.multipolygon(result).wkb_hex))
+        open("/tmp/termination.obj", 'w').write(to_obj(mesh.multipolygon(termination).wkb_hex))
 
     if len(result):
         
         top_lines = [l for l in lines if l.side==Line.TOP]
         bottom_lines = [l for l in lines if l.side==Line.BOTTOM]
         # find openfaces (top and bottom)
-        edges = set()
-        for t in result:
-            for s, e in zip(t.exterior.coords[:-1], t.exterior.coords[1:]):
-                if (e, s) in edges:
-                    edges.remove((e, s))
-                else:
-                    edges.add((s, e))
+        edges = open_edges(mesh, result)
+        top_segments = mesh.segments([l.points for l in top_lines])
+        bottom_segments = mesh.segments([l.points for l in bottom_lines])
         top_linework = []
         bottom_linework = []
         for e in edges:
-            if is_segment(e, top_lines): 
-                bottom_linework.append((tuple(e[0]), tuple(e[1])))
-            elif is_segment(e, bottom_lines):
-                top_linework.append((tuple(e[0]), tuple(e[1])))
+            if e in top_segments: 
+                bottom_linework.append(e)
+            elif e in bottom_segments:
+                top_linework.append(e)
 
         if DEBUG:
-            open("/tmp/linework_top_unm.vtk", 'w').write(to_vtk(MultiLineString([LineString(e) for e in top_linework]).wkb_hex))
-            open("/tmp/linework_bottom_unm.vtk", 'w').write(to_vtk(MultiLineString([LineString(e) for e in bottom_linework]).wkb_hex))
+            open("/tmp/linework_top_unm.vtk", 'w').write(to_vtk(MultiLineString([LineString(mesh.points(e)) for e in top_linework]).wkb_hex))
+            open("/tmp/linework_bottom_unm.vtk", 'w').write(to_vtk(MultiLineString([LineString(mesh.points(e)) for e in bottom_linework]).wkb_hex))
 
         # linemerge top and bottom, there will be open rings that need to be closed
         # since we did only add linework for faces
         for face, side in zip(('top', 'bottom'), (top_linework, bottom_linework)):
-            merged = linemerge(side) 
+            merged = [mesh.points(m) for m in linemerge(side)]
 
             if DEBUG:
                 open("/tmp/linework_%s.vtk"%(face), 'w').write(to_vtk(MultiLineString([LineString(e) for e in merged]).wkb_hex))
@@ -498,13 +665,13 @@ def elementary_volumes(holes_, starts_, ends_, hole_ids_, node_ids_, nodes_, end
                     assert(p.exterior.is_ccw)
                     for t in tessellate(p):
                         tri = t.exterior.coords
-                        q = Polygon([node_map[tri[0]], node_map[tri[1]], node_map[tri[2]]]) \
+                        q = mesh.add_triangle(node_map[tri[0]], node_map[tri[1]], node_map[tri[2]]) \
                             if face == 'bottom' else \
-                            Polygon([node_map[tri[2]], node_map[tri[1]], node_map[tri[0]]])
+                            mesh.add_triangle(node_map[tri[2]], node_map[tri[1]], node_map[tri[0]])
                         result.append(q)
                         face_triangles.append(q)
             if DEBUG:
-                open("/tmp/face_{}.obj".format(face), 'w').write(to_obj(MultiPolygon(face_triangles).wkb_hex))
+                open("/tmp/face_{}.obj".format(face), 'w').write(to_obj(mesh.multipolygon(face_triangles).wkb_hex))
 
 
     # adds isolated nodes terminations
@@ -518,98 +685,82 @@ def elementary_volumes(holes_, starts_, ends_, hole_ids_, node_ids_, nodes_, end
                 l = list(reversed(l))
                 k1, k2 = k2, k1
             termination += [
-                    Polygon([node.coords[0], l[0].coords[0], l[1].coords[0]]),
-                    Polygon([l[1].coords[-1], l[0].coords[-1], node.coords[-1]]),
-                    Polygon([node.coords[0], node.coords[1], l[0].coords[0]]),
-                    Polygon([node.coords[1], l[0].coords[1], l[0].coords[0]]),
-                    Polygon([l[1].coords[0], node.coords[1], node.coords[0]]),
-                    Polygon([l[1].coords[0], l[1].coords[1], node.coords[1]]),
-                    Polygon([l[0].coords[0], l[0].coords[1], l[1].coords[0]]),
-                    Polygon([l[0].coords[1], l[1].coords[1], l[1].coords[0]])
+                    mesh.add_triangle(node.coords[0], l[0].coords[0], l[1].coords[0]),
+                    mesh.add_triangle(l[1].coords[-1], l[0].coords[-1], node.coords[-1]),
+                    mesh.add_triangle(node.coords[0], node.coords[1], l[0].coords[0]),
+                    mesh.add_triangle(node.coords[1], l[0].coords[1], l[0].coords[0]),
+                    mesh.add_triangle(l[1].coords[0], node.coords[1], node.coords[0]),
+                    mesh.add_triangle(l[1].coords[0], l[1].coords[1], node.coords[1]),
+                    mesh.add_triangle(l[0].coords[0], l[0].coords[1], l[1].coords[0]),
+                    mesh.add_triangle(l[0].coords[1], l[1].coords[1], l[1].coords[0])
                     ]
             assert(len(end_holes[n])==2)
-            faces[k1] += [
-                    Polygon([node.coords[0], node.coords[1], l[0].coords[0]]),
-                    Polygon([node.coords[1], l[0].coords[1], l[0].coords[0]]),
-                    ]
-            faces[k2] += [
-                    Polygon([l[1].coords[0], node.coords[1], node.coords[0]]),
-                    Polygon([l[1].coords[0], l[1].coords[1], node.coords[1]]),
-                    ]
+            faces[k1] += termination[-6:-4]
+            faces[k2] += termination[-4:-2]
 
     result += termination
 
     if DEBUG:
         for hp, tri in faces.items():
-            open("/tmp/face_{}_{}.obj".format(hp[0], hp[1]), 'w').write(to_obj(MultiPolygon([t for t in tri]).wkb_hex))
+            open("/tmp/face_{}_{}.obj".format(hp[0], hp[1]), 'w').write(to_obj(mesh.multipolygon(tri).wkb_hex))
 
 
-    # decompose volume in connected components
+    # decompose volume in connected components: triangles sharing an edge
+    # are merged with union-find, the root of a component is its first triangle
+    root = list(range(len(result)))
+    def find(i):
+        while root[i] != i:
+            root[i] = root[root[i]]
+            i = root[i]
+        return i
+
     edges = {}
-    graph = {i:set() for i in range(len(result))}
     for ip, p in enumerate(result):
-        for s, e in zip(p.exterior.coords[:-1], p.exterior.coords[1:]):
+        for s, e in mesh.edges(p):
             if (e, s) in edges:
-                o = edges[(e,s)]
-                graph[o].add(ip)
-                graph[ip].add(o)
-                del edges[(e, s)]
+                a, b = find(edges.pop((e, s))), find(ip)
+                if a != b:
+                    root[max(a, b)] = min(a, b)
             else:
                 edges[(s, e)] = ip
 
-    def pop_connected(n, graph):
-        connected = set([n])
-        if n in graph:
-            for ng in graph.pop(n):
-                connected = connected.union(pop_connected(ng, graph))
-        return connected
+    connected = defaultdict(list)
+    for ip in range(len(result)):
+        connected[find(ip)].append(result[ip])
 
-    connected = []
-    while len(graph):
-        n = next(iter(list(graph.keys())))
-        connected.append(pop_connected(n, graph))
+    # face of each triangle, 0 if it's not on a cell face
+    mesh_faces = mesh.faces
+    face_label = zeros(len(mesh_faces), dtype=int32)
+    for label, face in enumerate(((sorted_holes[0], sorted_holes[1]), (sorted_holes[1], sorted_holes[2]), (sorted_holes[0], sorted_holes[2])), 1):
+        face_label[array(faces[face], dtype=int32)] = label
 
+    vertices = mesh.vertices + array(translation)
+    empty_mp = struct.pack('<BIII', 1, 0xA0000006, srid_, 0) if binary else "SRID={} ;MULTIPOLYGONZ EMPTY".format(srid_)
+    encode = to_ewkb if binary else to_ewkb_hex
     i=0
-    for c in connected:
+    for c in sorted(connected.keys()):
         i+=1
-        face1 = []
-        face2 = []
-        face3 = []
-        triangles = [result[i] for i in c]
-        res = MultiPolygon(triangles)
-        
-        for f in faces[(sorted_holes[0], sorted_holes[1])]:
-            if f in triangles:
-                face1.append(f)
-        for f in faces[(sorted_holes[1], sorted_holes[2])]:
-            if f in triangles:
-                face2.append(f)
-        for f in faces[(sorted_holes[0], sorted_holes[2])]:
-            if f in triangles:
-                face3.append(f)
+        triangles = array(connected[c], dtype=int32)
+        labels = face_label[triangles]
+        face1 = triangles[labels == 1]
+        face2 = triangles[labels == 2]
+        face3 = triangles[labels == 3]
         
         if DEBUG:
-            open("/tmp/face1_tr_%d.obj"%(i), 'w').write(to_obj(face1.wkb_hex))
-            open("/tmp/face2_tr_%d.obj"%(i), 'w').write(to_obj(face2.wkb_hex))
-            open("/tmp/face3_tr_%d.obj"%(i), 'w').write(to_obj(face3.wkb_hex))
-            open("/tmp/volume_tr.obj", 'w').write(to_obj(res.wkb_hex))
+            open("/tmp/face1_tr_%d.obj"%(i), 'w').write(to_obj(mesh.multipolygon(face1).wkb_hex))
+            open("/tmp/face2_tr_%d.obj"%(i), 'w').write(to_obj(mesh.multipolygon(face2).wkb_hex))
+            open("/tmp/face3_tr_%d.obj"%(i), 'w').write(to_obj(mesh.multipolygon(face3).wkb_hex))
+            open("/tmp/volume_tr.obj", 'w').write(to_obj(mesh.multipolygon(triangles).wkb_hex))
             # check volume is closed
-            edges = set()
-            for p in res:
-                for s, e in zip(p.exterior.coords[:-1], p.exterior.coords[1:]):
-                    if (e, s) in edges:
-                        edges.remove((e, s))
-                    else:
-                        edges.add((s, e))
+            edges = open_edges(mesh, triangles)
             if len(edges):
                 print("volume is not closed", edges)
-                open("/tmp/unconnected_edge.vtk", 'w').write(to_vtk(MultiLineString([LineString(e) for e in edges]).wkb_hex))
-
+                open("/tmp/unconnected_edge.vtk", 'w').write(to_vtk(MultiLineString([LineString(mesh.points(e)) for e in edges]).wkb_hex))
 
             # check volume is positive
             volume = 0
-            for p in res:
-                r = p.exterior.coords
+            for t in triangles:
+                r = mesh.coords(t)
                 v210 = r[2][0]*r[1][1]*r[0][2];
                 v120 = r[1][0]*r[2][1]*r[0][2];
                 v201 = r[2][0]*r[0][1]*r[1][2];
@@ -619,25 +770,9 @@ def elementary_volumes(holes_, starts_, ends_, hole_ids_, node_ids_, nodes_, end
                 volume += (1./6.)*(-v210 + v120 + v201 - v021 - v102 + v012)
             if volume <= 0 :
                 print("volume is", volume)
-        
-        res = translate(res, translation[0], translation[1], translation[2])
-        geos.lgeos.GEOSSetSRID(res._geom, srid_)
-
-        face1 = translate(MultiPolygon(face1), translation[0], translation[1], translation[2])
-        geos.lgeos.GEOSSetSRID(face1._geom, srid_)
-
-        face2 = translate(MultiPolygon(face2), translation[0], translation[1], translation[2])
-        geos.lgeos.GEOSSetSRID(face2._geom, srid_)
 
-        face3 = translate(MultiPolygon(face3), translation[0], translation[1], translation[2])
-        geos.lgeos.GEOSSetSRID(face3._geom, srid_)
-        
-        empty_mp = "SRID={} ;MULTIPOLYGONZ EMPTY".format(srid_)
-        yield (res.wkb_hex if not res.is_empty else empty_mp, face1.wkb_hex if not face1.is_empty else empty_mp, 
-            face2.wkb_hex if not face2.is_empty else empty_mp, face3.wkb_hex if not face3.is_empty else empty_mp)
+        yield tuple(encode(vertices, mesh_faces[t], srid_) if len(t) else empty_mp
+            for t in (triangles, face1, face2, face3))
 
     for f in debug_files:
         os.remove(f)
-
-
-
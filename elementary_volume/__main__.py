@@ -1,23 +1,192 @@
+"""
+batch runner for elementary volumes, replays cells dumped from the database
+
+USAGE
+    python -m albion.elementary_volume [-h] [-j jobs] [-o directory] [-f formats] input...
+
+    input is either:
+        - a debug text file written by albion.elementary_volumes (one field per line),
+        - a directory, all the *.txt debug files and *.jsonl files in it are processed,
+        - a .jsonl file, one cell per line as a json object with the fields
+          albion.dynamic_volume passes to albion.elementary_volumes: cell_id, graph_id,
+          geom, holes, starts, ends, hole_ids, node_ids, node_geoms, end_ids,
+          end_geoms, end_holes and optionally end_node_relative_distance,
+          end_node_relative_thickness and srid,
+        - '-' to read jsonl from the standard input.
+
+    one json report per cell is printed on the standard output with the
+    computation time, and, for each volume, whether it is closed, its volume
+    and whether it is degenerate (empty or flat, i.e. with a null volume).
+    The exit code is 1 if any cell failed or gave a non degenerate volume that
+    is open or negative.
+
+OPTIONS
+    -h, --help
+        print this help
+
+    -j, --jobs N
+        number of worker processes, defaults to the number of cpus
+
+    -o, --output directory
+        directory for the volume files, defaults to the current directory
+
+    -f, --format obj,wkb
+        comma separated output formats (wkb files are binary EWKB), 'none'
+        to only run the checks, defaults to obj
+
+    -s, --srid srid
+        srid of the output when not given in the input, defaults to 32632
+"""
+
+import os
 import sys
-from . import elementary_volumes, to_obj
-
-with open(sys.argv[1]) as f:
-    cell_id_ = f.readline().rstrip()
-    graph_id_ = f.readline().rstrip()
-    geom_ = f.readline().rstrip()
-    holes_ = f.readline().rstrip().split()
-    starts_ = f.readline().rstrip().split()
-    ends_ = f.readline().rstrip().split()
-    hole_ids_ = f.readline().rstrip().split()
-    node_ids_ = f.readline().rstrip().split()
-    nodes_ = f.readline().rstrip().split()
-    end_ids_ = f.readline().rstrip().split()
-    end_geoms_ = f.readline().rstrip().split()
-    end_holes_ = f.readline().rstrip().split()
-    idx = 0
-    for v, f1, f2, f3 in elementary_volumes(holes_, starts_, ends_, hole_ids_, node_ids_, nodes_, end_ids_, end_geoms_, end_holes_):
-        open("/tmp/volume%d.obj"%(idx), 'w').write(to_obj(v))
-        open("/tmp/face1_%d.obj"%(idx), 'w').write(to_obj(f1))
-        open("/tmp/face2_%d.obj"%(idx), 'w').write(to_obj(f2))
-        open("/tmp/face3_%d.obj"%(idx), 'w').write(to_obj(f3))
-        idx += 1
+import json
+import time
+import getopt
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from . import elementary_volumes, to_obj, loads
+
+# volumes below this, in cubic meters, are degenerate
+DEGENERATE_VOLUME = 1e-6
+
+FIELDS = ['cell_id', 'graph_id', 'geom', 'holes', 'starts', 'ends', 'hole_ids',
+    'node_ids', 'node_geoms', 'end_ids', 'end_geoms', 'end_holes']
+
+
+def read_debug_file(filename):
+    "cell from a debug text file written by albion.elementary_volumes"
+    with open(filename) as f:
+        lines = [f.readline().rstrip() for i in range(len(FIELDS))]
+    cell = {k: v.split() for k, v in zip(FIELDS, lines)}
+    cell['cell_id'], cell['graph_id'], cell['geom'] = lines[0], lines[1], lines[2]
+    return cell
+
+def read_jsonl(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+def read_inputs(inputs):
+    "generator of cells from files, directories and jsonl streams"
+    for input_ in inputs:
+        if input_ == '-':
+            for cell in read_jsonl(sys.stdin):
+                yield cell
+        elif os.path.isdir(input_):
+            for f in sorted(os.listdir(input_)):
+                if f.endswith('.txt') or f.endswith('.jsonl'):
+                    for cell in read_inputs([os.path.join(input_, f)]):
+                        yield cell
+        elif input_.endswith('.jsonl'):
+            with open(input_) as f:
+                for cell in read_jsonl(f):
+                    yield cell
+        else:
+            yield read_debug_file(input_)
+
+def check_volume(multipoly):
+    "closed flag and volume of a triangulated multipolygon"
+    m = loads(multipoly)
+    edges = set()
+    volume = 0
+    for p in m:
+        r = p.exterior.coords
+        for s, e in zip(r[:-1], r[1:]):
+            if (e, s) in edges:
+                edges.remove((e, s))
+            else:
+                edges.add((s, e))
+        v210 = r[2][0]*r[1][1]*r[0][2];
+        v120 = r[1][0]*r[2][1]*r[0][2];
+        v201 = r[2][0]*r[0][1]*r[1][2];
+        v021 = r[0][0]*r[2][1]*r[1][2];
+        v102 = r[1][0]*r[0][1]*r[2][2];
+        v012 = r[0][0]*r[1][1]*r[2][2];
+        volume += (1./6.)*(-v210 + v120 + v201 - v021 - v102 + v012)
+    return len(edges) == 0, volume
+
+def process(cell, output_dir, formats, srid):
+    "compute, write and check the volumes of a cell, returns the cell report"
+    report = {'cell_id': cell['cell_id'], 'graph_id': cell.get('graph_id')}
+    try:
+        start = time.time()
+        volumes = list(elementary_volumes(cell['holes'], cell['starts'], cell['ends'],
+            cell['hole_ids'], cell['node_ids'], cell['node_geoms'], cell['end_ids'],
+            cell['end_geoms'], cell['end_holes'], cell.get('srid', srid),
+            cell.get('end_node_relative_distance', .3), cell.get('end_node_relative_thickness', .3), binary=True))
+        report['time'] = time.time() - start
+        report['closed'] = []
+        report['volume'] = []
+        report['degenerate'] = []
+        for idx, geoms in enumerate(volumes):
+            closed, volume = check_volume(geoms[0])
+            report['closed'].append(closed)
+            report['volume'].append(volume)
+            report['degenerate'].append(abs(volume) < DEGENERATE_VOLUME)
+            for name, geom in zip(('volume', 'face1', 'face2', 'face3'), geoms):
+                filename = os.path.join(output_dir, '{}_{}_{}'.format(cell['cell_id'], name, idx))
+                if 'obj' in formats:
+                    open(filename+'.obj', 'w').write(to_obj(geom))
+                if 'wkb' in formats:
+                    open(filename+'.wkb', 'wb').write(geom)
+    except Exception as e:
+        report['error'] = '{}: {}'.format(type(e).__name__, e)
+    return report
+
+def is_valid(report):
+    "no error and all non degenerate volumes closed and positive"
+    return 'error' not in report and all(closed and volume > 0
+        for closed, volume, degenerate in zip(report['closed'], report['volume'], report['degenerate'])
+        if not degenerate)
+
+
+if __name__ == "__main__":
+    try:
+        optlist, args = getopt.getopt(sys.argv[1:],
+                "hj:o:f:s:",
+                ["help", "jobs=", "output=", "format=", "srid="])
+    except Exception as e:
+        sys.stderr.write(str(e)+"\n")
+        exit(1)
+
+    optlist = dict(optlist)
+
+    if "-h" in optlist or "--help" in optlist or not args:
+        help(sys.modules[__name__])
+        exit(0)
+
+    jobs = int(optlist.get('-j', optlist.get('--jobs', os.cpu_count() or 1)))
+    output_dir = optlist.get('-o', optlist.get('--output', '.'))
+    formats = optlist.get('-f', optlist.get('--format', 'obj')).split(',')
+    srid = int(optlist.get('-s', optlist.get('--srid', 32632)))
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    stats = defaultdict(int)
+    start = time.time()
+
+    def report(r):
+        stats['cells'] += 1
+        stats['volumes'] += len(r.get('volume', []))
+        stats['degenerate'] += sum(r.get('degenerate', []))
+        stats['failed'] += 0 if is_valid(r) else 1
+        stats['time'] += r.get('time', 0)
+        sys.stdout.write(json.dumps(r)+"\n")
+
+    # bounded number of pending cells, inputs can be larger than memory
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = set()
+        for cell in read_inputs(args):
+            if len(pending) >= 4*jobs:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    report(future.result())
+            pending.add(executor.submit(process, cell, output_dir, formats, srid))
+        for future in wait(pending).done:
+            report(future.result())
+
+    sys.stderr.write("{cells} cells, {volumes} volumes ({degenerate} degenerate), {failed} failed, {time:.3f}s cpu, ".format(**stats)
+            + "{:.3f}s elapsed\n".format(time.time() - start))
+    exit(1 if stats['failed'] else 0)
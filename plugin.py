@@ -263,6 +263,13 @@ class Plugin(QObject):
             "Create volumes associated with current graph.",
         )
 
+        self.__add_menu_entry(
+            "Update volumes",
+            self.__update_volumes,
+            self.project is not None and bool(self.__current_graph.currentText()),
+            "Rebuild the volumes of the cells modified since the last build.",
+        )
+
         self.__add_menu_entry(
             "Export Volume",
             self.__export_volume,
@@ -323,7 +330,22 @@ class Plugin(QObject):
         self.__refresh_layers("section")
 
     def __create_volumes(self):
-        self.project.create_volumes(self.__current_graph.currentText())
+        progressMessageBar = self.__iface.messageBar().createMessage(
+            "Creating volumes..."
+        )
+        progress = QProgressBar()
+        progress.setAlignment(Qt.AlignLeft | Qt.AlignVCenter)
+        progressMessageBar.layout().addWidget(progress)
+        self.__iface.messageBar().pushWidget(progressMessageBar)
+
+        self.project.create_volumes(self.__current_graph.currentText(),
+                workers=min(os.cpu_count() or 1, self.project.pool_size), progress=ProgressBar(progress))
+
+        self.__iface.messageBar().clearWidgets()
+        self.__viewer3d.widget().refresh_data()
+
+    def __update_volumes(self):
+        self.project.update_volumes(self.__current_graph.currentText())
         self.__viewer3d.widget().refresh_data()
 
     def __next_section(self):
@@ -29,7 +29,19 @@ from builtins import bytes
 from qgis.core import QgsMessageLog
 
 import time
+import select
+import io
+import csv
+import json
+import threading
+from functools import wraps
+from contextlib import contextmanager
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from psycopg2.extras import LoggingConnection, LoggingCursor
+from psycopg2.extensions import cursor, TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+from psycopg2.pool import PoolError
+from .segmentation import segmentation_holes
 import logging
 
 logging.basicConfig(level=logging.DEBUG)
@@ -38,10 +50,12 @@ logger = logging.getLogger(__name__)
 class MyLoggingCursor(LoggingCursor):
     def execute(self, query, vars=None):
         self.timestamp = time.time()
+        self.statement = query
         return super(MyLoggingCursor, self).execute(query, vars)
 
     def callproc(self, procname, vars=None):
         self.timestamp = time.time()
+        self.statement = procname
         return super(MyLoggingCursor, self).callproc(procname, vars)
 
 # MyLogging Connection:
@@ -55,6 +69,304 @@ class MyLoggingConnection(LoggingConnection):
         kwargs.setdefault('cursor_factory', MyLoggingCursor)
         return LoggingConnection.cursor(self, *args, **kwargs)
 
+# ProfilingCursor:
+#   records statements in the profiler of the connection lender
+class ProfilingCursor(cursor):
+    profiler = None
+
+    def execute(self, query, vars=None):
+        start = time.time()
+        result = super(ProfilingCursor, self).execute(query, vars)
+        self.profiler.record(query, time.time() - start, self.rowcount)
+        return result
+
+    def callproc(self, procname, vars=None):
+        start = time.time()
+        result = super(ProfilingCursor, self).callproc(procname, vars)
+        self.profiler.record(procname, time.time() - start, self.rowcount)
+        return result
+
+    def copy_expert(self, sql, file, *args, **kwargs):
+        start = time.time()
+        result = super(ProfilingCursor, self).copy_expert(sql, file, *args, **kwargs)
+        self.profiler.record(sql, time.time() - start, self.rowcount)
+        return result
+
+    def copy_from(self, file, table, *args, **kwargs):
+        start = time.time()
+        result = super(ProfilingCursor, self).copy_from(file, table, *args, **kwargs)
+        self.profiler.record("copy {} from stdin".format(table), time.time() - start, self.rowcount)
+        return result
+
+    def copy_to(self, file, table, *args, **kwargs):
+        start = time.time()
+        result = super(ProfilingCursor, self).copy_to(file, table, *args, **kwargs)
+        self.profiler.record("copy {} to stdout".format(table), time.time() - start, self.rowcount)
+        return result
+
+
+def profiling_cursor_factory(profiler):
+    def factory(*args, **kwargs):
+        cur = ProfilingCursor(*args, **kwargs)
+        cur.profiler = profiler
+        return cur
+    return factory
+
+
+class Profiler(object):
+    """statements executed while profiling a project, with their duration and
+    row count, grouped by high level operation (import_data, create_volumes...)
+
+    statements executed outside of an operation are grouped under None, each
+    thread has its own stack of operations (see bind for worker threads)
+    """
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.__operations = defaultdict(lambda: {"calls": 0, "time": 0., "statements": {}})
+
+    def __current(self):
+        if not hasattr(self.__local, "operations"):
+            self.__local.operations = []
+        return self.__local.operations
+
+    @contextmanager
+    def operation(self, name):
+        current = self.__current()
+        current.append(name)
+        start = time.time()
+        try:
+            yield
+        finally:
+            current.pop()
+            with self.__lock:
+                self.__operations[name]["calls"] += 1
+                self.__operations[name]["time"] += time.time() - start
+
+    def bind(self, function):
+        """function running in the operations of the calling thread, the
+        statements it executes in a worker thread are grouped with them"""
+        operations = list(self.__current())
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            current = self.__current()
+            saved = current[:]
+            current[:] = operations
+            try:
+                return function(*args, **kwargs)
+            finally:
+                current[:] = saved
+        return wrapper
+
+    def record(self, statement, duration, rowcount):
+        statement = " ".join(
+            (statement.decode() if isinstance(statement, bytes) else str(statement)).split())
+        current = self.__current()
+        operation = current[-1] if current else None
+        with self.__lock:
+            stats = self.__operations[operation]["statements"].setdefault(statement,
+                {"statement": statement, "count": 0, "time": 0., "max_time": 0., "rows": 0})
+            stats["count"] += 1
+            stats["time"] += duration
+            stats["max_time"] = max(stats["max_time"], duration)
+            stats["rows"] += max(rowcount, 0)
+
+    def report(self):
+        """operations with number of calls, total time and statements sorted
+        by decreasing total time, times are in seconds"""
+        with self.__lock:
+            return {
+                name: {
+                    "calls": op["calls"],
+                    "time": op["time"],
+                    "sql_time": sum(s["time"] for s in op["statements"].values()),
+                    "statements": sorted([dict(s) for s in op["statements"].values()],
+                        key=lambda s: -s["time"])
+                }
+                for name, op in self.__operations.items()}
+
+    def save(self, filename):
+        with open(filename, "w") as f:
+            json.dump([dict(op, operation=name) for name, op in self.report().items()], f, indent=2)
+
+
+class ConnectionPool(object):
+    """thread safe pool of at most size connections to a database
+
+    getconn blocks when all connections are in use, forever unless a timeout
+    in seconds is given (it then raises PoolError), connections are checked
+    before being lent again:
+    closed or broken connections, and connections the server has written to
+    while idle (e.g. when terminating them), are replaced, connections idle
+    for more than health_check_interval seconds are also checked with a query
+    """
+    def __init__(self, conn_info, size=8, health_check_interval=30, timeout=None):
+        self.__conn_info = conn_info
+        self.__size = size
+        self.__health_check_interval = health_check_interval
+        self.__timeout = timeout
+        self.__idle = []
+        self.__used = 0
+        self.__condition = threading.Condition()
+
+    @property
+    def size(self):
+        return self.__size
+
+    def getconn(self):
+        with self.__condition:
+            while not self.__idle and self.__used >= self.__size:
+                if not self.__condition.wait(self.__timeout):
+                    raise PoolError("connection pool exhausted")
+            self.__used += 1
+            con, since = self.__idle.pop() if self.__idle else (None, None)
+        try:
+            if con is not None and not self.__is_healthy(con, since):
+                con.close()
+                con = None
+            return con if con is not None else psycopg2.connect(self.__conn_info)
+        except Exception:
+            with self.__condition:
+                self.__used -= 1
+                self.__condition.notify()
+            raise
+
+    def putconn(self, con, close=False):
+        if not close and not con.closed:
+            try:
+                if con.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                    con.rollback()
+                if con.autocommit:
+                    con.autocommit = False
+            except psycopg2.Error:
+                close = True
+        if close or con.closed:
+            con.close()
+        with self.__condition:
+            self.__used -= 1
+            if not con.closed:
+                self.__idle.append((con, time.time()))
+            self.__condition.notify()
+
+    def close_idle(self):
+        with self.__condition:
+            idle, self.__idle = self.__idle, []
+        for con, since in idle:
+            con.close()
+
+    def __is_healthy(self, con, since):
+        if con.closed or con.get_transaction_status() == TRANSACTION_STATUS_UNKNOWN:
+            return False
+        try:
+            # nothing should be readable on an idle connection
+            readable = select.select([con], [], [], 0)[0]
+        except (OSError, ValueError):
+            return False
+        if not readable and time.time() - since < self.__health_check_interval:
+            return True
+        try:
+            con.cursor().execute("select 1")
+            con.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+
+class PooledConnection(object):
+    """lends a connection of the pool in a with statement, like a psycopg2
+    connection the transaction is commited, or rolled back on error, at exit
+
+    with a profiler, the cursors of the connection record their statements in it
+    """
+    def __init__(self, pool, profiler=None):
+        self.__pool = pool
+        self.__profiler = profiler
+        self.__con = None
+
+    def __enter__(self):
+        self.__con = self.__pool.getconn()
+        if self.__profiler is not None:
+            self.__con.cursor_factory = profiling_cursor_factory(self.__profiler)
+        return self.__con
+
+    def __exit__(self, type_, value, traceback):
+        con, self.__con = self.__con, None
+        con.cursor_factory = None
+        broken = con.closed or isinstance(value, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        try:
+            if not broken:
+                if type_ is None:
+                    con.commit()
+                else:
+                    con.rollback()
+        finally:
+            self.__pool.putconn(con, close=broken)
+
+
+class MetadataCache(object):
+    """srid, correlation and end node parameters and layers of a project
+
+    values are read once and kept until a notification on the albion_metadata
+    channel, sent by the triggers on _albion.metadata and _albion.layer, is
+    received by the dedicated listening connection
+    """
+    FIELDS = ['srid', 'correlation_distance', 'correlation_angle', 'parent_correlation_angle',
+        'end_node_relative_distance', 'end_node_relative_thickness']
+
+    def __init__(self, conn_info):
+        self.__conn_info = conn_info
+        self.__listener = None
+        self.__values = None
+        self.__lock = threading.Lock()
+
+    def values(self):
+        with self.__lock:
+            if self.__listener is not None and not self.__listener.closed:
+                try:
+                    self.__listener.poll()
+                    if self.__listener.notifies:
+                        del self.__listener.notifies[:]
+                        self.__values = None
+                except psycopg2.Error:
+                    self.__listener.close()
+            if self.__listener is None or self.__listener.closed:
+                self.__values = None
+                self.__listener = psycopg2.connect(self.__conn_info)
+                self.__listener.autocommit = True
+                self.__listener.cursor().execute("listen albion_metadata")
+            if self.__values is None:
+                cur = self.__listener.cursor()
+                cur.execute("select {} from albion.metadata".format(', '.join(MetadataCache.FIELDS)))
+                values = dict(zip(MetadataCache.FIELDS, cur.fetchone()))
+                cur.execute("select name, fields_definition from albion.layer order by name")
+                values['layers'] = cur.fetchall()
+                self.__values = values
+            return self.__values
+
+    def invalidate(self):
+        with self.__lock:
+            self.__values = None
+
+    def close(self):
+        with self.__lock:
+            if self.__listener is not None:
+                self.__listener.close()
+            self.__listener = None
+            self.__values = None
+
+
+def profiled(method):
+    "attributes the statements executed by the project method to this operation when profiling"
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        profiler = self.profiler
+        if profiler is None:
+            return method(self, *args, **kwargs)
+        with profiler.operation(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 if not check_cluster():
     init_cluster()
@@ -92,6 +404,86 @@ def find_in_dir(dir_, name):
     return ""
 
 
+# file name pattern and columns of the interval tables loaded by import_data
+INTERVAL_TABLES = [
+    ("avp", "_albion.radiometry(hole_id, from_, to_, gamma)"),
+    ("formation", "_albion.formation(hole_id, from_, to_, code, comments)"),
+    ("lithology", "_albion.lithology(hole_id, from_, to_, code, comments)"),
+    ("facies", "_albion.facies(hole_id, from_, to_, code, comments)"),
+    ("resi", "_albion.resistivity(hole_id, from_, to_, rho)"),
+    ("chemical", "_albion.chemical(hole_id, from_, to_, num_sample, "
+        "element, thickness, gt, grade, equi, comments)"),
+]
+
+
+def copy_csv(cur, table, filename, size=1 << 20):
+    "stream a semicolon separated csv file with header in table"
+    with open(filename) as f:
+        cur.copy_expert("copy {} from stdin delimiter ';' csv header".format(table), f, size)
+
+
+# module name and source file of the python modules of the plpython
+# functions, in load order (see albion.load_runtime)
+RUNTIME_MODULES = [
+    ("albion_elementary_volume", os.path.join("elementary_volume", "__init__.py")),
+    ("albion_segmentation", "segmentation.py"),
+    ("albion_runtime", "runtime.py"),
+]
+
+
+def install_runtime(cur):
+    "store the sources of the plpython runtime in albion.runtime_module"
+    for rank, (name, filename) in enumerate(RUNTIME_MODULES):
+        with open(os.path.join(os.path.dirname(__file__), filename)) as f:
+            cur.execute(
+                "insert into albion.runtime_module(name, rank, source) values (%s, %s, %s)",
+                (name, rank, f.read()))
+
+
+
+# number of holes per task of the client side mineralization
+MINERALIZATION_BATCH = 64
+
+
+def copy_mineralization(con, cutoffs, ci, oc, workers):
+    """segmentation of the radiometry of all holes in a pool of workers
+    processes, the intervals are copied in _albion.mineralization at once"""
+    holes = con.cursor("mineralization_radiometry")
+    holes.execute("""
+        select hole_id, array_agg(gamma order by from_), array_agg(from_ order by from_), array_agg(to_ order by from_)
+        from albion.radiometry
+        group by hole_id
+        order by hole_id
+        """)
+
+    intervals = io.StringIO()
+    writer = csv.writer(intervals)
+
+    # bounded number of pending batches, the radiometry can be larger than memory
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        batch = []
+        for hole in holes:
+            batch.append(hole)
+            if len(batch) < MINERALIZATION_BATCH:
+                continue
+            if len(pending) >= 4*workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    writer.writerows(future.result())
+            pending.add(executor.submit(segmentation_holes, batch, ci, oc, cutoffs))
+            batch = []
+        if batch:
+            pending.add(executor.submit(segmentation_holes, batch, ci, oc, cutoffs))
+        for future in wait(pending).done:
+            writer.writerows(future.result())
+    holes.close()
+
+    intervals.seek(0)
+    con.cursor().copy_expert(
+        "copy _albion.mineralization(hole_id, level_, from_, to_, oc, accu, grade) from stdin csv",
+        intervals)
+
 class DummyProgress(object):
     def __init__(self):
         sys.stdout.write("\n")
@@ -119,15 +511,84 @@ class ProgressBar(object):
 
 
 class Project(object):
-    def __init__(self, project_name):
+    # default maximum number of connections to a project database
+    POOL_SIZE = 8
+
+    # profilers, connection pools and metadata caches are shared by all
+    # Project instances on the same database
+    __profilers = {}
+    __pools = {}
+    __metadata_caches = {}
+    __pools_lock = threading.Lock()
+
+    def __init__(self, project_name, pool_size=None):
         # assert Project.exists(project_name)
         self.__name = project_name
         self.__conn_info = "dbname={} {}".format(project_name, cluster_params())
+        self.__pool_size = pool_size or Project.POOL_SIZE
 
     def connect(self):
-        con = psycopg2.connect(self.__conn_info)#, connection_factory=MyLoggingConnection)
-        #con.initialize(logger)
-        return con
+        """connection to the project database, to be used in a with statement,
+        connections are taken from the project pool and given back at exit,
+        when profiling their statements are recorded in the project profiler"""
+        return PooledConnection(self.__pool(), self.profiler)
+
+    def __pool(self):
+        with Project.__pools_lock:
+            if self.__name not in Project.__pools:
+                Project.__pools[self.__name] = ConnectionPool(self.__conn_info, self.__pool_size)
+            return Project.__pools[self.__name]
+
+    @property
+    def pool_size(self):
+        "maximum number of connections to the project database"
+        return self.__pool().size
+
+    def __bind(self, function):
+        "function to run in a worker thread, see Profiler.bind"
+        profiler = self.profiler
+        return function if profiler is None else profiler.bind(function)
+
+    @staticmethod
+    def close_connections(project_name):
+        """close the idle pooled connections to the project database, connections
+        in use are closed when given back"""
+        with Project.__pools_lock:
+            pool = Project.__pools.pop(project_name, None)
+            cache = Project.__metadata_caches.pop(project_name, None)
+        if pool is not None:
+            pool.close_idle()
+        if cache is not None:
+            cache.close()
+
+    def __metadata_cache(self):
+        with Project.__pools_lock:
+            if self.__name not in Project.__metadata_caches:
+                Project.__metadata_caches[self.__name] = MetadataCache(self.__conn_info)
+            return Project.__metadata_caches[self.__name]
+
+    def invalidate_metadata(self):
+        """force the reload of the cached metadata, changes made by other
+        clients are notified, this is only needed right after a local change"""
+        self.__metadata_cache().invalidate()
+
+    @property
+    def profiler(self):
+        return Project.__profilers.get(self.__name)
+
+    def start_profiling(self):
+        """record the statements executed on the project database from now on"""
+        Project.__profilers[self.__name] = Profiler()
+
+    def stop_profiling(self, filename=None):
+        """stop recording, returns the report (see Profiler.report) and
+        writes it as json in filename if specified"""
+        profiler = Project.__profilers.pop(self.__name, None)
+        if profiler is None:
+            return None
+        if filename is not None:
+            profiler.save(filename)
+        return profiler.report()
 
     def vacuum(self):
         with self.connect() as con:
@@ -138,6 +599,8 @@ class Project(object):
 
     @staticmethod
     def exists(project_name):
+        # backends are terminated below
+        Project.close_connections(project_name)
         with psycopg2.connect("dbname=postgres {}".format(cluster_params())) as con:
             cur = con.cursor()
             con.set_isolation_level(0)
@@ -160,6 +623,7 @@ class Project(object):
     @staticmethod
     def delete(project_name):
         assert Project.exists(project_name)
+        Project.close_connections(project_name)
         with psycopg2.connect("dbname=postgres {}".format(cluster_params())) as con:
             cur = con.cursor()
             con.set_isolation_level(0)
@@ -196,22 +660,14 @@ class Project(object):
             cur.execute("create extension plpython3u")
             cur.execute("create extension hstore")
             cur.execute("create extension hstore_plpython3u")
-            include_elementary_volume = open(
-                os.path.join(
-                    os.path.dirname(__file__), "elementary_volume", "__init__.py"
-                )
-            ).read()
             for file_ in ("_albion.sql", "albion.sql"):
                 for statement in (
                     open(os.path.join(os.path.dirname(__file__), file_))
                     .read()
                     .split("\n;\n")[:-1]
                 ):
-                    cur.execute(
-                        statement.replace("$SRID", str(srid)).replace(
-                            "$INCLUDE_ELEMENTARY_VOLUME", include_elementary_volume
-                        )
-                    )
+                    cur.execute(statement.replace("$SRID", str(srid)))
+            install_runtime(cur)
             con.commit()
 
         for table in TABLES:
@@ -252,10 +708,9 @@ class Project(object):
                     insert into albion.{NAME}(hole_id, from_, to_, {FIELDS})
                     values (%s, %s, %s, {FORMAT})
                 """.format(**table), values)
-                cur.execute("""
-                    refresh materialized view albion.{NAME}_section_geom_cache
-                    """.format(**table))
             con.commit()
+        if not view_only:
+            self.invalidate_metadata()
         self.vacuum()
 
 
@@ -274,10 +729,7 @@ class Project(object):
                 from information_schema.columns where table_name = 'metadata'
                 and column_name='version'
                 """);
-            if cur.fetchone():
-                # here goes future upgrades
-                cur.execute("select version from _albion.metadata")
-            else:
+            if not cur.fetchone():
                 # old albion version, we upgrade the data
                 for statement in (
                     open(os.path.join(os.path.dirname(__file__), "_albion_v1_to_v2.sql"))
@@ -286,33 +738,42 @@ class Project(object):
                 ):
                     cur.execute(statement.replace("$SRID", str(srid)))
 
-            include_elementary_volume = open(
-                os.path.join(
-                    os.path.dirname(__file__), "elementary_volume", "__init__.py"
-                )
-            ).read()
+            # here goes future upgrades
+            cur.execute("select version from _albion.metadata")
+            version, = cur.fetchone()
+            if version == '2.0':
+                for statement in (
+                    open(os.path.join(os.path.dirname(__file__), "_albion_v2_to_v2_1.sql"))
+                    .read()
+                    .split("\n;\n")[:-1]
+                ):
+                    cur.execute(statement.replace("$SRID", str(srid)))
+
             for statement in (
                 open(os.path.join(os.path.dirname(__file__), "albion.sql"))
                 .read()
                 .split("\n;\n")[:-1]
             ):
-                cur.execute(
-                    statement.replace("$SRID", str(srid)).replace(
-                        "$INCLUDE_ELEMENTARY_VOLUME", include_elementary_volume
-                    )
-                )
+                cur.execute(statement.replace("$SRID", str(srid)))
+            install_runtime(cur)
+            # volumes built by the previous version of the code
+            cur.execute("delete from _albion.volume_cache")
 
             con.commit()
 
             cur.execute("select name, fields_definition from albion.layer")
             tables = [{'NAME': r[0], 'FIELDS_DEFINITION': r[1]} for r in cur.fetchall()]
 
+        # notification triggers were recreated with the schema
+        self.invalidate_metadata()
+
         for table in tables:
             table['SRID'] = str(srid)
             self.add_table(table, view_only=True)
 
         self.vacuum()
 
+    @profiled
     def export_sections_obj(self, graph, filename):
 
         with self.connect() as con:
@@ -336,6 +797,7 @@ class Project(object):
             )
             open(filename, "w").write(cur.fetchone()[0])
 
+    @profiled
     def export_sections_dxf(self, graph, filename):
 
         with self.connect() as con:
@@ -368,12 +830,12 @@ class Project(object):
             drawing.save()
 
 
-    def __srid(self):
-        with self.connect() as con:
-            cur = con.cursor()
-            cur.execute("select srid from albion.metadata")
-            srid, = cur.fetchone()
-        return srid
+    def __metadata(self):
+        values = self.__metadata_cache().values()
+        return {k: v for k, v in values.items() if k != 'layers'}
+
+    def __layers(self):
+        return [name for name, fields_definition in self.__metadata_cache().values()['layers']]
 
     def __getattr__(self, name):
         if name == "has_hole":
@@ -393,7 +855,11 @@ class Project(object):
         elif name == "name":
             return self.__name
         elif name == "srid":
-            return self.__srid()
+            return self.__metadata_cache().values()['srid']
+        elif name == "metadata":
+            return self.__metadata()
+        elif name == "layers":
+            return self.__layers()
         else:
             raise AttributeError(name)
 
@@ -441,117 +907,51 @@ class Project(object):
 
 
 
-    def import_data(self, dir_, progress=None):
+    @profiled
+    def import_data(self, dir_, progress=None, workers=4):
+        """import collars, deviations and interval tables from the csv files
+        of dir_ (semicolon separated, with header)
 
+        files are streamed from the client, collars and deviations are loaded
+        first, the interval tables are then loaded concurrently on workers
+        connections
+        """
         progress = progress if progress is not None else DummyProgress()
         with self.connect() as con:
             cur = con.cursor()
-
-
-            cur.execute(
-                """
-                copy _albion.hole(id, x, y, z, depth_, date_, comments) from '{}' delimiter ';' csv header
-                """.format(
-                    find_in_dir(dir_, "collar")
-                )
-            )
+            copy_csv(cur, "_albion.hole(id, x, y, z, depth_, date_, comments)",
+                find_in_dir(dir_, "collar"))
 
             progress.setPercent(5)
 
-            cur.execute(
-                """
-                copy _albion.deviation(hole_id, from_, dip, azimuth) from '{}' delimiter ';' csv header
-                """.format(
-                    find_in_dir(dir_, "devia")
-                )
-            )
-
-            progress.setPercent(10)
-
-            cur.execute(
-                """
-                update _albion.hole set geom = albion.hole_geom(id)
-                """
-            )
-
-            progress.setPercent(15)
-
+            # hole geometries are computed by the insert triggers,
+            # all holes at once for each copy
+            copy_csv(cur, "_albion.deviation(hole_id, from_, dip, azimuth)",
+                find_in_dir(dir_, "devia"))
 
-            if find_in_dir(dir_, "avp"):
-                cur.execute(
-                    """
-                    copy _albion.radiometry(hole_id, from_, to_, gamma) from '{}' delimiter ';' csv header
-                    """.format(
-                        find_in_dir(dir_, "avp")
-                    )
-                )
-
-            progress.setPercent(20)
-
-            if find_in_dir(dir_, "formation"):
-                cur.execute(
-                    """
-                    copy _albion.formation(hole_id, from_, to_, code, comments) from '{}' delimiter ';' csv header
-                    """.format(
-                        find_in_dir(dir_, "formation")
-                    )
-                )
-
-            progress.setPercent(25)
-
-            if find_in_dir(dir_, "lithology"):
-                cur.execute(
-                    """
-                    copy _albion.lithology(hole_id, from_, to_, code, comments) from '{}' delimiter ';' csv header
-                    """.format(
-                        find_in_dir(dir_, "lithology")
-                    )
-                )
-
-            progress.setPercent(30)
-
-            if find_in_dir(dir_, "facies"):
-                cur.execute(
-                    """
-                    copy _albion.facies(hole_id, from_, to_, code, comments) from '{}' delimiter ';' csv header
-                    """.format(
-                        find_in_dir(dir_, "facies")
-                    )
-                )
+            con.commit()
 
-            progress.setPercent(35)
+        progress.setPercent(15)
 
-            if find_in_dir(dir_, "resi"):
-                cur.execute(
-                    """
-                    copy _albion.resistivity(hole_id, from_, to_, rho) from '{}' delimiter ';' csv header
-                    """.format(
-                        find_in_dir(dir_, "resi")
-                    )
-                )
-
-            progress.setPercent(40)
-
-            if find_in_dir(dir_, "chemical"):
-                cur.execute(
-                    """
-                    copy _albion.chemical(hole_id, from_, to_, num_sample,
-                        element, thickness, gt, grade, equi, comments)
-                    from '{}' delimiter ';' csv header
-                    """.format(
-                        find_in_dir(dir_, "chemical")
-                    )
-                )
-
-            progress.setPercent(45)
+        files = [(table, find_in_dir(dir_, name)) for name, table in INTERVAL_TABLES
+            if find_in_dir(dir_, name)]
 
+        def load(table, filename):
+            with self.connect() as con:
+                copy_csv(con.cursor(), table, filename)
+                con.commit()
 
-            progress.setPercent(100)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = [executor.submit(self.__bind(load), table, filename) for table, filename in files]
+            for done, future in enumerate(as_completed(futures)):
+                future.result()
+                progress.setPercent(15 + 30*(done + 1)/len(futures))
 
-            con.commit()
+        progress.setPercent(100)
 
         self.vacuum()
 
+    @profiled
     def triangulate(self, createAlbionRaster):
         with self.connect() as con:
             cur = con.cursor()
@@ -566,6 +966,7 @@ class Project(object):
                 cur.execute("REFRESH MATERIALIZED VIEW _albion.cells")
             con.commit()
 
+    @profiled
     def create_sections(self):
         with self.connect() as con:
             cur = con.cursor()
@@ -575,8 +976,7 @@ class Project(object):
     def execute_script(self, file_):
         with self.connect() as con:
             cur = con.cursor()
-            cur.execute("select srid from albion.metadata")
-            srid, = cur.fetchone()
+            srid = self.srid
             for statement in open(file_).read().split("\n;\n")[:-1]:
                 cur.execute(statement.replace("$SRID", str(srid)))
             con.commit()
@@ -734,31 +1134,45 @@ class Project(object):
             cur.execute("select id from albion.graph")
             return [id_ for id_, in cur.fetchall()]
 
-    def compute_mineralization(self, cutoff, ci, oc):
+    @profiled
+    def compute_mineralization(self, cutoff, ci, oc, workers=None):
+        self.compute_mineralization_sweep([cutoff], ci, oc, workers)
+
+    @profiled
+    def compute_mineralization_sweep(self, cutoffs, ci, oc, workers=None):
+        """mineralization for several cutoffs, replaces the existing levels
+
+        the segmentation runs in the database or, if workers is specified, on
+        the client in a pool of workers processes (one per cpu if 0)
+        """
         with self.connect() as con:
             cur = con.cursor()
+            # the data table is used directly to fire the section cache
+            # triggers once for all intervals of all cutoffs
             cur.execute(
-                "delete from albion.mineralization where level_={}".format(cutoff)
+                "delete from _albion.mineralization where level_ = any(%s::real[])",
+                (list(cutoffs),)
             )
-            cur.execute(
-                """
-                insert into albion.mineralization(hole_id, level_, from_, to_, oc, accu, grade)
-                select hole_id, (t.r).level_, (t.r).from_, (t.r).to_, (t.r).oc, (t.r).accu, (t.r).grade
-                from (
-                select hole_id, albion.segmentation(
-                    array_agg(gamma order by from_),array_agg(from_ order by from_),  array_agg(to_ order by from_),
-                    {ci}, {oc}, {cutoff}) as r
-                from albion.radiometry
-                group by hole_id
-                ) as t
-                """.format(
-                    oc=oc, ci=ci, cutoff=cutoff
+            if workers is not None:
+                copy_mineralization(con, cutoffs, ci, oc, workers or os.cpu_count() or 1)
+            else:
+                cur.execute(
+                    """
+                    insert into _albion.mineralization(hole_id, level_, from_, to_, oc, accu, grade)
+                    select hole_id, (t.r).level_, (t.r).from_, (t.r).to_, (t.r).oc, (t.r).accu, (t.r).grade
+                    from (
+                    select hole_id, albion.segmentation_sweep(
+                        array_agg(gamma order by from_),array_agg(from_ order by from_),  array_agg(to_ order by from_),
+                        %s, %s, %s::real[]) as r
+                    from albion.radiometry
+                    group by hole_id
+                    ) as t
+                    """,
+                    (ci, oc, list(cutoffs))
                 )
-            )
-            cur.execute("refresh materialized view albion.mineralization_section_geom_cache")
             con.commit()
 
-
+    @profiled
     def export_obj(self, graph_id, filename):
         with self.connect() as con:
             cur = con.cursor()
@@ -775,6 +1189,7 @@ class Project(object):
             )
             open(filename, "w").write(cur.fetchone()[0])
 
+    @profiled
     def export_elementary_volume_obj(self, graph_id, cell_ids, outdir, closed_only=False):
         with self.connect() as con:
             cur = con.cursor()
@@ -798,6 +1213,7 @@ class Project(object):
                 open(path, "w").write(obj[0])
 
 
+    @profiled
     def export_elementary_volume_dxf(self, graph_id, cell_ids, outdir, closed_only=False):
         with self.connect() as con:
             cur = con.cursor()
@@ -845,6 +1261,7 @@ class Project(object):
             )
             open(filename, "w").write(cur.fetchone()[0])
 
+    @profiled
     def export_dxf(self, graph_id, filename):
         with self.connect() as con:
             cur = con.cursor()
@@ -868,6 +1285,7 @@ class Project(object):
                 )
             drawing.save()
 
+    @profiled
     def export_holes_vtk(self, filename):
         with self.connect() as con:
             cur = con.cursor()
@@ -879,6 +1297,7 @@ class Project(object):
             )
             open(filename, "w").write(cur.fetchone()[0])
 
+    @profiled
     def export_holes_dxf(self, filename):
         with self.connect() as con:
             cur = con.cursor()
@@ -897,6 +1316,7 @@ class Project(object):
                 )
             drawing.save()
 
+    @profiled
     def export_layer_vtk(self, table, filename):
         with self.connect() as con:
             cur = con.cursor()
@@ -908,6 +1328,7 @@ class Project(object):
             )
             open(filename, "w").write(cur.fetchone()[0])
 
+    @profiled
     def export_layer_dxf(self, table, filename):
         with self.connect() as con:
             cur = con.cursor()
@@ -926,29 +1347,111 @@ class Project(object):
                 )
             drawing.save()
 
-    def create_volumes(self, graph_id):
+    @profiled
+    def create_volumes(self, graph_id, workers=1, batch_size=100, progress=None):
+        """build the elementary volumes of the graph
+
+        cells are split in batches of batch_size cells, with workers > 1 the
+        batches are computed concurrently, each on its own database
+        connection (i.e. its own backend running albion.elementary_volumes),
+        workers are limited to the project pool size
+
+        all cells are marked stale before the build and each batch clears
+        its cells, so that update_volumes completes an interrupted build
+
+        cells whose inputs did not change since a previous build are read
+        from the volume cache instead of being recomputed
+        """
+        progress = progress if progress is not None else DummyProgress()
         with self.connect() as con:
             cur = con.cursor()
+            cur.execute("delete from albion.volume where graph_id=%s", (graph_id,))
             cur.execute(
                 """
-                delete from albion.volume where graph_id='{}'
-                """.format(
-                    graph_id
-                )
-            )
+                insert into _albion.stale_volume(graph_id, cell_id)
+                select %s, id from _albion.cell
+                on conflict do nothing
+                """, (graph_id,))
+            cur.execute("select id from _albion.cell order by id")
+            cells = [id_ for id_, in cur.fetchall()]
+            con.commit()
+
+        batches = [cells[i:i+batch_size] for i in range(0, len(cells), batch_size)]
+
+        def build(batch):
+            with self.connect() as con:
+                cur = con.cursor()
+                cur.execute(
+                    "delete from _albion.stale_volume where graph_id=%s and cell_id = any(%s)",
+                    (graph_id, batch))
+                self.__insert_volumes(cur, graph_id, batch)
+                con.commit()
+
+        workers = min(workers, self.pool_size)
+        if workers <= 1:
+            for done, batch in enumerate(batches):
+                build(batch)
+                progress.setPercent(100*(done + 1)/len(batches))
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self.__bind(build), batch) for batch in batches]
+                for done, future in enumerate(as_completed(futures)):
+                    future.result()
+                    progress.setPercent(100*(done + 1)/len(batches))
+
+        with self.connect() as con:
+            cur = con.cursor()
+            cur.execute("select albion.evict_volume_cache()")
+            con.commit()
+        progress.setPercent(100)
+
+    @profiled
+    def update_volumes(self, graph_id):
+        """rebuild only the volumes of the cells marked as stale by
+        node, edge and end node edits since the last build"""
+        with self.connect() as con:
+            cur = con.cursor()
             cur.execute(
                 """
-                insert into _albion.volume(graph_id, cell_id, triangulation, face1, face2, face3)
-                select graph_id, cell_id, geom, face1, face2, face3
-                from albion.dynamic_volume
-                where graph_id='{}'
-                and geom is not null --not st_isempty(geom)
-                """.format(
-                    graph_id
-                )
-            )
+                delete from _albion.stale_volume where graph_id=%s returning cell_id
+                """, (graph_id,))
+            cells = [id_ for id_, in cur.fetchall()]
+            if cells:
+                cur.execute(
+                    """
+                    delete from albion.volume where graph_id=%s and cell_id = any(%s)
+                    """, (graph_id, cells))
+                self.__insert_volumes(cur, graph_id, cells)
+                cur.execute("select albion.evict_volume_cache()")
             con.commit()
 
+    def purge_volume_cache(self):
+        """remove all memoized elementary volumes"""
+        with self.connect() as con:
+            cur = con.cursor()
+            cur.execute("delete from _albion.volume_cache")
+            con.commit()
+
+    def __insert_volumes(self, cur, graph_id, cell_ids=None):
+        cur.execute(
+            """
+            insert into _albion.volume(graph_id, cell_id, triangulation, face1, face2, face3)
+            select v.graph_id, v.cell_id, t.geom, t.face1, t.face2, t.face3
+            from albion.volume_input as v
+            cross join albion.metadata as m
+            join lateral albion.cached_elementary_volumes(v.cell_id, v.graph_id, st_force3d(v.geom), v.holes, v.starts, v.ends,
+                v.hole_ids, v.node_ids, v.node_geoms, v.end_ids, v.end_geoms, v.end_holes,
+                m.end_node_relative_distance, m.end_node_relative_thickness) as t on true
+            where v.graph_id=%s
+            {}
+            and t.geom is not null --not st_isempty(geom)
+            """.format(
+                "and v.cell_id = any(%s)" if cell_ids is not None else ""
+            ),
+            (graph_id, list(cell_ids)) if cell_ids is not None else (graph_id,)
+        )
+
+    @profiled
     def create_terminations(self, graph_id):
         with self.connect() as con:
             cur = con.cursor()
@@ -971,6 +1474,7 @@ class Project(object):
             )
             con.commit()
 
+    @profiled
     def export(self, filename):
         export_db(self.name, filename)
 
@@ -1003,8 +1507,7 @@ class Project(object):
                 [float(c) for c in ext[1].split()],
             ]
 
-            cur.execute("select srid from albion.metadata")
-            srid, = cur.fetchone()
+            srid = self.srid
             cur.execute(
                 """
                 insert into albion.section(id, anchor, scale)
@@ -1036,18 +1539,20 @@ class Project(object):
             con.commit()
 
     def refresh_section_geom(self, table):
-        with self.connect() as con:
-            cur = con.cursor()
-            cur.execute("select count(1) from albion.layer where name='{}'".format(table))
-            if cur.fetchone()[0]:
-                cur.execute("refresh materialized view albion.{}_section_geom_cache".format(table))
+        """recompute the whole section cache of the layer, it is otherwise
+        maintained by triggers"""
+        if table in self.layers:
+            with self.connect() as con:
+                cur = con.cursor()
+                cur.execute("""
+                    select albion.{}_section_geom_cache_refresh(array(select id from _albion.section), null, null)
+                    """.format(table))
                 con.commit()
 
     def closest_hole_id(self, x, y):
         with self.connect() as con:
             cur = con.cursor()
-            cur.execute("select srid from albion.metadata")
-            srid, = cur.fetchone()
+            srid = self.srid
             cur.execute(
                 """
                 select id from albion.hole
@@ -1075,8 +1580,7 @@ class Project(object):
     def add_named_section(self, section_id, geom):
         with self.connect() as con:
             cur = con.cursor()
-            cur.execute("select srid from albion.metadata")
-            srid, = cur.fetchone()
+            srid = self.srid
             cur.execute(
                 """
                 insert into albion.named_section(geom, section)
@@ -1090,8 +1594,7 @@ class Project(object):
     def set_section_geom(self, section_id, geom):
         with self.connect() as con:
             cur = con.cursor()
-            cur.execute("select srid from albion.metadata")
-            srid, = cur.fetchone()
+            srid = self.srid
             cur.execute(
                 """
                 update albion.section set geom=st_multi(ST_SetSRID('{wkb_hex}'::geometry, {srid})) where id='{id_}'
@@ -1102,21 +1605,33 @@ class Project(object):
             con.commit()
 
     def add_to_graph_node(self, graph, features):
+        "nodes of graph for the intervals (dict with hole_id, from_ and to_) of features"
         with self.connect() as con:
             cur = con.cursor()
-            cur.executemany(
+            # intervals are copied in a staging table and inserted at once
+            cur.execute(
+                "create temporary table node_staging(hole_id varchar, from_ real, to_ real) on commit drop"
+            )
+            intervals = io.StringIO()
+            csv.writer(intervals).writerows(
+                (f['hole_id'], f['from_'], f['to_']) for f in features)
+            intervals.seek(0)
+            cur.copy_expert("copy node_staging(hole_id, from_, to_) from stdin csv", intervals)
+            cur.execute(
                 """
-                insert into albion.node(from_, to_, hole_id, graph_id) values(%s, %s, %s, %s)
+                select albion.add_nodes(%s, array_agg(hole_id), array_agg(from_), array_agg(to_))
+                from node_staging
                 """,
-                [(f['from_'], f['to_'], f['hole_id'], graph) for f in features])
+                (graph,))
 
     def accept_possible_edge(self, graph):
         with self.connect() as con:
             cur = con.cursor()
+            cur.execute("select albion.refresh_possible_edge(%s)", (graph,))
             cur.execute(
                 """
                 insert into albion.edge(start_, end_, graph_id, geom)
-                select start_, end_, graph_id, geom from albion.possible_edge
+                select start_, end_, graph_id, geom from albion.possible_edge_candidate
                 where graph_id=%s
                 """,
                 (graph,))
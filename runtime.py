@@ -0,0 +1,224 @@
+# coding = utf-8
+"""
+server side runtime of albion, the python code of the plpython functions
+
+the plpython functions of albion.sql are dispatchers to the functions of this
+module: albion.load_runtime() loads it, with elementary_volume, from the sources
+stored in albion.runtime_module once per database session and keeps it in GD,
+each function then keeps a reference in its SD.
+
+the module can also be imported outside of the database (tests, benchmarks),
+it does not use plpy.
+
+geometry arguments are EWKB, either binary or hex encoded.
+"""
+
+import numpy
+from numpy import array, dot, cross
+from numpy.linalg import norm
+from shapely.geometry import LineString, MultiLineString, Polygon, MultiPolygon
+from shapely import geos
+from fourmy import tessellate
+
+try:
+    from .elementary_volume import elementary_volumes, to_obj, to_vtk, loads
+    from .segmentation import segmentation, segmentation_sweep
+except ImportError:
+    # in the database, modules are loaded without package
+    from albion_elementary_volume import elementary_volumes, to_obj, to_vtk, loads
+    from albion_segmentation import segmentation, segmentation_sweep
+
+geos.WKBWriter.defaults['include_srid'] = True
+
+def tesselate_wkb(polygon_, lines_, points_):
+    polygon = loads(polygon_)
+    lines = loads(lines_) if lines_ else None
+    points = loads(points_) if points_ else None
+    result = tessellate(polygon, lines, points)
+
+    geos.lgeos.GEOSSetSRID(result._geom, geos.lgeos.GEOSGetSRID(polygon._geom))
+    return result.wkb
+
+def cos_angle(anchor_, start_, end_):
+    anchor = loads(anchor_)
+    start = loads(start_)
+    end = loads(end_)
+    dir = numpy.array(anchor.coords[-1]) - numpy.array(anchor.coords[0])
+    dir /= norm(dir)
+    seg = numpy.array(end.coords[0]) - numpy.array(start.coords[0])
+    seg /= norm(seg)
+
+    return dir.dot(seg)
+
+def from_section_wkb(geom_, anchor_, section_, z_scale_):
+    if geom_ is None:
+        return None
+    g = loads(geom_)
+    a = loads(anchor_)
+    s = loads(section_)
+
+    orig = array(a.coords[0])
+    dir_ = array(a.coords[-1]) - orig
+    dir_ /= norm(dir_)
+    nrml_ = array([-dir_[1] , dir_[0]])
+
+    if g.type == 'LineString':
+        xy = array(g.coords)
+        points = []
+        for p in xy:
+            z = dot(nrml_, p-orig)/z_scale_
+            big_distance = 100*z_scale_*z
+            # intersection between section geom and line extending from point in the normal direction
+            x, y = s.intersection(LineString([p-nrml_*big_distance, p+nrml_*big_distance])).coords[0]
+            points.append((x,y,z))
+        result = LineString(points)
+    else:
+        assert(False)
+    geos.lgeos.GEOSSetSRID(result._geom, geos.lgeos.GEOSGetSRID(g._geom))
+    return result.wkb
+
+def volume_of_geom_wkb(multipoly):
+    m = loads(multipoly)
+    volume = 0
+    for p in m:
+        r = p.exterior.coords
+        v210 = r[2][0]*r[1][1]*r[0][2];
+        v120 = r[1][0]*r[2][1]*r[0][2];
+        v201 = r[2][0]*r[0][1]*r[1][2];
+        v021 = r[0][0]*r[2][1]*r[1][2];
+        v102 = r[1][0]*r[0][1]*r[2][2];
+        v012 = r[0][0]*r[1][1]*r[2][2];
+        volume += (1./6.)*(-v210 + v120 + v201 - v021 - v102 + v012)
+    return volume
+
+def is_closed_volume_wkb(multipoly):
+    m = loads(multipoly)
+
+    edges = set()
+    for p in m:
+        for s, e in zip(p.exterior.coords[:-1], p.exterior.coords[1:]):
+            if (e, s) in edges:
+                edges.remove((e, s))
+            else:
+                edges.add((s, e))
+    return len(edges)==0
+
+def mesh_boundarie_wkb(multipoly):
+    m = loads(multipoly)
+
+    edges = set()
+    for p in m:
+        for s, e in zip(p.exterior.coords[:-1], p.exterior.coords[1:]):
+            if (e, s) in edges:
+                edges.remove((e, s))
+            else:
+                edges.add((s, e))
+    result = MultiLineString(list(edges))
+    geos.lgeos.GEOSSetSRID(result._geom, geos.lgeos.GEOSGetSRID(m._geom))
+    return result.wkb
+
+def volume_union_wkb(multipoly):
+    if multipoly is None:
+        return None
+
+    m = loads(multipoly)
+
+    node_map = {}
+    triangles = []
+    vtx = []
+    for p in m:
+        t = []
+        for v in p.exterior.coords[:-1]:
+            v = (round(v[0], 6), round(v[1], 6), round(v[2], 6))
+            if v not in node_map:
+                node_map[v] = len(vtx)
+                vtx.append(v)
+            t.append(node_map[v])
+        triangles.append(t)
+
+    exterior = set()
+    for t in triangles:
+        rt = tuple(reversed(t))
+        if rt in exterior:
+            exterior.remove(rt)
+        elif (rt[1:]+rt[:1]) in exterior:
+            exterior.remove(rt[1:]+rt[:1])
+        elif (rt[2:]+rt[:2]) in exterior:
+            exterior.remove(rt[2:]+rt[:2])
+        else:
+            exterior.add(tuple(t))
+
+    result = MultiPolygon([Polygon([vtx[p] for p in t]) for t in exterior])
+
+    ## check for pairs of triangles with centroid less than 1cm appart
+    #suspects = []
+    #r = list(result)
+    #for i, p in enumerate(r):
+    #    for q in r[i+1:]:
+    #        if p.centroid.distance(q.centroid) < .01:
+    #            suspects.append(p)
+    #            suspects.append(q)
+    #rv = plpy.execute("SELECT albion.to_obj('{}'::geometry) as obj".format(MultiPolygon(suspects).wkb))
+    #open("/tmp/unclosed_suspects.obj", 'w').write(rv[0]['obj'])
+
+
+    ## check generated volume is closed
+    #edges = set()
+    #for p in result:
+    #    for s, e in zip(p.exterior.coords[:-1], p.exterior.coords[1:]):
+    #        if (e, s) in edges:
+    #            edges.remove((e, s))
+    #        else:
+    #            edges.add((s, e))
+    #if (len(edges)):
+    #    rv = plpy.execute("SELECT albion.to_obj('{}'::geometry) as obj".format(result.wkb))
+    #    open("/tmp/unclosed_volume.obj", 'w').write(rv[0]['obj'])
+
+    #    rv = plpy.execute("SELECT albion.to_vtk('{}'::geometry) as vtk".format(MultiLineString([LineString(e) for e in edges]).wkt))
+    #    open("/tmp/unclosed_border.vtk", 'w').write(rv[0]['vtk'])
+    #    plpy.error("elementary volume is not closed", edges)
+    #assert(len(edges)==0)
+
+    geos.lgeos.GEOSSetSRID(result._geom, geos.lgeos.GEOSGetSRID(m._geom))
+    return result.wkb
+
+def to_obj_wkb(multipoly):
+    return to_obj(multipoly)
+
+def to_vtk_wkb(multiline):
+    return to_vtk(multiline)
+
+def end_node_geom_wkb(node_geom_, collar_geom_, rel_distance=.3, rel_thickness=.3, nx=None, ny=None, nz=None):
+    node_geom = loads(node_geom_)
+    collar_geom = loads(collar_geom_)
+
+    node_coords = array(node_geom.coords)
+    thickness = rel_thickness*abs(node_coords[0][2] - node_coords[1][2])
+    center = .5*(node_coords[0] + node_coords[1])
+    dir = array(collar_geom.coords[0]) - center
+    dir[2] = 0
+    dir *= rel_distance
+    dir = cross(array([nx, ny, nz]), cross(dir, array([0,0,1])))
+    top = center + dir + array([0,0,.5*thickness])
+    bottom = center + dir - array([0,0,.5*thickness])
+    result = LineString([tuple(top), tuple(bottom)])
+
+    geos.lgeos.GEOSSetSRID(result._geom, geos.lgeos.GEOSGetSRID(node_geom._geom))
+    return result.wkb
+
+def triangle_intersection_wkb(t1_, t2_):
+    t1 = loads(t1_)
+    t2 = loads(t2_)
+
+    t1s = set((tuple(t.exterior.coords[0:3]) for t in t1))
+    t2s = set((tuple(reversed(t.exterior.coords[0:3])) for t in t2))
+
+    result = MultiPolygon([ Polygon(t) for t in t1s.intersection(t2s)])
+    if not len(result):
+        return None
+    geos.lgeos.GEOSSetSRID(result._geom, geos.lgeos.GEOSGetSRID(t1._geom))
+    return result.wkb
+
+def elementary_volumes_wkb(holes_, starts_, ends_, hole_ids_, node_ids_, nodes_, end_ids_, end_geoms_, end_holes_, srid_, end_node_relative_distance, end_node_relative_thickness):
+    for g, f1, f2, f3 in elementary_volumes(holes_, starts_, ends_, hole_ids_, node_ids_, nodes_, end_ids_, end_geoms_, end_holes_, srid_, end_node_relative_distance, end_node_relative_thickness, binary=True):
+        yield g, f1, f2, f3
@@ -0,0 +1,112 @@
+# coding = utf-8
+"""
+segmentation of gamma logs in ore and waste intervals
+
+this module only depends on numpy: it is loaded in the database by
+albion.load_runtime for albion.segmentation and albion.segmentation_sweep,
+and imported by the client side computation of Project.compute_mineralization
+"""
+
+import numpy
+from numpy.lib.stride_tricks import sliding_window_view
+
+def samples(radiometry_, from_, to_, measure_thickness=.1):
+    "gamma log expanded in samples of measure_thickness"
+    counts = numpy.round((numpy.asarray(to_, dtype=numpy.float64) - numpy.asarray(from_, dtype=numpy.float64))/measure_thickness)
+    return numpy.repeat(numpy.asarray(radiometry_, dtype=numpy.float32), numpy.maximum(counts, 0).astype(numpy.int64))
+
+def window_sums(v, n):
+    "sums of v[k:k+n], in the same summation order as numpy.sum"
+    if n <= 0:
+        return numpy.zeros(len(v) + 1)
+    return sliding_window_view(v, n).sum(axis=1)
+
+def segment(AVP, IC, OC, cut):
+    """(from, to) sample indices of the ore intervals of AVP, last one first
+
+    this is a port of R code, so indices start at 1: SV[i] is the best
+    accumulation of v (gamma minus cutoff) up to i with i in ore, SO[i] with
+    i in waste, SVP[i] and SOP[i] are the starts of the last ore and waste
+    intervals; ore intervals are at least OC samples, waste at least IC"""
+    N = len(AVP)+2*IC+OC-1
+
+    t = numpy.zeros((N+1,))
+    t[(IC+OC):(IC+OC+len(AVP))] = AVP
+    v = t - cut
+    v[0] = 0
+    # window sums of v ending at i are W[i-OC+1]
+    W = window_sums(v, OC).tolist()
+    v = v.tolist()
+
+    SV = [0.]*(N+1)
+    SO = [0.]*(N+1)
+    SVP = [0]*(N+1)
+    SOP = [0]*(N+1)
+
+    for i in range(OC, (IC+OC-1)+1):
+        SV[i] = W[i-OC+1]
+    SVP[IC+OC-1] = IC
+    SOP[IC+OC-1] = 1
+
+    for i in range(IC+OC, N+1):
+        sv1 = SV[i-1]+v[i]
+        sv2 = SO[i-OC]+W[i-OC+1]
+        SV[i] = max(sv1, sv2)
+        SVP[i] = SVP[i-1] if sv1 >= sv2 else i - OC + 1
+
+        so1 = SO[i-1]
+        so2 = SV[i-IC]
+        SO[i] = max(so1, so2)
+        SOP[i] = SOP[i-1] if so1 > so2 else i - IC + 1
+
+    intervals = []
+    idx = N
+    while SOP[idx] > 1:
+        to = SOP[idx] - 1
+        from_ = SVP[to]
+        intervals.append((from_ - (OC+IC), to - (OC+IC-1)))
+        idx = from_ - 1
+    return intervals
+
+def ore_intervals(AVP, first_from_, IC, OC, cut, measure_thickness=.1):
+    "(cutoff, from, to, thickness, accumulation, grade) of the ore intervals of AVP"
+    result = []
+    for ifrom_, ito_ in segment(AVP, IC, OC, cut):
+        if ifrom_ >= 0 and ito_ > 0:
+            accu = numpy.sum(AVP[ifrom_:ito_])
+            oc = numpy.float64((ito_ - ifrom_)*measure_thickness)
+            grade = accu/oc
+            result.append((cut, ifrom_*measure_thickness + first_from_, ito_*measure_thickness + first_from_, oc, accu, grade))
+    return result
+
+def segmentation(radiometry_, from_, to_, ic_, oc_, cut_, measure_thickness=.1):
+    """ore intervals of a gamma log for a cutoff grade cut_, a minimal ore
+    thickness oc_ and a minimal waste thickness ic_, as a list of
+    (cutoff, from, to, thickness, accumulation, grade)"""
+    IC = int(round(ic_/measure_thickness)) # nb echantillon, intercalaire stérile minimale
+    OC = int(round(oc_/measure_thickness)) # nb echantillon, ouverture chantier (épaisseur mini)
+    return ore_intervals(samples(radiometry_, from_, to_, measure_thickness), from_[0], IC, OC, cut_, measure_thickness)
+
+def segmentation_sweep(radiometry_, from_, to_, ic_, oc_, cuts_, measure_thickness=.1):
+    "segmentation for each cutoff of cuts_, the log is expanded in samples once"
+    IC = int(round(ic_/measure_thickness))
+    OC = int(round(oc_/measure_thickness))
+    AVP = samples(radiometry_, from_, to_, measure_thickness)
+    result = []
+    for cut in cuts_:
+        result += ore_intervals(AVP, from_[0], IC, OC, cut, measure_thickness)
+    return result
+
+def segmentation_holes(holes, ic_, oc_, cuts_, measure_thickness=.1):
+    """(hole_id, cutoff, from, to, thickness, accumulation, grade) of the ore
+    intervals of a batch of (hole_id, gamma, from, to) logs, to run the
+    segmentation outside of the database; numbers are rounded to reals as
+    they are when passed to albion.segmentation_sweep"""
+    def real(x):
+        return numpy.asarray(x, dtype=numpy.float32).tolist()
+    ic_, oc_, cuts_, measure_thickness = real(ic_), real(oc_), real(cuts_), real(measure_thickness)
+    result = []
+    for hole_id, radiometry_, from_, to_ in holes:
+        result += [(hole_id,) + r for r in segmentation_sweep(
+            real(radiometry_), real(from_), real(to_), ic_, oc_, cuts_, measure_thickness)]
+    return result
@@ -0,0 +1,33 @@
+# coding = utf-8
+
+if __name__ == "__main__":
+    from albion.desurvey import desurvey, BALANCED_TANGENTIAL, MINIMUM_CURVATURE
+    from numpy import allclose, radians, sin, cos, linspace
+    from numpy.linalg import norm
+
+    # vertical hole without deviation, inclined straight hole, hole following
+    # an arc of circle of radius 100 in the xz plane
+    angles = linspace(0, 60, 7)
+    md = radians(angles)*100
+    res = desurvey(
+        ['v', 'i', 'c'], [0, 100, 200], [0, 0, 0], [10, 10, 10], [50, 80, md[-1]],
+        ['i', 'i'] + ['c']*(len(md)-1) + ['v'],
+        [40, 20] + list(md[1:]) + [10], [-60, -60] + list(angles[1:] - 90) + [0], [90, 90] + [90]*(len(md)-1) + [0])
+
+    assert res[0][0] == 'v' and allclose(res[0][1], [[0, 0, 10], [0, 0, -40]])
+
+    # vertical at the collar, stations out of order, extended to 80m
+    i = res[1][1]
+    assert len(i) == 4
+    assert allclose(norm(i[1:] - i[:-1], axis=1).sum(), 80)
+    assert allclose(i[1], [100 + 10*sin(radians(30)), 0, 10 - 10*(1 + cos(radians(30)))])
+
+    for method, tolerance in ((BALANCED_TANGENTIAL, 1.), (MINIMUM_CURVATURE, 1e-9)):
+        c = dict(desurvey(['c'], [200], [0], [10], [50], ['c']*(len(md)-1),
+            md[1:], angles[1:] - 90, [90]*(len(md)-1), method))['c']
+        arc = [[200 + 100*(1 - cos(a)), 0, 10 - 100*sin(a)] for a in radians(angles)]
+        # the hole is vertical at the collar, like the arc
+        error = abs(c - arc).max()
+        print(method, 'max error on arc', error)
+        assert error < tolerance
+    print('ok')
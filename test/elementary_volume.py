@@ -0,0 +1,31 @@
+# coding = utf-8
+
+def read_input(filename):
+    "read a debug input file as written by albion.elementary_volumes"
+    with open(filename) as f:
+        lines = [f.readline().rstrip() for i in range(12)]
+    return [l.split() for l in lines[3:]]
+
+if __name__ == "__main__":
+    from albion.elementary_volume import elementary_volumes
+    from shapely import wkb
+    import os
+    import glob
+
+    def triangles(wkb_hex):
+        if wkb_hex.startswith('SRID'):
+            return []
+        return sorted(tuple(tuple(round(c, 6) for c in x) for x in p.exterior.coords)
+            for p in wkb.loads(bytes.fromhex(wkb_hex)))
+
+    data_dir = os.path.join(os.path.dirname(__file__), '..', 'elementary_volume', 'test_data')
+    for filename in sorted(glob.glob(os.path.join(data_dir, '*.txt'))):
+        args = read_input(filename)
+        pairwise = [[triangles(g) for g in r] for r in elementary_volumes(*args, vectorized=False)]
+        batch = [[triangles(g) for g in r] for r in elementary_volumes(*args, vectorized=True)]
+        assert(sorted(pairwise) == sorted(batch))
+        # binary EWKB in and out, as called by albion.elementary_volumes_wkb
+        binary = elementary_volumes(*args[:5], [bytes.fromhex(g) for g in args[5]],
+            args[6], [bytes.fromhex(g) for g in args[7]], args[8], binary=True)
+        assert([[triangles(g.hex()) for g in r] for r in binary] == batch)
+        print(os.path.basename(filename), len(batch), 'volumes')
@@ -0,0 +1,30 @@
+from __future__ import print_function
+# coding = utf-8
+
+# builds the volumes of the tutorial project (see tutorial.py) with more
+# workers than pooled connections and checks they match a serial build
+
+def volumes(project, graph):
+    with project.connect() as con:
+        cur = con.cursor()
+        cur.execute("""
+            SELECT cell_id FROM albion.volume WHERE graph_id=%s
+            """, (graph,))
+        return sorted(c for c, in cur.fetchall())
+
+
+if __name__ == "__main__":
+    from albion.project import Project
+
+    project = Project("tutorial_test", pool_size=2)
+    assert(project.pool_size == 2)
+
+    project.create_volumes('330', workers=6, batch_size=5)
+    parallel = volumes(project, '330')
+
+    project.create_volumes('330')
+    serial = volumes(project, '330')
+
+    print(len(parallel), "volumes")
+    assert(len(parallel))
+    assert(parallel == serial)
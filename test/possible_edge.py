@@ -0,0 +1,89 @@
+from __future__ import print_function
+# coding = utf-8
+
+# checks that the possible edges kept in albion.possible_edge_candidate stay
+# equal to albion.possible_edges when nodes are inserted, updated and deleted
+
+from albion.test.parent_graph import SQL
+
+GRAPHS = ('graph1', 'graph2')
+
+
+def check(cur, cached=True):
+    for graph in GRAPHS:
+        cur.execute("""
+            SELECT start_, end_ FROM albion.possible_edges(array[%s]::varchar[])
+            """, (graph,))
+        expected = sorted(cur.fetchall())
+        cur.execute("""
+            SELECT start_, end_ FROM albion.possible_edge WHERE graph_id=%s
+            """, (graph,))
+        assert(sorted(cur.fetchall()) == expected)
+        if cached:
+            cur.execute("""
+                SELECT start_, end_ FROM albion.possible_edge_candidate WHERE graph_id=%s
+                """, (graph,))
+            assert(sorted(cur.fetchall()) == expected)
+        print(graph, expected)
+
+
+def fresh_graphs(cur):
+    cur.execute("""
+        SELECT graph_id FROM albion.possible_edge_graph
+        """)
+    return sorted(g for g, in cur.fetchall())
+
+
+if __name__ == "__main__":
+    from albion.project import Project
+
+    project_name = "possible_edge_test"
+
+    if Project.exists(project_name):
+        Project.delete(project_name)
+
+    project = Project.create(project_name, 32632)
+
+    with project.connect() as con:
+        cur = con.cursor()
+        for sql in SQL.split("\n;\n")[:-1]:
+            cur.execute(sql)
+        cur.execute("""
+            UPDATE albion.metadata SET correlation_angle=1
+            """)
+        cur.execute("""
+            SELECT albion.refresh_possible_edge(id) FROM albion.graph
+            """)
+        assert(fresh_graphs(cur) == list(GRAPHS))
+        check(cur)
+
+        # inserted nodes are added to the up to date graphs
+        cur.execute("""
+            INSERT INTO albion.node(id, graph_id, hole_id, from_, to_, geom) VALUES
+                (7, 'graph1', 3, 50, 60, 'SRID=32632;LINESTRING(100 100 -50, 100 100 -60)'::geometry),
+                (8, 'graph1', 3, 70, 80, 'SRID=32632;LINESTRING(100 100 -70, 100 100 -80)'::geometry),
+                (9, 'graph2', 3, 50, 60, 'SRID=32632;LINESTRING(100 100 -50, 100 100 -60)'::geometry)
+            """)
+        assert(fresh_graphs(cur) == list(GRAPHS))
+        check(cur)
+
+        # updated nodes make their graph and its children stale
+        cur.execute("""
+            UPDATE albion.node SET from_=55, geom='SRID=32632;LINESTRING(100 0 -55, 100 0 -60)'::geometry
+            WHERE id='2'
+            """)
+        assert(fresh_graphs(cur) == [])
+        check(cur, cached=False)
+        cur.execute("""
+            SELECT albion.refresh_possible_edge(id) FROM albion.graph
+            """)
+        check(cur)
+
+        # deleted nodes take their possible edges with them
+        cur.execute("""
+            DELETE FROM albion.node WHERE id in ('3', '8')
+            """)
+        assert(fresh_graphs(cur) == list(GRAPHS))
+        check(cur)
+
+        con.commit()
@@ -0,0 +1,37 @@
+from __future__ import print_function
+# coding = utf-8
+
+# profiles the import of the nt dataset and checks that the COPY statements,
+# including those of the interval tables loaded by worker threads, are
+# attributed to import_data
+
+if __name__ == "__main__":
+    from albion.project import Project
+    import os
+    import tempfile
+    import zipfile
+
+    project_name = "profiling_test"
+
+    if Project.exists(project_name):
+        Project.delete(project_name)
+
+    project = Project.create(project_name, 32632)
+    zip_ref = zipfile.ZipFile(os.path.join(os.path.dirname(__file__), '..', 'data', 'nt.zip'), 'r')
+    zip_ref.extractall(tempfile.gettempdir())
+    zip_ref.close()
+    data_dir = os.path.join(tempfile.gettempdir(), 'nt')
+
+    project.start_profiling()
+    project.import_data(data_dir)
+    report = project.stop_profiling()
+
+    copies = {s["statement"].split()[1]: s for s in report["import_data"]["statements"]
+        if s["statement"].lower().startswith("copy ")}
+    for table, s in sorted(copies.items()):
+        print(table, s["count"], s["rows"], "{:.3f}s".format(s["time"]))
+
+    for table in ("_albion.hole(id,", "_albion.deviation(hole_id,", "_albion.formation(hole_id,"):
+        assert(table in copies)
+        assert(copies[table]["rows"] > 0)
+    assert(report["import_data"]["sql_time"] >= sum(s["time"] for s in copies.values()))
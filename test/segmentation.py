@@ -0,0 +1,146 @@
+# coding = utf-8
+import math
+import numpy
+
+# segmentation before the prefix sums and list based recurrence, the results
+# must stay the same to the bit
+def reference_segmentation(radiometry_, from_, to_, ic_, oc_, cut_, measure_thickness=.1):
+    IC = int(round(ic_/measure_thickness)) # nb echantillon, intercalaire stérile minimale
+    OC = int(round(oc_/measure_thickness)) # nb echantillon, ouverture chantier (épaisseur mini)
+    cut = cut_ # cutoff
+
+    first_from_ = from_[0]
+
+    AVP = []
+    for gamma, f, t in zip(radiometry_, from_, to_):
+        AVP += [gamma]*int(round((t-f)/measure_thickness))
+    AVP = numpy.array(AVP, dtype=numpy.float32)
+
+    N = len(AVP)+2*IC+OC-1
+
+    # Vecteurs de travail
+    # note: le code est un portage de R
+    # pour garder l indexation démarrant à 1
+    # on alloue N + 1 éléments, le premier élément est inutilisé
+    t = numpy.zeros((N+1,))
+    t [(IC+OC):(IC+OC+len(AVP))] = AVP
+    v = t - cut
+    v[0] = 0
+
+    SV  = numpy.zeros((N+1,))
+    SV1 = numpy.zeros((N+1,))
+    SV2 = numpy.zeros((N+1,))
+    SO  = numpy.zeros((N+1,))
+    SO1 = numpy.zeros((N+1,))
+    SO2 = numpy.zeros((N+1,))
+
+    SVP = numpy.zeros((N+1,), dtype=numpy.int32)
+    SOP = numpy.zeros((N+1,), dtype=numpy.int32)
+
+    # Initialisation
+    for i in range(OC, (IC+OC-1)+1):
+        SV[i] = numpy.sum(v[(i-OC+1):(i+1)])
+    SVP[IC+OC-1]=IC
+    SOP[IC+OC-1]=1
+
+    # Calcul des valeurs
+    for i in range(IC+OC, N+1):
+        # Calcul de SV
+        SV1[i] = SV[i-1]+v[i]
+        SV2[i] = SO[i-OC]+numpy.sum(v[(i-OC+1):(i+1)])
+        SV[i]  = max(SV1[i], SV2[i])
+
+        # Calcul de SO
+        SO1[i] = SO[i-1]
+        SO2[i] = SV[i-IC]
+        SO[i]  = max(SO1[i], SO2[i])
+        # Limites de chantiers
+        if SV1[i] >= SV2[i]:
+            SVP[i] = SVP[i-1]
+        else:
+            SVP[i] = i - OC + 1
+
+        if SO1[i] >  SO2[i]:
+            SOP[i] = SOP[i-1]
+        else:
+            SOP[i] = i - IC + 1
+
+    # Calcul des chantiers
+    class Rec(object):
+        def __init__(self, N, OC, IC):
+            self.nbr_max = 2*int(math.ceil(N/(OC+IC)))
+            self.from_ = numpy.zeros(self.nbr_max+1, dtype=numpy.int32)
+            self.to = numpy.zeros(self.nbr_max+1, dtype=numpy.int32)
+            self.code = numpy.zeros(self.nbr_max+1, dtype=numpy.int32)
+            self.accu = numpy.zeros(self.nbr_max+1, dtype=numpy.int32)
+            self.nbr = 0
+            self.idx = N
+
+    int_ = Rec(N, OC, IC)
+
+    while SOP[int_.idx] > 1:
+        # L intercalaire
+        int_.nbr += 1
+        int_.to[int_.nbr] = int_.idx
+        int_.from_[int_.nbr] = SOP[int_.to[int_.nbr]]
+        int_.code[int_.nbr] = 0
+        int_.accu[int_.nbr] = 0.0
+
+        # Le chantier
+        int_.nbr += 1
+        int_.to[int_.nbr] = int_.from_[int_.nbr-1]-1
+        int_.from_[int_.nbr] = SVP[int_.to[int_.nbr]]
+        int_.code[int_.nbr] = 1
+        int_.accu[int_.nbr] = numpy.sum(cut+v[int_.from_[int_.nbr]:int_.to[int_.nbr]+1])
+
+        # mise à jour l index
+        int_.idx = int_.from_[int_.nbr]-1
+
+    result = []
+    for ifrom_, ito_, c in zip(int_.from_, int_.to, int_.code):
+        ifrom_ -= OC+IC
+        ito_ -= OC+IC-1
+        if ifrom_ >= 0 and ito_ > 0 and c:
+            accu = numpy.sum(AVP[ifrom_:ito_])
+            oc = (ito_ - ifrom_)*measure_thickness
+            grade = accu/oc
+            result.append((cut, ifrom_*measure_thickness + first_from_, ito_*measure_thickness + first_from_, oc, accu, grade))
+
+    return result
+
+
+if __name__ == "__main__":
+    import random
+    from albion.segmentation import segmentation, segmentation_sweep, segmentation_holes
+
+    rnd = random.Random(0)
+    f32 = lambda x: float(numpy.float32(x))
+    nb = 0
+    for h in range(200):
+        # gamma logs of irregular intervals with mineralized levels, values are
+        # passed as postgres reals
+        from_, to_, gamma = [], [], []
+        depth = f32(rnd.uniform(0, 5))
+        for i in range(rnd.randint(1, 400)):
+            thickness = rnd.choice([.1, .1, .1, .2, .5, .05, 1.])
+            from_.append(depth)
+            depth = f32(depth + thickness)
+            to_.append(depth)
+            gamma.append(f32(rnd.expovariate(1./50) + (rnd.uniform(100, 3000) if rnd.random() < .1 else 0)))
+        for ic, oc, cut in ((1., 1., 10.), (1., 1., 500.), (.5, 2., 200.), (2., .3, 100.), (.1, .1, 50.), (3., 1.7, 1000.)):
+            ic, oc, cut = f32(ic), f32(oc), f32(cut)
+            expected = reference_segmentation(gamma, from_, to_, ic, oc, cut)
+            result = segmentation(gamma, from_, to_, ic, oc, cut)
+            assert len(result) == len(expected), (h, ic, oc, cut)
+            for r, e in zip(result, expected):
+                assert r == e, (h, r, e)
+            nb += len(result)
+        # the sweep gives the same intervals as one segmentation per cutoff
+        cuts = [f32(c) for c in (10., 50., 100., 500., 1000.)]
+        assert segmentation_sweep(gamma, from_, to_, 1., 1., cuts) \
+            == sum((segmentation(gamma, from_, to_, 1., 1., c) for c in cuts), [])
+        # client side batches round the numbers to reals like the database
+        assert segmentation_holes([('h', gamma, from_, to_)], 1., 1., cuts) \
+            == [('h',) + r for r in segmentation_sweep(gamma, from_, to_, 1., 1., cuts, f32(.1))]
+    print(nb, 'intervals')
+    print('ok')
@@ -99,6 +99,29 @@ if __name__ == "__main__":
 
         con.commit()
 
+    # bulk insertion gives the nodes the same geometry and parent as the
+    # albion.node trigger
+    for graph, parent, source in (('330', None, "albion.formation where code=330"), ('min1000', '330', "albion.mineralization")):
+        project.new_graph('add_nodes_check', parent)
+        with project.connect() as con:
+            cur = con.cursor()
+            cur.execute("""
+                select albion.add_nodes('add_nodes_check', array_agg(hole_id), array_agg(from_), array_agg(to_))
+                from {}
+                """.format(source))
+            cur.execute("""
+                select count(1),
+                    count(1) filter (where st_asewkb(a.geom) = st_asewkb(b.geom) and a.parent is not distinct from b.parent)
+                from _albion.node as a
+                join _albion.node as b on b.hole_id=a.hole_id and b.from_=a.from_ and b.to_=a.to_
+                where a.graph_id='add_nodes_check' and b.graph_id='{}'
+                """.format(graph))
+            total, same = cur.fetchone()
+            cur.execute("select count(1) from _albion.node where graph_id='add_nodes_check'")
+            assert(total > 0 and same == total and cur.fetchone()[0] == total)
+            cur.execute("delete from albion.graph where id='add_nodes_check'")
+            con.commit()
+
     project.accept_possible_edge('min1000')
     project.create_terminations('min1000')
     project.create_volumes('min1000')